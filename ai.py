@@ -0,0 +1,375 @@
+# ブロックを置く場所を自動で決めるAI (デモ画面や自動テストプレイ用)。
+# 盤面はBoardのビットマスク (行ごとの整数) だけで扱い、評価結果はZobristハッシュをキーにキャッシュする。
+import os
+import random
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from engine import (MAX_ROW, MAX_COL, WALL_MASK, FULL_ROW_MASK, Block, Game,
+                    ACTION_NONE, ACTION_LEFT, ACTION_RIGHT, ACTION_DOWN, ACTION_ROTATE_CW, ACTION_HOLD)
+
+# 盤面の評価の重み (高さの合計、消した行数、穴の数、でこぼこ)
+WEIGHT_HEIGHT: float = -0.510066
+WEIGHT_LINES: float = 0.760666
+WEIGHT_HOLES: float = -0.35663
+WEIGHT_BUMPINESS: float = -0.184483
+INTERIOR_MASK: int = FULL_ROW_MASK & ~WALL_MASK  # 壁を除いた列のビット
+BLOCK_TYPES: Tuple[int, ...] = tuple(range(2, 9))
+
+Masks = Tuple[int, ...]  # 盤面 (行ごとのビットマスク)
+
+
+# Zobristハッシュ用の、マスごとの乱数 (シードを固定して、どのプロセスでも同じ値にする)
+_zobrist_rng = random.Random(20240611)
+ZOBRIST: List[List[int]] = [[_zobrist_rng.getrandbits(64) for _ in range(MAX_COL + 2)] for _ in range(MAX_ROW + 3)]
+
+
+def zobrist_hash(masks: Masks) -> int:
+    """
+    盤面のZobristハッシュを求める。埋まっているマスの乱数を全てXORしたもの。
+
+    Args:
+        masks (Masks): 盤面。
+
+    Returns:
+        int: 64ビットのハッシュ値。
+    """
+    value: int = 0
+    for row in range(2, MAX_ROW + 2):
+        bits: int = masks[row] & INTERIOR_MASK
+        keys: List[int] = ZOBRIST[row]
+        while bits:
+            low: int = bits & -bits
+            value ^= keys[low.bit_length() - 1]
+            bits ^= low
+    return value
+
+
+class TranspositionCache:
+    """
+    盤面の評価値を保存するキャッシュ。キーはZobristハッシュで、
+    上限を超えたら最も長く使われていないものから捨てる (LRU)。
+    """
+    def __init__(self, max_size: int = 200000) -> None:
+        """
+        TranspositionCacheクラスの初期化。
+
+        Args:
+            max_size (int): 保存する評価値の上限。
+        """
+        self.max_size: int = max_size
+        self.table: "OrderedDict[int, float]" = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: int) -> Optional[float]:
+        """
+        評価値を取り出す。
+
+        Args:
+            key (int): 盤面のハッシュ値。
+
+        Returns:
+            Optional[float]: 評価値。保存されていない場合はNone。
+        """
+        value = self.table.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.table.move_to_end(key)
+        return value
+
+    def put(self, key: int, value: float) -> None:
+        """
+        評価値を保存する。
+
+        Args:
+            key (int): 盤面のハッシュ値。
+            value (float): 評価値。
+        """
+        self.table[key] = value
+        self.table.move_to_end(key)
+        if len(self.table) > self.max_size:
+            self.table.popitem(last=False)
+
+
+class _MaskBoard:
+    """
+    Block.moveableに渡すための、ビットマスクだけを持つ軽量なボード。
+    """
+    __slots__ = ("masks", "cols")
+
+    def __init__(self, masks: Masks) -> None:
+        self.masks = masks
+        self.cols = MAX_COL
+
+
+def evaluate(masks: Masks) -> float:
+    """
+    盤面を評価する。高さの合計、穴の数、でこぼこが小さいほど高い値になる。
+
+    Args:
+        masks (Masks): 盤面。
+
+    Returns:
+        float: 評価値。
+    """
+    heights: List[int] = [0] * (MAX_COL + 2)
+    covered: int = 0  # 上にブロックがある列のビット
+    holes: int = 0
+    for row in range(2, MAX_ROW + 2):
+        bits: int = masks[row] & INTERIOR_MASK
+        holes += (covered & ~bits).bit_count()
+        new: int = bits & ~covered
+        while new:
+            low: int = new & -new
+            heights[low.bit_length() - 1] = MAX_ROW + 2 - row
+            new ^= low
+        covered |= bits
+    bumpiness: int = sum(abs(heights[col] - heights[col + 1]) for col in range(1, MAX_COL))
+    return (WEIGHT_HEIGHT * sum(heights) + WEIGHT_HOLES * holes
+            + WEIGHT_BUMPINESS * bumpiness)
+
+
+def placements(masks: Masks, block_type: int) -> List[Tuple[int, int, Masks, int]]:
+    """
+    出現位置から回転し、左右に動かして、真下に落とせる置き場所を全て求める。
+
+    Args:
+        masks (Masks): 盤面。
+        block_type (int): ブロックの種類。
+
+    Returns:
+        List[Tuple[int, int, Masks, int]]: (回転回数, 列, 置いて行を消した後の盤面, 消した行数) のリスト。
+    """
+    board = _MaskBoard(masks)
+    block = Block(block_type)
+    results: List[Tuple[int, int, Masks, int]] = []
+    seen = set()
+    for rotation in range(4):
+        block.set_rotation(rotation)
+        block.row, block.col = 1, 5
+        if not block.moveable(board, [0, 0]):
+            continue
+        # 出現位置から左右に動かせる範囲
+        left: int = 0
+        while block.moveable(board, [0, left - 1]):
+            left -= 1
+        right: int = 0
+        while block.moveable(board, [0, right + 1]):
+            right += 1
+        for dcol in range(left, right + 1):
+            block.row, block.col = 1, 5 + dcol
+            while block.moveable(board, [1, 0]):
+                block.row += 1
+            key = (block.row, block.col, block.row_masks, block.min_dcol)
+            if key in seen:  # 回転しても形が同じ場合
+                continue
+            seen.add(key)
+            result = place_masks(masks, block)
+            if result is not None:
+                results.append((rotation, block.col, result[0], result[1]))
+    return results
+
+
+def place_masks(masks: Masks, block: Block) -> Optional[Tuple[Masks, int]]:
+    """
+    盤面にブロックを固定し、揃った行を消す。
+
+    Args:
+        masks (Masks): 盤面。
+        block (Block): 固定するブロック。
+
+    Returns:
+        Optional[Tuple[Masks, int]]: 新しい盤面と消した行数。画面外に固定される場合はNone。
+    """
+    rows: List[int] = list(masks)
+    left: int = block.col + block.min_dcol
+    for row_offset, bits in block.row_masks:
+        row: int = block.row + row_offset
+        if row < 2:
+            return None
+        rows[row] |= bits << left
+    kept: List[int] = [mask for mask in rows[:MAX_ROW + 2] if mask != FULL_ROW_MASK]
+    lines: int = MAX_ROW + 2 - len(kept)
+    if lines:
+        rows = [WALL_MASK] * lines + kept + rows[MAX_ROW + 2:]
+    return tuple(rows), lines
+
+
+# 各プロセスで共有するキャッシュ
+_cache: TranspositionCache = TranspositionCache()
+
+
+def cached_evaluate(masks: Masks, cache: Optional[TranspositionCache] = None) -> float:
+    """
+    キャッシュを使って盤面を評価する。
+
+    Args:
+        masks (Masks): 盤面。
+        cache (Optional[TranspositionCache]): キャッシュ。Noneの場合はプロセスで共有のキャッシュ。
+
+    Returns:
+        float: 評価値。
+    """
+    if cache is None:
+        cache = _cache
+    key: int = zobrist_hash(masks)
+    value = cache.get(key)
+    if value is None:
+        value = evaluate(masks)
+        cache.put(key, value)
+    return value
+
+
+def search(masks: Masks, pieces: Tuple[int, ...], depth: int,
+           cache: Optional[TranspositionCache] = None) -> float:
+    """
+    先読みして、盤面の最善の評価値を求める。
+    種類が分かっているブロック (pieces) は順番に置き、分からないブロックは全種類の平均をとる。
+
+    Args:
+        masks (Masks): 盤面。
+        pieces (Tuple[int, ...]): これから置くブロックの種類。
+        depth (int): あと何個ブロックを置くか。
+        cache (Optional[TranspositionCache]): キャッシュ。
+
+    Returns:
+        float: 評価値 (消した行の分も含む)。
+    """
+    if depth == 0:
+        return cached_evaluate(masks, cache)
+    if not pieces:
+        return sum(search(masks, (block_type,), depth, cache) for block_type in BLOCK_TYPES) / len(BLOCK_TYPES)
+    best: float = float("-inf")
+    for _, _, new_masks, lines in placements(masks, pieces[0]):
+        best = max(best, WEIGHT_LINES * lines + search(new_masks, pieces[1:], depth - 1, cache))
+    return best
+
+
+def _search_subtree(args: Tuple[Masks, Tuple[int, ...], int]) -> float:
+    """
+    ProcessPoolExecutorの各プロセスで実行する探索。
+    """
+    return search(*args)
+
+
+class Decision:
+    """
+    AIが決めた置き場所。
+    """
+    __slots__ = ("hold", "rotation", "col", "value")
+
+    def __init__(self, hold: bool, rotation: int, col: int, value: float) -> None:
+        self.hold: bool = hold  # ホールドしてから置くかどうか
+        self.rotation: int = rotation  # 出現時から時計回りに回転する回数
+        self.col: int = col  # 置く列 (Block.col)
+        self.value: float = value  # 評価値
+
+
+class AutoPlayer:
+    """
+    ゲームを自動でプレイするAI。
+    ブロックが出現するたびに置き場所を決め、そこへ動かす操作を1回の更新ごとに返す。
+    depthが2以上の場合は、最初の置き場所ごとの先読みをProcessPoolExecutorで全てのコアに分散する。
+    """
+    def __init__(self, depth: int = 1, workers: Optional[int] = None, cache_size: int = 200000) -> None:
+        """
+        AutoPlayerクラスの初期化。
+
+        Args:
+            depth (int): 先読みするブロックの数 (1は今のブロックだけ)。
+            workers (Optional[int]): 探索に使うプロセス数。Noneの場合はCPUのコア数。
+            cache_size (int): 評価値のキャッシュの上限。
+        """
+        self.depth: int = depth
+        self.cache: TranspositionCache = TranspositionCache(cache_size)
+        self.executor: Optional[ProcessPoolExecutor] = None
+        if depth >= 2:
+            self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        self.block: Optional[Block] = None  # 置き場所を決めたブロック
+        self.plan: Optional[Decision] = None
+        self.rotated: int = 0  # 置き場所を決めてから回転した回数
+        self.last_col: Optional[int] = None  # 直前に左右に動かそうとしたときの列
+
+    def close(self) -> None:
+        """
+        探索用のプロセスを終了する。
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def decide(self, game: Game) -> Decision:
+        """
+        今のブロックとホールドの候補から、最も評価の高い置き場所を決める。
+
+        Args:
+            game (Game): ゲーム。
+
+        Returns:
+            Decision: 置き場所。
+        """
+        masks: Masks = tuple(game.board.masks)
+        next_type: int = game.next_block_type
+        # (ホールドするか, 置くブロック, その後に分かっているブロック)
+        options: List[Tuple[bool, int, Tuple[int, ...]]] = [(False, game.block.block_type, (next_type,))]
+        if game.can_hold:
+            if game.hold_block is None:
+                options.append((True, next_type, ()))
+            else:
+                options.append((True, game.hold_block.block_type, (next_type,)))
+
+        candidates: List[Tuple[bool, int, int, Masks, int, Tuple[int, ...]]] = []
+        for hold, block_type, rest in options:
+            for rotation, col, new_masks, lines in placements(masks, block_type):
+                candidates.append((hold, rotation, col, new_masks, lines, rest))
+
+        if self.executor is not None:
+            jobs = [(new_masks, rest, self.depth - 1) for _, _, _, new_masks, _, rest in candidates]
+            values = list(self.executor.map(_search_subtree, jobs, chunksize=max(1, len(jobs) // 64)))
+        else:
+            values = [search(new_masks, rest, self.depth - 1, self.cache)
+                      for _, _, _, new_masks, _, rest in candidates]
+
+        best: Optional[Decision] = None
+        for (hold, rotation, col, _, lines, _), value in zip(candidates, values):
+            value += WEIGHT_LINES * lines
+            if best is None or value > best.value:
+                best = Decision(hold, rotation, col, value)
+        if best is None:  # 置ける場所がない
+            best = Decision(False, 0, game.block.col, float("-inf"))
+        return best
+
+    def action(self, game: Game) -> int:
+        """
+        決めた置き場所へブロックを動かすための、次の1回の更新の操作を返す。
+
+        Args:
+            game (Game): ゲーム。
+
+        Returns:
+            int: 操作 (ACTION_* の組み合わせ)。
+        """
+        if game.block is None:  # 行消去中
+            return ACTION_NONE
+        if game.block is not self.block:  # 新しいブロックが出現した
+            self.plan = self.decide(game)
+            self.block = game.block
+            self.rotated = 0
+            self.last_col = None
+            if self.plan.hold:
+                self.plan.hold = False
+                self.block = None  # ホールドで入れ替わったブロックの置き場所を決め直す
+                return ACTION_HOLD
+        plan = self.plan
+        if self.rotated < plan.rotation:
+            self.rotated += 1
+            return ACTION_ROTATE_CW
+        block = game.block
+        if block.col != plan.col and block.col != self.last_col:  # 壁などで動けなくなったらそのまま落とす
+            self.last_col = block.col
+            return ACTION_RIGHT if block.col < plan.col else ACTION_LEFT
+        return ACTION_DOWN
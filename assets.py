@@ -0,0 +1,119 @@
+# 画像などの素材を読み込むモジュール。
+# パスはこのファイルの場所から求めるので、どのディレクトリから起動しても読み込める。
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import pygame
+
+ASSET_DIR: Path = Path(__file__).resolve().parent
+BLOCK_IMAGE_DIR: Path = ASSET_DIR / "fig2"  # ブロック (こうかとん) の画像
+RESULT_IMAGE_PATH: Path = ASSET_DIR / ".fig" / "bijokokaton.png"  # リザルト画面のこうかとん (女) の画像
+RESULT_IMAGE_SIZE: Tuple[int, int] = (481, 565)
+CACHE_DIR: Path = ASSET_DIR / ".cache"  # 縮小済みのアトラスを保存する場所
+BLOCK_TYPES: range = range(2, 9)
+
+
+def asset_path(*parts: str) -> Path:
+    """
+    素材のパスを、このファイルの場所を基準にして求める。
+
+    Args:
+        *parts (str): 素材のディレクトリ名とファイル名。
+
+    Returns:
+        Path: 素材の絶対パス。
+    """
+    return ASSET_DIR.joinpath(*parts)
+
+
+class Assets:
+    """
+    ゲームで使う画像をまとめて管理するクラス。
+    ブロックの7枚の画像は縮小して1枚のテクスチャアトラスにまとめ、ディスクにキャッシュする。
+    リザルト画面の画像は、スタート画面を表示している間に別スレッドで読み込んでおく。
+    """
+    def __init__(self, block_size: int) -> None:
+        """
+        Assetsクラスの初期化。
+
+        Args:
+            block_size (int): ブロック1マスの大きさ (ピクセル)。
+        """
+        self.block_size: int = block_size
+        self.atlas: Optional[pygame.Surface] = None
+        self.block_images: List[Optional[pygame.Surface]] = []
+        self.result_surface: Optional[pygame.Surface] = None  # 別スレッドで読み込んだ画像 (convert前)
+        self.result_converted: Optional[pygame.Surface] = None
+        self.result_thread: Optional[threading.Thread] = None
+
+    def atlas_cache_path(self) -> Path:
+        """
+        ブロックの大きさごとの、キャッシュしたアトラスのパスを返す。
+        """
+        return CACHE_DIR / "atlas_{}.png".format(self.block_size)
+
+    def load_block_images(self) -> List[Optional[pygame.Surface]]:
+        """
+        ブロックの画像を読み込む。pygame.display.set_modeの後に呼び出す。
+        キャッシュが元の画像より新しければそれを使い、なければ元の画像を縮小してアトラスを作り、保存する。
+
+        Returns:
+            List[Optional[pygame.Surface]]: ブロックの種類ごとの画像 (インデックス0,1はNone)。
+        """
+        size: int = self.block_size
+        cache_path: Path = self.atlas_cache_path()
+        sources: List[Path] = [BLOCK_IMAGE_DIR / "{}.png".format(i) for i in BLOCK_TYPES]
+        newest: float = max(path.stat().st_mtime for path in sources)
+
+        atlas: Optional[pygame.Surface] = None
+        if cache_path.exists() and cache_path.stat().st_mtime >= newest:
+            try:
+                atlas = pygame.image.load(str(cache_path))
+            except pygame.error:  # 壊れたキャッシュは作り直す
+                atlas = None
+        if atlas is None or atlas.get_size() != (size * len(sources), size):
+            atlas = pygame.Surface((size * len(sources), size), pygame.SRCALPHA)
+            for index, path in enumerate(sources):
+                image = pygame.image.load(str(path))
+                atlas.blit(pygame.transform.scale(image, (size, size)), (index * size, 0))
+            try:
+                CACHE_DIR.mkdir(exist_ok=True)
+                pygame.image.save(atlas, str(cache_path))
+            except (OSError, pygame.error):  # 書き込めない場所でも、キャッシュなしで動かす
+                pass
+
+        self.atlas = atlas.convert_alpha()
+        self.block_images = [None, None]  # インデックス0,1は使わない
+        for index in range(len(sources)):
+            self.block_images.append(self.atlas.subsurface(pygame.Rect(index * size, 0, size, size)))
+        return self.block_images
+
+    def load_result_image(self) -> None:
+        """
+        リザルト画面の画像を読み込んで縮小する。
+        """
+        image = pygame.image.load(str(RESULT_IMAGE_PATH))
+        self.result_surface = pygame.transform.scale(image, RESULT_IMAGE_SIZE)
+
+    def preload_result_image(self) -> None:
+        """
+        リザルト画面の画像を、別スレッドで読み込んでおく。
+        """
+        self.result_thread = threading.Thread(target=self.load_result_image, daemon=True)
+        self.result_thread.start()
+
+    def result_image(self) -> pygame.Surface:
+        """
+        リザルト画面の画像を返す。先読みが終わっていなければ待つ (先読みしていなければここで読み込む)。
+
+        Returns:
+            pygame.Surface: 縮小済みの画像。
+        """
+        if self.result_converted is None:
+            if self.result_thread is not None:
+                self.result_thread.join()
+            if self.result_surface is None:  # 先読みしていない、または失敗した
+                self.load_result_image()
+            self.result_converted = self.result_surface.convert_alpha()  # convertは画面と同じスレッドで行う
+        return self.result_converted
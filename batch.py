@@ -0,0 +1,273 @@
+# 多数のボードをまとめて進めるNumPy版のシミュレーター (ボットの学習用)。
+# ボードはinitialize_game()と同じ 23x12 (壁つき) の配置で、N枚を (N, 23, 12) のuint8配列で持つ。
+# 衝突判定と行の判定には、engine.Boardの行のビットマスクと同じ考え方で、列ごとに埋まった行のビットを立てた
+# (N, 12) のuint32配列も持つ (マスを1つずつ読まずに、整数の演算だけで落ちる位置や揃った行が分かる)。
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from engine import MAX_ROW, MAX_COL, Block, Board, find_deleting_row, clear_rows
+
+N_ROW: int = MAX_ROW + 3  # 壁と画面外を含めた行数
+N_COL: int = MAX_COL + 2  # 壁を含めた列数
+SPAWN_ROW: int = 1  # 出現位置 (行)
+SPAWN_COL: int = 5  # 出現位置 (列)
+EMPTY_COLUMN: int = 1 << (N_ROW - 1)  # 空の列のビット (一番下の壁だけ)
+WALL_COLUMN: int = (1 << N_ROW) - 1  # 左右の壁の列のビット
+VISIBLE_ROWS: int = ((1 << (MAX_ROW + 2)) - 1) & ~0b11  # 消せる行 (画面内の行) のビット
+
+
+def build_shape_table() -> np.ndarray:
+    """
+    全てのブロックの種類と回転について、4マスのオフセットをBlockの回転の表から取り出す。
+
+    Returns:
+        np.ndarray: (種類, 回転, マス, [行オフセット, 列オフセット]) の形の配列。種類0と1は使わない。
+    """
+    table = np.zeros((9, 4, 4, 2), dtype=np.int64)
+    for block_type in range(2, 9):
+        table[block_type] = Block.ROTATIONS[block_type]
+    return table
+
+
+SHAPES: np.ndarray = build_shape_table()
+# stepで使う、(種類, 回転) ごとの4マスの行と列のオフセット (小さい整数型にして、配列演算のメモリを減らす)
+SHAPE_ROWS: np.ndarray = SHAPES[:, :, :, 0].astype(np.int32)
+SHAPE_COLS: np.ndarray = SHAPES[:, :, :, 1].astype(np.int32)
+
+
+class BatchEnv:
+    """
+    N枚のボードをまとめて進める環境。
+    1回のstepで、全てのボードに (回転, 列) を指定してブロックを落とし、固定、行消去、次のブロックの出現を行う。
+    ボードごとのPythonのループは使わず、全てNumPyの配列演算で処理する。
+    """
+    def __init__(self, n: int, seed: Optional[int] = None) -> None:
+        """
+        BatchEnvクラスの初期化。
+
+        Args:
+            n (int): ボードの枚数。
+            seed (Optional[int]): 乱数のシード。
+        """
+        self.n: int = n
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        self.index: np.ndarray = np.arange(n)
+        self.boards: np.ndarray = np.zeros((n, N_ROW, N_COL), dtype=np.uint8)
+        self.columns: np.ndarray = np.zeros((n, N_COL), dtype=np.uint32)  # 列ごとの、埋まった行のビット
+        self.block_types: np.ndarray = np.zeros(n, dtype=np.int64)
+        self.next_block_types: np.ndarray = np.zeros(n, dtype=np.int64)
+        self.cleared_rows: np.ndarray = np.zeros(n, dtype=np.int64)
+        self.reset()
+
+    def reset(self, mask: Optional[np.ndarray] = None) -> None:
+        """
+        ボードを空に戻す。
+
+        Args:
+            mask (Optional[np.ndarray]): 戻すボードを示す (N,) のbool配列。Noneの場合は全て。
+        """
+        if mask is None:
+            mask = np.ones(self.n, dtype=bool)
+        mask = np.flatnonzero(mask)  # 少数のボードだけを戻すことが多いので、番号で指定する
+        count: int = mask.size
+        if count == 0:
+            return
+        self.boards[mask] = 0
+        self.boards[mask, :, 0] = 1  # 壁の配置
+        self.boards[mask, :, -1] = 1
+        self.boards[mask, -1, :] = 1
+        self.columns[mask] = EMPTY_COLUMN
+        self.columns[mask, 0] = WALL_COLUMN
+        self.columns[mask, -1] = WALL_COLUMN
+        self.block_types[mask] = self.rng.integers(2, 9, count)
+        self.next_block_types[mask] = self.rng.integers(2, 9, count)
+        self.cleared_rows[mask] = 0
+
+    def moveable(self, rotations: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        各ボードについて、ブロックを指定の位置に置けるかどうかを判定する。
+
+        Args:
+            rotations (np.ndarray): (N,) の回転状態。
+            rows (np.ndarray): (N,) のブロックの行。
+            cols (np.ndarray): (N,) のブロックの列。
+
+        Returns:
+            np.ndarray: 置ける場合にTrueとなる (N,) のbool配列。
+        """
+        offsets = SHAPES[self.block_types, rotations]  # (N, 4, 2)
+        cell_rows = rows[:, None] + offsets[:, :, 0]
+        cell_cols = cols[:, None] + offsets[:, :, 1]
+        inside = (cell_rows >= 0) & (cell_rows < N_ROW) & (cell_cols >= 0) & (cell_cols < N_COL)
+        cells = self.columns[self.index[:, None], np.clip(cell_cols, 0, N_COL - 1)] >> np.clip(cell_rows, 0, N_ROW - 1)
+        return np.all(inside & (cells & 1 == 0), axis=1)
+
+    def step(self, rotations: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        全てのボードで、指定の回転と列にブロックを落として固定する。
+        ゲームオーバーになったボードは自動で空に戻す。
+
+        Args:
+            rotations (np.ndarray): (N,) の回転状態 (0から3)。
+            cols (np.ndarray): (N,) のブロックを落とす列。
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 各ボードで消えた行数と、ゲームオーバーになったかどうか。
+        """
+        rotations = np.asarray(rotations) % 4
+        cols = np.asarray(cols, dtype=np.int32)
+
+        cell_rows = SHAPE_ROWS[self.block_types, rotations] + SPAWN_ROW  # (N, 4) の出現位置の各マスの行
+        cell_cols = SHAPE_COLS[self.block_types, rotations] + cols[:, None]
+        outside = np.any((cell_cols < 0) | (cell_cols >= N_COL), axis=1)
+        np.clip(cell_cols, 0, N_COL - 1, out=cell_cols)
+        # 各マスの列のビットを、出現位置の行が一番下のビットになるようにずらす
+        bits = self.columns[self.index[:, None], cell_cols] >> cell_rows.astype(np.uint32)
+        # 出現位置で置けないボードはゲームオーバー
+        done = outside | np.any(bits & 1, axis=1)
+        # 落ちる行数を1回で求める: 各マスの列で、出現位置より下にある最初の埋まったマス (一番下の立っているビット)
+        # までの距離を求め、4マスの最小値だけ落とす (1行ずつ落として判定するのと同じ結果。一番下は壁なので、
+        # 必ずビットが立っている)
+        bits >>= 1
+        gaps = np.frexp((bits & -bits).astype(np.float32))[1] - 1  # 一番下の立っているビットの位置
+        drop = gaps.min(axis=1)
+        drop[done] = 0
+        cell_rows += drop[:, None]
+
+        # 固定 (ゲームオーバーのボードにも書くが、最後にresetで空に戻すので、残っているボードだけを選ぶ手間を省ける)
+        done |= np.any(cell_rows < 2, axis=1)  # 画面外に固定された
+        cells = (self.index[:, None] * N_ROW + cell_rows) * N_COL + cell_cols  # boardsを1次元にしたときの位置
+        self.boards.reshape(-1)[cells] = self.block_types[:, None].astype(np.uint8)
+        cell_bits = np.uint32(1) << cell_rows.astype(np.uint32)
+        for cell in range(4):  # 1枚のボードの中で同じ列のマスがあっても、マスごとに分ければ重ならない
+            self.columns[self.index, cell_cols[:, cell]] |= cell_bits[:, cell]
+
+        # 行の消去
+        lines = self.clear_full_rows()
+        lines[done] = 0  # ゲームオーバーのボードは固定していないことにする
+        self.cleared_rows += lines
+
+        # 次のブロック
+        self.block_types = self.next_block_types
+        self.next_block_types = self.rng.integers(2, 9, self.n)
+        self.reset(done)
+        return lines, done
+
+    def clear_full_rows(self) -> np.ndarray:
+        """
+        全てのボードで揃った行を消し、残った行を下に詰める。
+        各ボードの行を「消える行が上、残る行が元の順番で下」になるように並べ替え、上の消えた行を空にする。
+
+        Returns:
+            np.ndarray: 各ボードで消えた行数。
+        """
+        # 全ての列のビットのANDで、揃った行のビットが1回で求まる
+        full_bits = np.bitwise_and.reduce(self.columns[:, 1:MAX_COL + 1], axis=1) & VISIBLE_ROWS
+        lines = np.zeros(self.n, dtype=np.int64)
+        cleared = np.flatnonzero(full_bits)  # 並べ替えは、行が揃ったボードだけで行う
+        if cleared.size == 0:
+            return lines
+        full = (full_bits[cleared, None] >> np.arange(MAX_ROW + 2)) & 1 == 1  # 一番下の壁を除いた行
+        lines[cleared] = full.sum(axis=1)
+        order = np.argsort(~full, axis=1, kind="stable")
+        field = np.take_along_axis(self.boards[cleared, :MAX_ROW + 2], order[:, :, None], axis=1)
+        emptied = np.arange(MAX_ROW + 2)[None, :] < lines[cleared, None]
+        field[:, :, 1:MAX_COL + 1][emptied] = 0
+        self.boards[cleared, :MAX_ROW + 2] = field
+        # 詰めた後の列のビットを作り直す
+        filled = (self.boards[cleared] != 0).astype(np.uint32) << np.arange(N_ROW, dtype=np.uint32)[None, :, None]
+        self.columns[cleared] = np.bitwise_or.reduce(filled, axis=1)
+        return lines
+
+
+def scalar_step(board: Board, block_type: int, rotation: int, col: int) -> Tuple[int, bool]:
+    """
+    比較用に、1枚のボードでBatchEnv.stepと同じ処理をengineのBlockで行う。
+
+    Args:
+        board (Board): ゲームボードの状態。
+        block_type (int): ブロックの種類。
+        rotation (int): 回転状態。
+        col (int): ブロックを落とす列。
+
+    Returns:
+        Tuple[int, bool]: 消えた行数と、ゲームオーバーになったかどうか。
+    """
+    block = Block(block_type)
+    block.set_rotation(rotation % 4)
+    block.col = col
+    if not block.moveable(board, [0, 0]):
+        return 0, True
+    while block.moveable(board, [1, 0]):
+        block.row += 1
+    if block.place(board) == 1:
+        return 0, True
+    count, row_numbers = find_deleting_row(board)
+    if count > 0:
+        clear_rows(board, row_numbers)
+    return count, False
+
+
+def run_batch(n: int, steps: int, seed: int) -> Tuple[float, BatchEnv, List[np.ndarray], List[Tuple[np.ndarray, np.ndarray]]]:
+    """
+    BatchEnvをランダムな操作でsteps回進め、1秒あたりの固定回数を測る (stepの時間だけを測る)。
+
+    Args:
+        n (int): ボードの枚数。
+        steps (int): stepの回数。
+        seed (int): 乱数のシード。
+
+    Returns:
+        Tuple[float, BatchEnv, List[np.ndarray], List[Tuple[np.ndarray, np.ndarray]]]:
+            1秒あたりの固定回数、進めた環境、stepごとの各ボードのブロックの種類、stepごとの (回転, 列)。
+    """
+    rng = np.random.default_rng(seed)
+    env = BatchEnv(n, seed)
+    actions = [(rng.integers(0, 4, n), rng.integers(1, MAX_COL + 1, n)) for _ in range(steps)]
+    block_types: List[np.ndarray] = []  # 1枚ずつの処理で同じ順に落とすため
+    elapsed: float = 0.0
+    for rotations, cols in actions:
+        block_types.append(env.block_types.copy())
+        start = time.perf_counter()
+        env.step(rotations, cols)
+        elapsed += time.perf_counter() - start
+    return n * steps / elapsed, env, block_types, actions
+
+
+def benchmark(n: int = 4096, steps: int = 50, seed: int = 0) -> None:
+    """
+    BatchEnvと、engineのBlock/find_deleting_rowを1枚ずつ使う場合の処理速度 (1秒あたりの固定回数) を比べる。
+    BatchEnvは枚数を変えて測り、配列演算の1回あたりの手間が多くのボードに分けられて速くなる様子も表示する。
+
+    Args:
+        n (int): BatchEnvのボードの枚数 (この枚数で1枚ずつの処理と結果を比べる)。
+        steps (int): 計測するstepの回数。
+        seed (int): 乱数のシード。
+    """
+    batch_rate, env, block_types, actions = run_batch(n, steps, seed)
+
+    # 1枚ずつの処理は遅いので、先頭のscalar_n枚だけをBatchEnvと同じブロックと操作で進める
+    scalar_n = max(1, n // 16)
+    boards = [Board() for _ in range(scalar_n)]
+    start = time.perf_counter()
+    for types, (rotations, cols) in zip(block_types, actions):
+        for i in range(scalar_n):
+            _, done = scalar_step(boards[i], int(types[i]), int(rotations[i]), int(cols[i]))
+            if done:
+                boards[i] = Board()
+    scalar_rate = scalar_n * steps / (time.perf_counter() - start)
+    same: bool = all(np.array_equal(env.boards[i], np.array(boards[i].cells, dtype=np.uint8))
+                     for i in range(scalar_n))
+
+    print("scalar        : {:12.0f} placements/s".format(scalar_rate))
+    for size in sorted({1, 16, 256, n, n * 16}):
+        rate: float = batch_rate if size == n else run_batch(size, steps, seed)[0]
+        print("batch  (N={:>6d}): {:12.0f} placements/s  x{:.1f}".format(size, rate, rate / scalar_rate))
+    print("same boards   : {}".format(same))
+
+
+if __name__ == "__main__":
+    benchmark(*map(int, sys.argv[1:]))
@@ -0,0 +1,413 @@
+# ゲームロジックと描画の処理速度を測るベンチマーク。
+# python bench.py で全て実行し、結果をJSONで保存する。--compare で前回の結果と比べて遅くなったものを表示する。
+# ボードはシードから作るので、何度実行しても同じ盤面で測れる。描画はSDLのダミードライバーで画面なしで測る。
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from engine import (MAX_ROW, MAX_COL, ACTION_NONE, ACTION_HARD_DROP, Block, Board, Game,
+                    find_deleting_row, clear_rows, spawn_col)
+import snapshot
+
+SEED: int = 20240611
+REGRESSION_RATIO: float = 1.10  # 前回より10%以上遅ければ遅くなったとみなす
+
+
+def make_board(rng: random.Random, top: int, density: float, rows: int = MAX_ROW, cols: int = MAX_COL) -> Board:
+    """
+    top行目から下をdensityの割合で埋めたボードを作る。揃った行はできないよう、各行に1つは穴を空ける。
+
+    Args:
+        rng (random.Random): 乱数生成器。
+        top (int): 埋め始める行番号。
+        density (float): マスを埋める確率。
+        rows (int): 盤面の行数。
+        cols (int): 盤面の列数。
+
+    Returns:
+        Board: 作ったボード。
+    """
+    board = Board(rows, cols)
+    for row in range(top, rows + 2):
+        hole: int = rng.randint(1, cols)
+        for col in range(1, cols + 1):
+            if col != hole and rng.random() < density:
+                board.set_cell(row, col, rng.randint(2, 8))
+    return board
+
+
+def make_fixtures(seed: int = SEED) -> Dict[str, Board]:
+    """
+    ベンチマークに使うボードを作る。
+
+    Args:
+        seed (int): 乱数のシード。
+
+    Returns:
+        Dict[str, Board]: 名前とボードの辞書。
+    """
+    rng = random.Random(seed)
+    return {
+        "empty": Board(),
+        "half_full": make_board(rng, MAX_ROW // 2 + 2, 0.9),  # 下半分がほぼ埋まっている
+        "near_topout": make_board(rng, 5, 0.9),  # 上の数行を除いてほぼ埋まっている
+        "many_holes": make_board(rng, 8, 0.55),  # 穴だらけ
+    }
+
+
+def make_clear_board(rng: random.Random, full_rows: int) -> Tuple[Board, List[int]]:
+    """
+    下から半分ほど埋め、そのうちfull_rows行が揃っているボードを作る (行の消去用)。
+
+    Args:
+        rng (random.Random): 乱数生成器。
+        full_rows (int): 揃える行数。
+
+    Returns:
+        Tuple[Board, List[int]]: 作ったボードと、揃った行番号のリスト。
+    """
+    board: Board = make_board(rng, MAX_ROW // 2 + 2, 0.9)
+    rows: List[int] = sorted(rng.sample(range(MAX_ROW // 2 + 2, MAX_ROW + 2), full_rows))
+    for row in rows:
+        for col in range(1, MAX_COL + 1):
+            board.set_cell(row, col, rng.randint(2, 8))
+    return board, rows
+
+
+def surface_blocks(board: Board, rng: random.Random, n: int,
+                   cols: Optional[Tuple[int, int]] = None) -> List[Block]:
+    """
+    ボードの上で、積まれたブロックのすぐ上に置ける位置のブロックをn個作る。
+
+    Args:
+        board (Board): ゲームボードの状態。
+        rng (random.Random): 乱数生成器。
+        n (int): 作るブロックの数。
+        cols (Optional[Tuple[int, int]]): ブロックを置く列の範囲 (両端を含む)。Noneの場合は全ての列。
+
+    Returns:
+        List[Block]: 置ける位置にあるブロックのリスト。
+    """
+    first, last = cols if cols is not None else (1, board.cols)
+    blocks: List[Block] = []
+    while len(blocks) < n:
+        block = Block(rng.randint(2, 8))
+        block.set_rotation(rng.randint(0, 3))
+        block.col = rng.randint(first, last)
+        if not block.moveable(board, [0, 0]):
+            continue
+        while block.moveable(board, [1, 0]):
+            block.row += 1
+        blocks.append(block)
+    return blocks
+
+
+def measure(func: Callable[[], None], number: int, repeat: int) -> Dict[str, float]:
+    """
+    funcをnumber回呼ぶ時間をrepeat回測り、1回あたりの時間を返す。
+
+    Args:
+        func (Callable[[], None]): 測る処理。
+        number (int): 1回の計測で呼ぶ回数。
+        repeat (int): 計測の回数。
+
+    Returns:
+        Dict[str, float]: 1回あたりの時間 (ナノ秒) の中央値と最小値、呼んだ回数。
+    """
+    times: List[float] = []
+    for _ in range(repeat):
+        start: int = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter_ns() - start) / number)
+    times.sort()
+    return {"ns_per_op": times[len(times) // 2], "best_ns_per_op": times[0], "ops": number * repeat}
+
+
+def measure_each(setup: Callable[[], object], func: Callable[[object], None],
+                 number: int, repeat: int) -> Dict[str, float]:
+    """
+    呼ぶたびに準備が必要な処理を測る。setupの時間は含めず、func(setup()) の時間だけを1回ずつ測って合計する。
+
+    Args:
+        setup (Callable[[], object]): 準備 (戻り値をfuncに渡す)。
+        func (Callable[[object], None]): 測る処理。
+        number (int): 1回の計測で呼ぶ回数。
+        repeat (int): 計測の回数。
+
+    Returns:
+        Dict[str, float]: 1回あたりの時間 (ナノ秒) の中央値と最小値、呼んだ回数。
+    """
+    clock = time.perf_counter_ns
+    times: List[float] = []
+    for _ in range(repeat):
+        total: int = 0
+        for _ in range(number):
+            arg = setup()
+            start: int = clock()
+            func(arg)
+            total += clock() - start
+        times.append(total / number)
+    times.sort()
+    return {"ns_per_op": times[len(times) // 2], "best_ns_per_op": times[0], "ops": number * repeat}
+
+
+def cycle(items: List) -> Callable[[], object]:
+    """
+    呼ぶたびにitemsの要素を順に返す関数を作る。
+
+    Args:
+        items (List): 要素のリスト。
+
+    Returns:
+        Callable[[], object]: 次の要素を返す関数。
+    """
+    index: List[int] = [0]
+    n: int = len(items)
+
+    def next_item() -> object:
+        i: int = index[0]
+        index[0] = i + 1 if i + 1 < n else 0
+        return items[i]
+    return next_item
+
+
+def engine_benchmarks(number: int, repeat: int, seed: int = SEED) -> Dict[str, Dict[str, float]]:
+    """
+    ゲームロジックの処理 (衝突判定、回転、固定、行の判定と消去、ゲーム全体) を測る。
+
+    Args:
+        number (int): 1回の計測で呼ぶ回数。
+        repeat (int): 計測の回数。
+        seed (int): 乱数のシード。
+
+    Returns:
+        Dict[str, Dict[str, float]]: ベンチマーク名と結果の辞書。
+    """
+    results: Dict[str, Dict[str, float]] = {}
+    for name, board in make_fixtures(seed).items():
+        rng = random.Random(seed)
+        next_block = cycle(surface_blocks(board, rng, 64))
+
+        def bench_moveable() -> None:
+            next_block().moveable(board, [1, 0])
+        results["moveable/" + name] = measure(bench_moveable, number, repeat)
+
+        def bench_rotate() -> None:
+            block: Block = next_block()
+            row, col, rotation = block.row, block.col, block.rotation
+            block.rotate(board, 0)  # 壁蹴り (rotate_correction) を含む
+            block.set_rotation(rotation)
+            block.row, block.col = row, col
+        results["rotate/" + name] = measure(bench_rotate, number, repeat)
+
+        # 固定は盤面を変える (続けて置くとボードが埋まって別の盤面になる) ので、毎回複製したボードに置く
+        # (複製の時間は含めない)
+        results["place/" + name] = measure_each(
+            lambda: (board.copy(), next_block()), lambda args: args[1].place(args[0]), number, repeat)
+
+        results["drop_distance/" + name] = measure(lambda: next_block().drop_distance(board), number, repeat)
+        results["find_deleting_row/" + name] = measure(lambda: find_deleting_row(board), number, repeat)
+
+    # 行の消去は盤面を変えるので、毎回複製したボードで測る (複製の時間は含めない)
+    rng = random.Random(seed)
+    for full_rows in (1, 4):
+        board, rows = make_clear_board(rng, full_rows)
+        results["clear_rows/{}_rows".format(full_rows)] = measure_each(
+            lambda: board.copy(), lambda copied: clear_rows(copied, rows), number, repeat)
+
+    results["game_step"] = game_benchmark(seed)
+
+    # 先読みや取り消しのためのゲームの複製と、スナップショットの保存・読み込み
+    game = Game(seed)
+    for action in [ACTION_NONE] * 30 + [ACTION_HARD_DROP] * 20:
+        game.step(action)
+    results["game.clone"] = measure(game.clone, number, repeat)
+    data: bytes = snapshot.to_bytes(game)
+    results["snapshot.to_bytes"] = measure(lambda: snapshot.to_bytes(game), max(1, number // 10), repeat)
+    results["snapshot.from_bytes"] = measure(lambda: snapshot.from_bytes(data), max(1, number // 100), repeat)
+    return results
+
+
+def game_benchmark(seed: int = SEED, ticks: int = 60000) -> Dict[str, float]:
+    """
+    画面なしでゲームを進める速度を測る。操作は乱数で決め、ゲームオーバーになったら同じ乱数の続きでやり直す。
+
+    Args:
+        seed (int): 乱数のシード。
+        ticks (int): 進める更新回数。
+
+    Returns:
+        Dict[str, float]: 1回の更新あたりの時間 (ナノ秒) と、1秒あたりの更新回数。
+    """
+    rng = random.Random(seed)
+    # 左右移動と回転を時々行う操作列 (ACTION_* の組み合わせ)
+    actions: List[int] = [rng.choice((ACTION_NONE,) * 6 + (1, 2, 4, 8, 16, 32)) for _ in range(ticks)]
+    game = Game(seed)
+    step = game.step
+    start: int = time.perf_counter_ns()
+    for action in actions:
+        step(action)
+        if game.game_over:
+            game.reset(rng.randrange(2 ** 32))
+    elapsed: int = time.perf_counter_ns() - start
+    return {"ns_per_op": elapsed / ticks, "ticks_per_s": ticks / elapsed * 1e9, "ops": ticks}
+
+
+def render_benchmarks(number: int, repeat: int, seed: int = SEED) -> Dict[str, Dict[str, float]]:
+    """
+    画面なし (SDLのダミードライバー) で、ボードとスコアの描画を測る。
+
+    Args:
+        number (int): 1回の計測で呼ぶ回数。
+        repeat (int): 計測の回数。
+        seed (int): 乱数のシード。
+
+    Returns:
+        Dict[str, Dict[str, float]]: ベンチマーク名と結果の辞書。
+    """
+    import pygame
+    import kokaris
+    from assets import Assets
+    from engine import Score
+
+    pygame.init()
+    screen = pygame.display.set_mode((1000, 770))
+    surface = pygame.Surface((1000, 770)).convert()  # 画面に反映しないオフスクリーンの描画先
+    block_images = Assets(kokaris.BLOCK_SIZE).load_block_images()
+    block_color = [(50, 50, 50), (150, 150, 150)] + [(200, 200, 200)] * 9
+
+    results: Dict[str, Dict[str, float]] = {}
+    fixtures: Dict[str, Board] = make_fixtures(seed)
+    record = Score()
+    record.score, record.level, record.cleared_row = 123456789, 12, 345
+    results["show_score"] = measure(lambda: kokaris.show_score(surface, record), max(1, number // 10), repeat)
+
+    # 全体の描き直し: 起動直後やウィンドウの大きさを変えたときのように、全てのマスを描くフレーム
+    renderer = kokaris.Renderer(surface, block_color, block_images)
+    for name in ("empty", "near_topout"):
+        board: Board = fixtures[name]
+
+        def bench_full_redraw() -> None:
+            renderer.invalidate()
+            renderer.draw(board, None, None, record)
+            renderer.dirty_rects = []
+        results["renderer.draw_full/" + name] = measure(bench_full_redraw, max(1, number // 100), repeat)
+
+    # 差分描画: 落下中のブロックが1マスずつ動くフレーム
+    renderer = kokaris.Renderer(surface, block_color, block_images)
+    board = fixtures["half_full"]
+    next_block = cycle(surface_blocks(board, random.Random(seed), 64))
+
+    def bench_renderer() -> None:
+        renderer.draw(board, next_block(), None, record)
+        renderer.dirty_rects = []
+    results["renderer.draw/half_full"] = measure(bench_renderer, max(1, number // 10), repeat)
+
+    # 大きな盤面: ビューポートの中だけを描くので、同じ拡大率なら盤面の大きさにかかわらず標準の盤面と同じくらいの時間になる
+    large_renderer = kokaris.Renderer(surface, block_color, block_images)
+    large: Board = make_board(random.Random(seed), 502, 0.9, rows=1000, cols=200)
+    center: int = spawn_col(large.cols)
+    next_large_block = cycle(surface_blocks(large, random.Random(seed), 64, (center - 3, center + 3)))
+    large_renderer.draw(large, next_large_block())
+    large_renderer.zoom(-len(kokaris.ZOOM_SIZES))  # 標準の盤面と同じ1マスの大きさにする
+
+    def bench_large_renderer() -> None:
+        large_renderer.draw(large, next_large_block(), None, record)
+        large_renderer.dirty_rects = []
+    results["renderer.draw/large_200x1000"] = measure(bench_large_renderer, max(1, number // 10), repeat)
+    pygame.quit()
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]]) -> List[str]:
+    """
+    前回の結果と比べて、遅くなったベンチマークを探す。
+    他の処理の影響を受けにくいように、最小値 (なければ中央値) で比べる。
+
+    Args:
+        results (Dict[str, Dict[str, float]]): 今回の結果。
+        baseline (Dict[str, Dict[str, float]]): 前回の結果。
+
+    Returns:
+        List[str]: REGRESSION_RATIO以上遅くなったベンチマーク名のリスト。
+    """
+    slower: List[str] = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before: float = baseline[name].get("best_ns_per_op", baseline[name]["ns_per_op"])
+        after: float = result.get("best_ns_per_op", result["ns_per_op"])
+        if before <= 0:
+            continue
+        ratio: float = after / before
+        mark: str = ""
+        if ratio >= REGRESSION_RATIO:
+            slower.append(name)
+            mark = "  <- slower"
+        print("{:32s} {:12.1f} -> {:12.1f} ns  x{:.2f}{}".format(name, before, after, ratio, mark))
+    return slower
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    ベンチマークを実行して結果を保存する。
+
+    Args:
+        argv (Optional[List[str]]): コマンドライン引数。
+
+    Returns:
+        int: 終了コード (--compareで遅くなったものがあれば1)。
+    """
+    parser = argparse.ArgumentParser(description="KOKARIS benchmarks")
+    parser.add_argument("--out", default="bench.json", help="結果を保存するJSONファイル (既定: bench.json)")
+    parser.add_argument("--compare", metavar="FILE", help="前回の結果と比べて、遅くなったものを表示する (--out と同じファイルでもよい)")
+    parser.add_argument("--quick", action="store_true", help="回数を減らして短時間で測る")
+    parser.add_argument("--no-render", action="store_true", help="描画のベンチマークを行わない")
+    parser.add_argument("--seed", type=int, default=SEED, help="ボードを作る乱数のシード")
+    args = parser.parse_args(argv)
+
+    # 比べる結果は先に読み込んでおく (--compare と --out が同じファイルでも、上書きする前の結果と比べる)
+    baseline: Optional[Dict[str, Dict[str, float]]] = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    number, repeat = (2000, 3) if args.quick else (20000, 7)
+    results: Dict[str, Dict[str, float]] = engine_benchmarks(number, repeat, args.seed)
+    if not args.no_render:
+        results.update(render_benchmarks(number, repeat, args.seed))
+
+    for name, result in results.items():
+        print("{:32s} {:12.1f} ns/op".format(name, result["ns_per_op"]))
+    report: Dict = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "number": number,
+            "repeat": repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if baseline is not None and compare(results, baseline):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
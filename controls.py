@@ -0,0 +1,172 @@
+# キー入力をゲームロジックの操作に変換するモジュール。pygameには依存しない。
+# キーを押した・離した時刻を記録しておき、ゲームロジックの更新ごとに、その時刻までの入力から操作を決める。
+# 左右の押しっぱなしはDAS (最初の移動から連続移動が始まるまでの時間) とARR (連続移動の間隔) で、
+# 下の押しっぱなしはソフトドロップの間隔で移動するので、描画のFPSによって移動の速さが変わらない。
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from engine import TICK_MS, ACTION_NONE, ACTION_LEFT, ACTION_RIGHT, ACTION_DOWN, ACTION_HARD_DROP
+
+DAS_MS: float = 167  # 押し始めてから連続移動が始まるまでの時間 (ミリ秒)
+ARR_MS: float = 33  # 連続移動の間隔 (ミリ秒、TICK_MSより短い場合は1回の更新につき1マス)
+SOFT_DROP_MS: float = TICK_MS  # ソフトドロップの間隔 (ミリ秒)
+BUFFER_MS: float = 200  # 行消去中に押された移動とハードドロップを覚えておく時間 (ミリ秒)
+
+REPEAT_ACTIONS: int = ACTION_LEFT | ACTION_RIGHT | ACTION_DOWN  # 押しっぱなしで繰り返す操作
+# 行消去中 (落下中のブロックがない間) に、次のブロックのために覚えておく操作。
+# 回転とホールドはGameが覚えておいて出現直後に反映するので、ここではそのまま渡す
+BUFFERED_ACTIONS: int = ACTION_LEFT | ACTION_RIGHT | ACTION_HARD_DROP
+
+
+class Controls:
+    """
+    時刻つきのキー入力から、ゲームロジックの更新ごとの操作を求めるクラス。
+    """
+    def __init__(self, das_ms: float = DAS_MS, arr_ms: float = ARR_MS,
+                 soft_drop_ms: float = SOFT_DROP_MS, buffer_ms: float = BUFFER_MS) -> None:
+        """
+        Controlsクラスの初期化。
+
+        Args:
+            das_ms (float): 左右の押しっぱなしで、連続移動が始まるまでの時間 (ミリ秒)。
+            arr_ms (float): 左右の連続移動の間隔 (ミリ秒)。
+            soft_drop_ms (float): ソフトドロップの間隔 (ミリ秒)。
+            buffer_ms (float): 行消去中に押された操作を覚えておく時間 (ミリ秒)。
+        """
+        self.das_ms: float = das_ms
+        self.arr_ms: float = max(arr_ms, 1e-3)
+        self.soft_drop_ms: float = max(soft_drop_ms, 1e-3)
+        self.buffer_ms: float = buffer_ms
+        self.events: Deque[Tuple[float, int, bool]] = deque()  # まだ反映していない (時刻, 操作, 押したか)
+        self.held: Dict[int, float] = {}  # 押しっぱなしの操作と、その操作の時間を数え始めた時刻
+        self.repeats: Dict[int, int] = {}  # 押しっぱなしの操作で、これまでに繰り返した回数
+        self.horizontal: int = ACTION_NONE  # 左右の両方が押されているときは、後から押した方を使う
+        self.buffered: Deque[Tuple[float, int]] = deque()  # 行消去中に押された (時刻, 操作)
+
+    def press(self, action: int, time_ms: float) -> None:
+        """
+        キーが押されたことを記録する。
+
+        Args:
+            action (int): キーに対応する操作 (ACTION_* のどれか1つ)。
+            time_ms (float): 押された時刻 (ミリ秒)。
+        """
+        self.events.append((time_ms, action, True))
+
+    def release(self, action: int, time_ms: float) -> None:
+        """
+        キーが離されたことを記録する。
+
+        Args:
+            action (int): キーに対応する操作 (ACTION_* のどれか1つ)。
+            time_ms (float): 離された時刻 (ミリ秒)。
+        """
+        self.events.append((time_ms, action, False))
+
+    def release_all(self, time_ms: float) -> None:
+        """
+        押しっぱなしの操作を全て離したことにする (ウィンドウが非アクティブになったときなど)。
+
+        Args:
+            time_ms (float): 離した時刻 (ミリ秒)。
+        """
+        for action in list(self.held):
+            self.release(action, time_ms)
+
+    def action(self, time_ms: float, accepting: bool = True) -> int:
+        """
+        time_msまでに押された・離されたキーを反映して、ゲームロジックの1回の更新に渡す操作を求める。
+        ゲームロジックを1回進める直前に、その更新の時刻を指定して呼び出す。
+
+        Args:
+            time_ms (float): この更新の時刻 (ミリ秒)。
+            accepting (bool): 落下中のブロックがあるかどうか。Falseの間に押された移動とハードドロップは覚えておき、
+                Trueになってから (buffer_ms以内なら) 反映する。
+
+        Returns:
+            int: 操作 (ACTION_* の組み合わせ)。
+        """
+        action: int = ACTION_NONE
+        while self.events and self.events[0][0] <= time_ms:
+            event_ms, key_action, pressed = self.events.popleft()
+            if pressed:
+                action |= self.on_press(key_action, event_ms)
+            else:
+                self.on_release(key_action, event_ms)
+        action |= self.repeat(time_ms)
+
+        if not accepting:
+            if action & BUFFERED_ACTIONS:
+                self.buffered.append((time_ms, action & BUFFERED_ACTIONS))
+            return action & ~BUFFERED_ACTIONS
+        while self.buffered:
+            buffered_ms, buffered_action = self.buffered.popleft()
+            if time_ms - buffered_ms <= self.buffer_ms:
+                action |= buffered_action
+        return action
+
+    def on_press(self, action: int, time_ms: float) -> int:
+        """
+        キーが押されたときの処理。押した瞬間に1回だけ操作する。
+
+        Args:
+            action (int): 押されたキーの操作。
+            time_ms (float): 押された時刻 (ミリ秒)。
+
+        Returns:
+            int: この更新で行う操作。
+        """
+        if action & REPEAT_ACTIONS:
+            if action in self.held:  # キーリピートによる2回目以降のKEYDOWNは無視する
+                return ACTION_NONE
+            self.held[action] = time_ms
+            self.repeats[action] = 0
+            if action != ACTION_DOWN:
+                self.horizontal = action
+        return action
+
+    def on_release(self, action: int, time_ms: float) -> None:
+        """
+        キーが離されたときの処理。左右の片方を離したときに、もう片方が押されていればそちらの連続移動をやり直す。
+
+        Args:
+            action (int): 離されたキーの操作。
+            time_ms (float): 離された時刻 (ミリ秒)。
+        """
+        if action not in self.held:
+            return
+        del self.held[action]
+        if action == self.horizontal:
+            self.horizontal = ACTION_NONE
+            other: int = ACTION_RIGHT if action == ACTION_LEFT else ACTION_LEFT
+            if other in self.held:
+                self.horizontal = other
+                self.held[other] = time_ms
+                self.repeats[other] = 0
+
+    def repeat(self, time_ms: float) -> int:
+        """
+        押しっぱなしの左右とソフトドロップで、この更新で行う操作を求める。
+        1回の更新では1マスしか動かないので、間隔が更新間隔より短くても、遅れた分をまとめて動かすことはしない。
+
+        Args:
+            time_ms (float): この更新の時刻 (ミリ秒)。
+
+        Returns:
+            int: 操作。
+        """
+        action: int = ACTION_NONE
+        direction: int = self.horizontal
+        if direction != ACTION_NONE:
+            elapsed: float = time_ms - self.held[direction]
+            if elapsed >= self.das_ms:
+                count: int = 1 + int((elapsed - self.das_ms) // self.arr_ms)
+                if count > self.repeats[direction]:
+                    self.repeats[direction] = count
+                    action |= direction
+        if ACTION_DOWN in self.held:
+            count = int((time_ms - self.held[ACTION_DOWN]) // self.soft_drop_ms)
+            if count > self.repeats[ACTION_DOWN]:
+                self.repeats[ACTION_DOWN] = count
+                action |= ACTION_DOWN
+        return action
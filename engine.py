@@ -0,0 +1,1007 @@
+# KOKARISのゲームロジック。pygameを使わないので、画面なしで高速にシミュレーションできる。
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 定数
+MAX_ROW: int = 20
+MAX_COL: int = 10
+LOGIC_HZ: int = 60  # ゲームロジックの1秒あたりの更新回数 (描画のFPSとは独立)
+TICK_MS: float = 1000 / LOGIC_HZ  # ゲームロジック1回分の時間 (ミリ秒)
+# レベルごとの1マス落下にかかる時間 (ミリ秒)
+GRAVITY_MS: List[int] = [800, 717, 633, 550, 467, 383, 300, 217, 133, 100,  # level 0 to 9
+                         83, 83, 83, 67, 67, 67, 50, 50, 50, 33,  # level 10 to 19
+                         33, 33, 33, 33, 33, 33, 33, 33, 33, 17,  # level 20 to 29
+                         17, 17, 17, 17, 17, 17, 17, 17, 17, 17, 17]  # level 30 to 40
+WALL_MASK: int = 1 | (1 << (MAX_COL + 1))  # 左右の壁のビット (標準の大きさの盤面)
+FULL_ROW_MASK: int = (1 << (MAX_COL + 2)) - 1  # 壁を含めて全て埋まった行のビット (標準の大きさの盤面)
+SPAWN_COL: int = 5  # ブロックが出現する列 (標準の大きさの盤面)
+GARBAGE: int = 11  # おじゃまブロックのマスの値 (対戦モード)
+
+
+class Board:
+    """
+    テトリスのゲームボードをビットボードで表現するクラス。
+    各行を整数のビットマスク (列colがビットcolに対応) で保持し、
+    衝突判定や行の消去判定をビット演算で行う。
+    描画などのために、従来と同じ二次元リストの互換ビューも保持する。
+    また、行ごとの埋まったマスの数と列ごとの高さを、マスの書き換えと行の消去のたびに更新しておき、
+    揃った行の判定やハードドロップの落下距離を盤面全体を調べずに求められるようにする。
+    盤面の大きさはボードごとに決められる (既定はMAX_ROW x MAX_COL)。
+    """
+    def __init__(self, rows: int = MAX_ROW, cols: int = MAX_COL) -> None:
+        """
+        Boardクラスの初期化。壁を配置した空のボードを作成する。
+
+        Args:
+            rows (int): 盤面の行数 (画面外の2行と床を除く)。
+            cols (int): 盤面の列数 (左右の壁を除く)。
+        """
+        self.rows: int = rows
+        self.cols: int = cols
+        self.wall_mask: int = 1 | (1 << (cols + 1))  # 左右の壁のビット
+        self.full_mask: int = (1 << (cols + 2)) - 1  # 壁を含めて全て埋まった行のビット
+        self.cells: List[List[int]] = [[0 for _ in range(cols + 2)] for _ in range(rows + 3)]
+        self.masks: List[int] = [self.wall_mask for _ in range(rows + 3)]
+        self.row_counts: List[int] = [0] * (rows + 3)  # 行ごとの埋まったマスの数 (壁を除く)
+        self.heights: List[int] = [0] * (cols + 2)  # 列ごとの高さ (一番上の埋まったマスから床まで、空なら0)
+        # 壁の配置
+        for row in range(rows + 3):
+            self.cells[row][0] = 1
+            self.cells[row][-1] = 1
+        for col in range(cols + 2):
+            self.cells[-1][col] = 1
+        self.masks[-1] = self.full_mask
+
+    def __getitem__(self, row: int) -> List[int]:
+        """
+        互換ビュー。board[row][col] の形で各マスの値を参照できる。
+        """
+        return self.cells[row]
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def set_cell(self, row: int, col: int, value: int) -> None:
+        """
+        マスの値を書き換え、対応するビットマスク、行のマスの数、列の高さも更新する。
+        壁の内側 (2 <= row < rows + 2, 1 <= col <= cols) のマスだけに使う。
+
+        Args:
+            row (int): 行番号。
+            col (int): 列番号。
+            value (int): 書き込む値 (0は空)。
+        """
+        old: int = self.cells[row][col]
+        self.cells[row][col] = value
+        if value and not old:
+            self.masks[row] |= 1 << col
+            self.row_counts[row] += 1
+            height: int = self.rows + 2 - row
+            if height > self.heights[col]:
+                self.heights[col] = height
+        elif old and not value:
+            self.masks[row] &= ~(1 << col)
+            self.row_counts[row] -= 1
+            if self.rows + 2 - row == self.heights[col]:
+                self.heights[col] = self.column_height(col)
+
+    def column_height(self, col: int) -> int:
+        """
+        ビットマスクを上から調べて、列の高さを求める。
+
+        Args:
+            col (int): 列番号。
+
+        Returns:
+            int: 一番上の埋まったマスから床までの高さ (空なら0)。
+        """
+        bit: int = 1 << col
+        masks: List[int] = self.masks
+        for row in range(2, self.rows + 2):
+            if masks[row] & bit:
+                return self.rows + 2 - row
+        return 0
+
+    def copy(self) -> "Board":
+        """
+        ボードを複製する。
+
+        Returns:
+            Board: 同じ内容の新しいボード。
+        """
+        board: Board = Board.__new__(Board)
+        board.rows, board.cols = self.rows, self.cols
+        board.wall_mask, board.full_mask = self.wall_mask, self.full_mask
+        board.cells = list(map(list.copy, self.cells))
+        board.masks = self.masks[:]
+        board.row_counts = self.row_counts[:]
+        board.heights = self.heights[:]
+        return board
+
+    def sync(self, rows: Optional[Iterable[int]] = None) -> None:
+        """
+        互換ビューを直接書き換えた後に、ビットマスクを作り直す。
+
+        Args:
+            rows (Optional[Iterable[int]]): 作り直す行番号。Noneの場合は全ての行。
+        """
+        if rows is None:
+            rows = range(self.rows + 3)
+        for row in rows:
+            mask: int = 0
+            for col, value in enumerate(self.cells[row]):
+                if value:
+                    mask |= 1 << col
+            self.masks[row] = mask
+            self.row_counts[row] = bin(mask & ~self.wall_mask).count("1") if row < self.rows + 2 else 0
+        self.heights = [0] + [self.column_height(col) for col in range(1, self.cols + 1)] + [0]
+
+
+def spawn_col(cols: int) -> int:
+    """
+    盤面の列数から、ブロックが出現する列を求める (標準の10列では5)。
+
+    Args:
+        cols (int): 盤面の列数。
+
+    Returns:
+        int: 出現する列番号。
+    """
+    return (cols + 1) // 2
+
+
+Shape = Tuple[Tuple[int, int], ...]  # ブロックの形状 ((行オフセット, 列オフセット) のタプル)
+Kicks = Dict[Tuple[int, int], Tuple[Tuple[int, int], ...]]  # (回転前の状態, 回転後の状態) -> ずらし量のタプル
+
+
+def shape_to_masks(shape: Shape) -> Tuple[int, int, Tuple[Tuple[int, int], ...]]:
+    """
+    ブロックの形状を、行オフセットごとのビットマスクに変換する。
+    ビットは最小列オフセットを0ビット目として並べる。
+
+    Args:
+        shape (Shape): ブロックの形状。
+
+    Returns:
+        Tuple[int, int, Tuple[Tuple[int, int], ...]]: 最小列オフセット、最大列オフセット、
+            (行オフセット, ビットマスク) のタプル。
+    """
+    min_dcol: int = min(dcol for _, dcol in shape)
+    max_dcol: int = max(dcol for _, dcol in shape)
+    rows: Dict[int, int] = {}
+    for drow, dcol in shape:
+        rows[drow] = rows.get(drow, 0) | (1 << (dcol - min_dcol))
+    return min_dcol, max_dcol, tuple(sorted(rows.items()))
+
+
+def shape_bottoms(shape: Shape) -> Tuple[Tuple[int, int], ...]:
+    """
+    ブロックの形状の、列オフセットごとの一番下のマスの行オフセットを求める (落下距離の計算用)。
+
+    Args:
+        shape (Shape): ブロックの形状。
+
+    Returns:
+        Tuple[Tuple[int, int], ...]: (列オフセット, 一番下の行オフセット) のタプル。
+    """
+    bottoms: Dict[int, int] = {}
+    for drow, dcol in shape:
+        bottoms[dcol] = max(drow, bottoms.get(dcol, drow))
+    return tuple(sorted(bottoms.items()))
+
+
+def build_rotations(shapes: Tuple[Shape, ...]) -> Tuple[Tuple[Shape, ...], ...]:
+    """
+    ブロックの種類ごとに、出現時の形状から時計回りに0から3回回転した形状を求める。
+    回転の中心はSRSと同じで、Iブロックは4x4の中心、Oブロックは回転しない。
+
+    Args:
+        shapes (Tuple[Shape, ...]): 種類ごとの出現時の形状。
+
+    Returns:
+        Tuple[Tuple[Shape, ...], ...]: [種類][回転状態] -> 形状。
+    """
+    table = []
+    for block_type, shape in enumerate(shapes):
+        rotations = [shape]
+        for _ in range(3):
+            if block_type == 2:  # Iブロック
+                shape = tuple((dcol, 1 - drow) for drow, dcol in shape)
+            elif block_type != 8:  # Oブロックは回転しない
+                shape = tuple((dcol, -drow) for drow, dcol in shape)
+            rotations.append(shape)
+        table.append(tuple(rotations))
+    return tuple(table)
+
+
+def build_kicks(srs_table: Kicks) -> Kicks:
+    """
+    SRSの壁蹴りの表 ((x, y)、yは上向き) を、(行, 列) のずらし量に変換する。
+
+    Args:
+        srs_table (Kicks): (回転前の状態, 回転後の状態) -> (x, y) のタプル。
+
+    Returns:
+        Kicks: (回転前の状態, 回転後の状態) -> (行, 列) のタプル。
+    """
+    return {key: tuple((-y, x) for x, y in kicks) for key, kicks in srs_table.items()}
+
+
+class Block:
+    """
+    テトリスのブロックを表現するクラス。
+    形状、位置、落下速度などを管理する。
+    形状と衝突判定用のビットマスクは、種類と回転状態ごとにクラスで一度だけ作っておき、
+    インスタンスは回転状態 (0: 出現時, 1: 右, 2: 逆, 3: 左) だけを持つ。
+    """
+    __slots__ = ("block_type", "rotation", "shape", "min_dcol", "max_dcol", "row_masks", "bottoms",
+                 "row", "col", "count", "last_rotated", "last_kick")
+
+    # 出現時の形状 ((行オフセット, 列オフセット) のタプル)
+    SHAPES: Tuple[Shape, ...] = ((), (),  # empty block and wall
+                                 ((0, -1), (0, 0), (0, 1), (0, 2)),  # I block
+                                 ((-1, -1), (0, -1), (0, 0), (0, 1)),  # J block
+                                 ((0, -1), (0, 0), (0, 1), (-1, 1)),  # L block
+                                 ((0, -1), (0, 0), (-1, 0), (-1, 1)),  # S block
+                                 ((-1, -1), (-1, 0), (0, 0), (0, 1)),  # Z block
+                                 ((0, -1), (0, 0), (-1, 0), (0, 1)),  # T block
+                                 ((0, 0), (-1, 0), (0, 1), (-1, 1)))  # square
+    # [種類][回転状態] -> 形状
+    ROTATIONS = build_rotations(SHAPES)
+    # [種類][回転状態] -> (最小列オフセット, 最大列オフセット, 行ごとのビットマスク)
+    MASKS = tuple(tuple(shape_to_masks(shape) if shape else (0, 0, ()) for shape in rotations)
+                  for rotations in ROTATIONS)
+    # [種類][回転状態] -> 列ごとの一番下のマスの行オフセット
+    BOTTOMS = tuple(tuple(shape_bottoms(shape) for shape in rotations) for rotations in ROTATIONS)
+    # SRSの壁蹴り (Iブロック以外)
+    KICKS = build_kicks({
+        (0, 1): ((0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)),
+        (1, 0): ((0, 0), (1, 0), (1, -1), (0, 2), (1, 2)),
+        (1, 2): ((0, 0), (1, 0), (1, -1), (0, 2), (1, 2)),
+        (2, 1): ((0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)),
+        (2, 3): ((0, 0), (1, 0), (1, 1), (0, -2), (1, -2)),
+        (3, 2): ((0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)),
+        (3, 0): ((0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)),
+        (0, 3): ((0, 0), (1, 0), (1, 1), (0, -2), (1, -2)),
+    })
+    # SRSの壁蹴り (Iブロック)
+    KICKS_I = build_kicks({
+        (0, 1): ((0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)),
+        (1, 0): ((0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)),
+        (1, 2): ((0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)),
+        (2, 1): ((0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)),
+        (2, 3): ((0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)),
+        (3, 2): ((0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)),
+        (3, 0): ((0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)),
+        (0, 3): ((0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)),
+    })
+    # Tブロックの回転状態ごとの、向いている側の角 (T-spinの判定用)
+    T_FRONT_CORNERS = (((-1, -1), (-1, 1)), ((-1, 1), (1, 1)), ((1, -1), (1, 1)), ((-1, -1), (1, -1)))
+
+    def __init__(self, block_type: int, col: int = SPAWN_COL) -> None:
+        """
+        Blockクラスの初期化。
+
+        Args:
+            block_type (int): ブロックの種類 (2から8までの整数)。
+            col (int): 出現する列 (盤面の大きさを変えた場合は、その中央)。
+        """
+        self.block_type: int = block_type
+        self.set_rotation(0)
+        self.row: int = 1  # 初期位置 (行)
+        self.col: int = col  # 初期位置 (列)
+        self.count: int = 0  # 落下処理のためのカウンター
+        self.last_rotated: bool = False  # 最後に成功した操作が回転かどうか (T-spinの判定用)
+        self.last_kick: int = 0  # 最後の回転で使った壁蹴りの番号
+
+    def copy(self) -> "Block":
+        """
+        ブロックを複製する (形状などの表はクラスのものを共有する)。
+
+        Returns:
+            Block: 同じ種類、回転状態、位置の新しいブロック。
+        """
+        block: Block = Block.__new__(Block)
+        for name in self.__slots__:
+            setattr(block, name, getattr(self, name))
+        return block
+
+    def set_rotation(self, rotation: int) -> None:
+        """
+        回転状態を変え、形状と衝突判定用のビットマスクを表から取り出す。
+
+        Args:
+            rotation (int): 回転状態 (0から3)。
+        """
+        self.rotation: int = rotation
+        self.shape: Shape = self.ROTATIONS[self.block_type][rotation]
+        self.min_dcol, self.max_dcol, self.row_masks = self.MASKS[self.block_type][rotation]
+        self.bottoms: Tuple[Tuple[int, int], ...] = self.BOTTOMS[self.block_type][rotation]
+
+    def move(self, board: Board, direction: int) -> None:
+        """
+        ブロックを指定された方向に移動させる。
+
+        Args:
+            board (Board): ゲームボードの状態。
+            direction (int): 移動方向 (0: 下, 1: 左, 2: 右)。
+        """
+        if direction == 0 and self.moveable(board, [1, 0]):
+            self.row += 1
+        elif direction == 1 and self.moveable(board, [0, -1]):
+            self.col -= 1
+        elif direction == 2 and self.moveable(board, [0, 1]):
+            self.col += 1
+        else:
+            return
+        self.last_rotated = False
+
+    def moveable(self, board: Board, direction: List[int]) -> bool:
+        """
+        指定された方向にブロックが移動可能かどうかを判定する。
+
+        Args:
+            board (Board): ゲームボードの状態。
+            direction (List[int]): 移動方向のオフセット ([delta_row, delta_col])。
+
+        Returns:
+            bool: 移動可能であればTrue、不可能であればFalse。
+        """
+        drow, dcol = direction
+
+        left: int = self.col + dcol + self.min_dcol
+        if left < 0 or self.col + dcol + self.max_dcol >= board.cols + 2:
+            return False
+        base_row: int = self.row + drow
+        masks: List[int] = board.masks
+        n_rows: int = len(masks)
+        for row_offset, bits in self.row_masks:
+            row: int = base_row + row_offset
+            if not 0 <= row < n_rows or masks[row] & (bits << left):
+                return False
+
+        return True
+
+    def rotate(self, board: Board, direction: int) -> bool:
+        """
+        ブロックを指定された方向に回転させる。どの壁蹴りでも置けない場合は回転しない。
+
+        Args:
+            board (Board): ゲームボードの状態。
+            direction (int): 回転方向 (0: 時計回り, 1: 反時計回り)。
+
+        Returns:
+            bool: 回転できた場合はTrue。
+        """
+        # Oブロックは回転しない
+        if self.block_type == 8:
+            return False
+        old_rotation: int = self.rotation
+        self.set_rotation((old_rotation + (1 if direction == 0 else 3)) % 4)
+        if self.rotate_correction(board, old_rotation):
+            self.last_rotated = True
+            return True
+        self.set_rotation(old_rotation)
+        return False
+
+    def rotate_correction(self, board: Board, old_rotation: int) -> bool:
+        """
+        回転後のブロックの位置を、SRSの壁蹴りの表の順に試して補正する。
+        試すのは表にある最大5か所だけで、どこにも置けなければFalseを返す。
+
+        Args:
+            board (Board): ゲームボードの状態。
+            old_rotation (int): 回転前の回転状態。
+
+        Returns:
+            bool: 補正できた場合はTrue。
+        """
+        kicks = self.KICKS_I if self.block_type == 2 else self.KICKS
+        for index, direction in enumerate(kicks[(old_rotation, self.rotation)]):
+            if self.moveable(board, direction):
+                self.row += direction[0]
+                self.col += direction[1]
+                self.last_kick = index
+                return True
+        return False
+
+    def tspin(self, board: Board) -> int:
+        """
+        T-spinかどうかを判定する。固定する直前に呼び出す。
+        最後の操作が回転で、Tブロックの中心の斜め4マスのうち3マス以上が埋まっていればT-spin。
+        向いている側の角が1つ空いている場合はT-spin mini (ただし最後の壁蹴りを使った場合はT-spin)。
+
+        Args:
+            board (Board): ゲームボードの状態。
+
+        Returns:
+            int: 0: T-spinではない, 1: T-spin mini, 2: T-spin。
+        """
+        if self.block_type != 7 or not self.last_rotated:
+            return 0
+
+        def filled(drow: int, dcol: int) -> bool:
+            row: int = self.row + drow
+            col: int = self.col + dcol
+            return not (0 <= row < board.rows + 3 and 0 <= col < board.cols + 2) or board.masks[row] >> col & 1 == 1
+
+        corners: int = sum(filled(drow, dcol) for drow in (-1, 1) for dcol in (-1, 1))
+        if corners < 3:
+            return 0
+        front: int = sum(filled(drow, dcol) for drow, dcol in self.T_FRONT_CORNERS[self.rotation])
+        if front == 2 or self.last_kick == 4:
+            return 2
+        return 1
+
+    def drop(self, board: Board, fall_ticks: int) -> int:
+        """
+        ブロックを時間経過によって下方向に落下させる。ゲームロジックの更新ごとに1回呼び出す。
+
+        Args:
+            board (Board): ゲームボードの状態。
+            fall_ticks (int): 1マス落下するまでの更新回数 (fall_ticks回目の更新で1マス落ちる)。
+
+        Returns:
+            int: 落下しなかった場合は0、新しいブロックを作成する必要がある場合は1。
+        """
+        self.count += 1
+        if self.count < fall_ticks:
+            return 0
+        elif self.moveable(board, [1, 0]):
+            self.count = 0
+            self.row += 1
+            self.last_rotated = False
+            return 0
+        else:
+            return 1 # 新しいブロックを作成
+
+    def drop_distance(self, board: Board) -> int:
+        """
+        ブロックをまっすぐ下に落とせるマス数を求める (ゴーストとハードドロップ用)。
+        ブロックがどの列でも一番上の埋まったマスより上にあれば、列の高さだけから求まる。
+        張り出しの下に入り込んでいる場合だけ、1マスずつ判定する。
+
+        Args:
+            board (Board): ゲームボードの状態。
+
+        Returns:
+            int: 落とせるマス数。
+        """
+        heights: List[int] = board.heights
+        floor: int = board.rows + 2
+        distance: int = floor
+        for dcol, bottom in self.bottoms:
+            lowest: int = self.row + bottom  # この列のブロックの一番下のマス
+            top: int = floor - heights[self.col + dcol]  # この列の一番上の埋まったマス (空なら床)
+            if lowest >= top:
+                distance = 0
+                while self.moveable(board, [distance + 1, 0]):
+                    distance += 1
+                return distance
+            if top - 1 - lowest < distance:
+                distance = top - 1 - lowest
+        return distance
+
+    def place(self, board: Board) -> int:
+        """
+        ブロックをゲームボードに固定する。
+
+        Args:
+            board (Board): ゲームボードの状態。
+
+        Returns:
+            int: ブロックが画面外に固定された場合は1 (ゲームオーバー)、正常に固定された場合は0。
+        """
+        for drow, dcol in self.shape:
+            row: int = self.row + drow
+            col: int = self.col + dcol
+            if not (2 <= row < board.rows + 2 and 1 <= col < board.cols + 1):  # 固定されたブロックが画面外
+                return 1
+            board.set_cell(row, col, self.block_type)
+        return 0
+
+
+class Score:
+    def __init__(self):
+        self.cleared_row = 0
+        self.score = 0
+        self.level = 0
+        self.score_table = [0, 80, 100, 300, 1200]
+        # T-spinの得点 ([0]: T-spinではない, [1]: T-spin mini, [2]: T-spin)
+        self.tspin_table = [self.score_table, [100, 200, 400], [400, 800, 1200, 1600]]
+        self.level_up = [2, 5, 8, 12, 16, 20, 25, 30, 35, 40, # level 0 to 9
+                         46, 52, 58, 64, 70, 77, 84, 91, 98, 105, # level 10 to 19
+                         112, 120, 128, 136, 144, 152, 160, 168, 177, 186, # level 20 to 29
+                         195, 204, 213, 222, 231, 240, 255, 270, 285, 300, 1000] # 30 to 40
+        
+    def update(self, count, tspin=0):
+        self.score += self.tspin_table[tspin][count]*(self.level+1)
+        self.cleared_row += count
+        
+        if self.level < 40 and self.level_up[self.level] <= self.cleared_row: # level 40 is max
+            self.level += 1
+
+
+def gravity_ticks(level: int) -> int:
+    """
+    レベルに応じた、1マス落下するまでのゲームロジックの更新回数を求める。
+
+    Args:
+        level (int): 現在のレベル。
+
+    Returns:
+        int: 1マス落下するまでの更新回数 (1以上)。
+    """
+    return max(1, round(GRAVITY_MS[min(level, len(GRAVITY_MS) - 1)] / TICK_MS))
+
+# ブロックとボードの初期化
+def initialize_game(rng: Optional[random.Random] = None,
+                    rows: int = MAX_ROW, cols: int = MAX_COL) -> Tuple[Board, Block]:
+    """
+    ゲームの初期化を行う。ゲームボードと最初のブロックを作成する。
+
+    Args:
+        rng (Optional[random.Random]): ブロックの種類を決める乱数生成器。Noneの場合はrandomモジュールを使う。
+        rows (int): 盤面の行数。
+        cols (int): 盤面の列数。
+
+    Returns:
+        Tuple[Board, Block]: 初期化されたゲームボードと最初のブロック。
+    """
+    board: Board = Board(rows, cols)  # 壁の配置はBoardのコンストラクタで行う
+
+    block_type: int = (rng or random).randint(2, 8)
+    block: Block = Block(block_type, spawn_col(cols))
+
+    return board, block
+
+# 入力　ボード
+# 出力　消える行数、消える行の番号
+def find_deleting_row(board: Board, rows: Optional[Iterable[int]] = None) -> Tuple[int, List[int]]:
+    """
+    消去する行を探索する。行ごとの埋まったマスの数で判定する。
+
+    Args:
+        board (Board): ゲームボードの状態。
+        rows (Optional[Iterable[int]]): 調べる行番号 (固定したブロックのある行など、昇順で重複なし)。
+            Noneの場合は全ての行。
+
+    Returns:
+        Tuple[int, List[int]]: 消去される行数と、それらの行番号のリスト (上から順)。
+    """
+    row_counts: List[int] = board.row_counts
+    floor: int = board.rows + 2
+    cols: int = board.cols
+    if rows is None:
+        row_numbers: List[int] = [row for row in range(2, floor) if row_counts[row] == cols]
+    else:
+        row_numbers = [row for row in rows if 2 <= row < floor and row_counts[row] == cols]
+    return len(row_numbers), row_numbers
+
+
+# 行を詰める
+# 入力　ボード、消す行番号
+# 出力　なし
+def clear_rows(board: Board, row_number: List[int]) -> None:
+    """
+    指定された行を削除し、上の行を詰める。
+    下の行から順に、残る行を1回だけ移動先へ動かす (行のリスト、ビットマスク、マスの数をそのまま付け替える)。
+
+    Args:
+        board (Board): ゲームボードの状態。
+        row_number (List[int]): 削除する行番号のリスト。
+    """
+    if not row_number:
+        return
+    deleting = set(row_number)
+    cells: List[List[int]] = board.cells
+    masks: List[int] = board.masks
+    row_counts: List[int] = board.row_counts
+    floor: int = board.rows + 2
+    write: int = floor - 1  # 次に残る行を置く位置
+    for row in range(floor - 1, -1, -1):
+        if row in deleting:
+            continue
+        if write != row:
+            cells[write] = cells[row]
+            masks[write] = masks[row]
+            row_counts[write] = row_counts[row]
+        write -= 1
+    # 上に空いた行を空の行にする
+    for row in range(write, -1, -1):
+        cells[row] = [1] + [0] * board.cols + [1]
+        masks[row] = board.wall_mask
+        row_counts[row] = 0
+
+    # 列の高さ: 消した行は全ての列で埋まっているので、一番上の消した行より上にマスがある列は、消した行数だけ低くなる。
+    # 一番上の消した行がその列の一番上のマスだった列だけ、詰めた後の盤面から求め直す
+    heights: List[int] = board.heights
+    top_deleted: int = floor - min(deleting)  # 一番上の消した行の高さ
+    count: int = len(deleting)
+    for col in range(1, board.cols + 1):
+        if heights[col] > top_deleted:
+            heights[col] -= count
+        else:
+            heights[col] = board.column_height(col)
+
+
+def add_garbage(board: Board, lines: int, hole_col: int) -> bool:
+    """
+    ボードの下からおじゃまブロックの行を押し上げる (対戦モード用)。
+    おじゃまブロックの行は、hole_colの列だけが空いている。
+
+    Args:
+        board (Board): ゲームボードの状態。
+        lines (int): 押し上げる行数。
+        hole_col (int): 穴の列番号 (1から盤面の列数)。
+
+    Returns:
+        bool: 押し上げたブロックが画面の上にはみ出した場合はFalse (ゲームオーバー)。
+    """
+    if lines <= 0:
+        return True
+    floor: int = board.rows + 2
+    overflow: bool = max(board.heights) + lines > board.rows
+    lines = min(lines, board.rows)
+    cells: List[List[int]] = board.cells
+    masks: List[int] = board.masks
+    row_counts: List[int] = board.row_counts
+    # 上の行から順に、lines行上へ付け替える (画面外にはみ出す行は捨てる)
+    for row in range(2, floor - lines):
+        cells[row] = cells[row + lines]
+        masks[row] = masks[row + lines]
+        row_counts[row] = row_counts[row + lines]
+    for row in range(floor - lines, floor):
+        cells[row] = [1] + [GARBAGE] * board.cols + [1]
+        cells[row][hole_col] = 0
+        masks[row] = board.full_mask & ~(1 << hole_col)
+        row_counts[row] = board.cols - 1
+
+    heights: List[int] = board.heights
+    for col in range(1, board.cols + 1):
+        if overflow or col == hole_col:  # はみ出して捨てたマスがある場合は求め直す
+            heights[col] = board.column_height(col)
+        else:
+            heights[col] = heights[col] + lines if heights[col] else lines
+    return not overflow
+
+
+# 操作 (ビットフラグなので、同じ更新で複数の操作を組み合わせられる)
+ACTION_NONE: int = 0
+ACTION_LEFT: int = 1
+ACTION_RIGHT: int = 2
+ACTION_DOWN: int = 4
+ACTION_ROTATE_CW: int = 8  # 時計回り
+ACTION_ROTATE_CCW: int = 16  # 反時計回り
+ACTION_HOLD: int = 32
+ACTION_HARD_DROP: int = 64  # 一番下まで落として、すぐに固定する
+
+# Game.stepが返すイベントの名前
+EVENT_SPAWN: str = "spawn"  # 値: ブロックの種類
+EVENT_HOLD: str = "hold"  # 値: ホールドしたブロックの種類
+EVENT_MOVE: str = "move"  # 値: 左右に動いたマス数 (負の値は左)
+EVENT_ROTATE: str = "rotate"  # 値: 回転後の回転状態
+EVENT_LOCK: str = "lock"  # 値: 固定したブロックの種類
+EVENT_LINE_CLEAR: str = "line_clear"  # 値: 消した行番号のリスト
+EVENT_LEVEL_UP: str = "level_up"  # 値: 新しいレベル
+EVENT_TSPIN: str = "tspin"  # 値: (1: T-spin mini / 2: T-spin, 消した行数)
+EVENT_GARBAGE: str = "garbage"  # 値: 押し上げられたおじゃまブロックの行数
+EVENT_GAME_OVER: str = "game_over"  # 値: 原因 ("lock_out": 画面外に固定, "block_out": 出現位置が埋まっている,
+#                                      "top_out": おじゃまブロックで画面の上にはみ出した)
+
+
+class Game:
+    """
+    1人分のゲームを進めるクラス。
+    ボード、落下中のブロック、ホールド、次のブロック、スコアを持ち、
+    step(action) を呼ぶたびにゲームロジックを1回 (TICK_MS) 進める。
+    行が揃ったときは、clear_ticks回の更新の間「行消去中」の状態になり (画面側のアニメーション用)、
+    その間に押された回転とホールドは覚えておいて、次のブロックの出現直後に反映する。
+    """
+    BUFFERED_ACTIONS: int = ACTION_HOLD | ACTION_ROTATE_CW | ACTION_ROTATE_CCW  # 行消去中に覚えておく操作
+    PIECE_BATCH: int = 16  # 乱数からまとめて引いておくブロックの種類の数 (順番は1つずつ引く場合と同じ)
+
+    def __init__(self, seed: Optional[int] = None, clear_ticks: int = 0,
+                 rows: int = MAX_ROW, cols: int = MAX_COL) -> None:
+        """
+        Gameクラスの初期化。
+
+        Args:
+            seed (Optional[int]): 乱数のシード。Noneの場合は毎回異なるゲームになる。
+            clear_ticks (int): 行消去中の状態が続く更新回数。0の場合はすぐに行を詰める。
+            rows (int): 盤面の行数。
+            cols (int): 盤面の列数。
+        """
+        self.clear_ticks: int = clear_ticks
+        self.rows: int = rows
+        self.cols: int = cols
+        self.spawn_col: int = spawn_col(cols)  # ブロックが出現する列
+        self.reset(seed)
+
+    def reset(self, seed: Optional[int] = None) -> Dict:
+        """
+        ゲームを最初からやり直す。
+
+        Args:
+            seed (Optional[int]): 乱数のシード。同じシードなら同じ順番でブロックが出現する。
+                Noneの場合はシードを乱数で決める (スナップショットから再開できるように、シードは必ず持っておく)。
+
+        Returns:
+            Dict: ゲームの状態 (stateと同じ)。
+        """
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed: int = seed
+        self.rng: random.Random = random.Random(seed)
+        self.rng_shared: bool = False  # cloneしたゲームと乱数生成器を共有しているかどうか
+        self.upcoming: List[int] = []  # まとめて引いておいたブロックの種類 (末尾から使う)
+        self.board, block = initialize_game(self.rng, self.rows, self.cols)
+        self.draws: int = 1  # 乱数生成器からブロックの種類を引いた回数
+        self.block: Optional[Block] = block  # 落下中のブロック (行消去中はNone)
+        self.next_block_type: int = self.draw_block_type()
+        self.hold_block: Optional[Block] = None
+        self.can_hold: bool = True
+        self.record: Score = Score()
+        self.tick: int = 0  # これまでの更新回数
+        self.game_over: bool = False
+        self.clearing_rows: List[int] = []  # 消去中の行番号 (行消去中でなければ空)
+        self.clear_timer: int = 0  # 行消去中の状態が終わるまでの更新回数
+        self.buffered_action: int = ACTION_NONE  # 行消去中に押された操作
+        self.pending_garbage: List[Tuple[int, int]] = []  # 受け取って、まだ押し上げていない (行数, 穴の列)
+        return self.state()
+
+    def draw_block_type(self) -> int:
+        """
+        次に出現するブロックの種類を引く。PIECE_BATCH個ずつまとめて乱数から引いておく。
+        乱数生成器をcloneしたゲームと共有している場合は、引く前に複製する (共有している間は複製しない)。
+
+        Returns:
+            int: ブロックの種類 (2から8)。
+        """
+        if not self.upcoming:
+            if self.rng_shared:
+                rng: random.Random = random.Random()
+                rng.setstate(self.rng.getstate())
+                self.rng = rng
+                self.rng_shared = False
+            randint = self.rng.randint
+            self.upcoming = [randint(2, 8) for _ in range(self.PIECE_BATCH)]
+            self.upcoming.reverse()
+            self.draws += self.PIECE_BATCH
+        return self.upcoming.pop()
+
+    def clone(self) -> "Game":
+        """
+        ゲームを複製する (先読みや取り消しのため)。copy.deepcopyより大幅に速い。
+        ボードは行のリストとビットマスクを複製し、乱数生成器は次にまとめて引くときまで共有する。
+
+        Returns:
+            Game: 同じ状態の新しいゲーム。元のゲームと独立に進められる。
+        """
+        game: Game = Game.__new__(Game)
+        game.__dict__.update(self.__dict__)
+        game.board = self.board.copy()
+        game.block = self.block.copy() if self.block is not None else None
+        game.hold_block = self.hold_block.copy() if self.hold_block is not None else None
+        game.record = Score.__new__(Score)
+        game.record.__dict__.update(self.record.__dict__)  # 得点の表は変更しないので共有する
+        game.upcoming = self.upcoming[:]
+        game.clearing_rows = self.clearing_rows[:]
+        game.pending_garbage = self.pending_garbage[:]
+        self.rng_shared = game.rng_shared = True
+        return game
+
+    def state(self) -> Dict:
+        """
+        ゲームの状態を返す。値はコピーせずにそのまま参照する。
+
+        Returns:
+            Dict: ボード、ブロック、スコアなどの辞書。
+        """
+        return {
+            "board": self.board,
+            "block": self.block,
+            "next_block_type": self.next_block_type,
+            "hold_block": self.hold_block,
+            "record": self.record,
+            "tick": self.tick,
+            "clearing_rows": self.clearing_rows,
+            "game_over": self.game_over,
+            "pending_garbage": self.pending_garbage,
+        }
+
+    def step(self, action: int = ACTION_NONE) -> Tuple[Dict, List[Tuple[str, object]]]:
+        """
+        操作を反映して、ゲームロジックを1回進める。
+
+        Args:
+            action (int): 操作 (ACTION_* の組み合わせ)。
+
+        Returns:
+            Tuple[Dict, List[Tuple[str, object]]]: ゲームの状態と、この更新で起きたイベントのリスト。
+        """
+        events: List[Tuple[str, object]] = []
+        if self.game_over:
+            return self.state(), events
+        self.tick += 1
+        board: Board = self.board
+
+        # 行消去中は操作を覚えておくだけにする
+        if self.clear_timer > 0:
+            self.buffered_action |= action & self.BUFFERED_ACTIONS
+            self.clear_timer -= 1
+            if self.clear_timer == 0:
+                clear_rows(board, self.clearing_rows)
+                self.clearing_rows = []
+                self.spawn(events)
+            return self.state(), events
+
+        if action & ACTION_HOLD:
+            self.hold(events)
+        self.rotate(action, events)
+        if action & ACTION_DOWN:
+            self.block.move(board, 0)
+        if action & (ACTION_LEFT | ACTION_RIGHT):
+            col: int = self.block.col
+            if action & ACTION_LEFT:
+                self.block.move(board, 1)
+            if action & ACTION_RIGHT:
+                self.block.move(board, 2)
+            if self.block.col != col:
+                events.append((EVENT_MOVE, self.block.col - col))
+        if action & ACTION_HARD_DROP:
+            distance: int = self.block.drop_distance(board)
+            if distance > 0:
+                self.block.row += distance
+                self.block.last_rotated = False
+            self.lock(events)
+            return self.state(), events
+
+        # ブロックの落下処理 (レベルが上がるほど速く落ちる)
+        if self.block.drop(board, gravity_ticks(self.record.level)) == 1:
+            self.lock(events)
+        return self.state(), events
+
+    def rotate(self, action: int, events: List[Tuple[str, object]]) -> None:
+        """
+        操作に含まれる回転を行う。
+
+        Args:
+            action (int): 操作 (ACTION_* の組み合わせ)。
+            events (List[Tuple[str, object]]): 起きたイベントを追加するリスト。
+        """
+        if action & ACTION_ROTATE_CCW and self.block.rotate(self.board, 1):
+            events.append((EVENT_ROTATE, self.block.rotation))
+        if action & ACTION_ROTATE_CW and self.block.rotate(self.board, 0):
+            events.append((EVENT_ROTATE, self.block.rotation))
+
+    def hold(self, events: List[Tuple[str, object]]) -> None:
+        """
+        落下中のブロックをホールドする。1つのブロックにつき1回だけ行える。
+
+        Args:
+            events (List[Tuple[str, object]]): 起きたイベントを追加するリスト。
+        """
+        if not self.can_hold:
+            return
+        if self.hold_block is None:
+            self.hold_block = self.block
+            self.block = Block(self.next_block_type, self.spawn_col)
+            self.next_block_type = self.draw_block_type()
+        else:
+            self.hold_block, self.block = self.block, self.hold_block
+        self.block.row, self.block.col = 1, self.spawn_col
+        self.can_hold = False
+        events.append((EVENT_HOLD, self.hold_block.block_type))
+
+    def lock(self, events: List[Tuple[str, object]]) -> None:
+        """
+        落下中のブロックを固定し、揃った行を消して次のブロックを出現させる。
+
+        Args:
+            events (List[Tuple[str, object]]): 起きたイベントを追加するリスト。
+        """
+        board: Board = self.board
+        tspin: int = self.block.tspin(board)
+        if self.block.place(board) == 1:
+            self.game_over = True
+            events.append((EVENT_GAME_OVER, "lock_out"))
+            return
+        events.append((EVENT_LOCK, self.block.block_type))
+
+        # 揃う可能性があるのは、固定したブロックのある行だけ (row_masksは行オフセットの昇順)
+        count, row_numbers = find_deleting_row(board, [self.block.row + drow for drow, _ in self.block.row_masks])
+        if count > 0:
+            events.append((EVENT_LINE_CLEAR, row_numbers))
+        if tspin:
+            events.append((EVENT_TSPIN, (tspin, count)))
+        if count > 0 or tspin:
+            level: int = self.record.level
+            self.record.update(count, tspin)
+            if self.record.level != level:
+                events.append((EVENT_LEVEL_UP, self.record.level))
+
+        if count > 0 and self.clear_ticks > 0:
+            # 行消去中の状態に入る (行はアニメーションが終わってから詰める)
+            self.block = None
+            self.clearing_rows = row_numbers
+            self.clear_timer = self.clear_ticks
+            return
+        if count > 0:
+            clear_rows(board, row_numbers)
+        elif self.pending_garbage:
+            # 行を消さなかったときだけ、受け取ったおじゃまブロックを押し上げる
+            self.apply_garbage(events)
+            if self.game_over:
+                return
+        self.spawn(events)
+
+    def receive_garbage(self, lines: int, hole_col: int) -> None:
+        """
+        相手から送られたおじゃまブロックを受け取る。次に行を消さずにブロックを固定したときに押し上げる。
+
+        Args:
+            lines (int): 行数。
+            hole_col (int): 穴の列番号 (1から盤面の列数)。
+        """
+        if lines > 0:
+            self.pending_garbage.append((lines, hole_col))
+
+    def cancel_garbage(self, lines: int) -> int:
+        """
+        受け取ったおじゃまブロックを、こちらが送る行数で相殺する。
+
+        Args:
+            lines (int): こちらが送る行数。
+
+        Returns:
+            int: 相殺した後に、相手に送る行数。
+        """
+        while lines > 0 and self.pending_garbage:
+            pending, hole_col = self.pending_garbage[0]
+            if pending > lines:
+                self.pending_garbage[0] = (pending - lines, hole_col)
+                return 0
+            lines -= pending
+            self.pending_garbage.pop(0)
+        return lines
+
+    def apply_garbage(self, events: List[Tuple[str, object]]) -> None:
+        """
+        受け取ったおじゃまブロックを全て押し上げる。
+
+        Args:
+            events (List[Tuple[str, object]]): 起きたイベントを追加するリスト。
+        """
+        total: int = 0
+        for lines, hole_col in self.pending_garbage:
+            total += lines
+            if not add_garbage(self.board, lines, hole_col):
+                self.game_over = True
+        self.pending_garbage = []
+        events.append((EVENT_GARBAGE, total))
+        if self.game_over:
+            events.append((EVENT_GAME_OVER, "top_out"))
+
+    def spawn(self, events: List[Tuple[str, object]]) -> None:
+        """
+        次のブロックを出現させる。行消去中に押された回転とホールドはここで反映する。
+
+        Args:
+            events (List[Tuple[str, object]]): 起きたイベントを追加するリスト。
+        """
+        board: Board = self.board
+        self.block = Block(self.next_block_type, self.spawn_col)
+        self.next_block_type = self.draw_block_type()
+        self.can_hold = True
+        events.append((EVENT_SPAWN, self.block.block_type))
+
+        action: int = self.buffered_action
+        self.buffered_action = ACTION_NONE
+        if action & ACTION_HOLD:
+            self.hold(events)
+        self.rotate(action, events)
+
+        if not self.block.moveable(board, [0, 0]):
+            self.game_over = True
+            events.append((EVENT_GAME_OVER, "block_out"))
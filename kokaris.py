@@ -1,330 +1,535 @@
 import pygame
 from pygame.locals import *
 import sys
+import time
 import random
-import copy
-from typing import List, Tuple
+import argparse
+import atexit
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
 from pathlib import Path
 
+from engine import (MAX_ROW, MAX_COL, TICK_MS, Board, Block, Score, Game,
+                    ACTION_NONE, ACTION_LEFT, ACTION_RIGHT, ACTION_DOWN, ACTION_ROTATE_CW, ACTION_ROTATE_CCW,
+                    ACTION_HOLD, ACTION_HARD_DROP, EVENT_GAME_OVER)
+from ai import AutoPlayer
+from assets import Assets
+from replay import Replay, Recorder, Player
+from profiler import Profiler
+from controls import Controls, DAS_MS, ARR_MS, SOFT_DROP_MS
+from sound import SoundEffects
+from telemetry import Telemetry
+from netplay import Connection, VersusSession, DEFAULT_PORT, MSG_HELLO, MSG_BYE, encode_hello, decode_hello
+import engine
+import sound
+import snapshot
+
 # 定数
-MAX_ROW: int = 20
-MAX_COL: int = 10
 BLOCK_SIZE: int = 35
 GRID_OFFSET_X: int = 30
 GRID_OFFSET_Y: int = 30
 BOARD_OFFSET_X = 30
 BOARD_OFFSET_Y = 30
-FALL_SPEED: int = 60  # 初期落下速度 (フレーム数)
-
-class Block:
+MAX_TICKS_PER_FRAME: int = 5  # 描画が遅れたときに1フレームで追いつく最大の更新回数
+MAX_FPS: int = 120  # 描画の上限FPS (0は上限なし)
+BACKGROUND_FPS: int = 15  # ウィンドウが非アクティブで一時停止できないとき (対戦中) の描画の上限FPS
+IDLE_TIMEOUT_MS: int = 1000  # 待ち画面で、イベントがなくても目を覚ます間隔 (ミリ秒)
+PAUSE_KEY: int = K_p  # 一時停止と再開のキー
+SAVE_PATH: str = "save.kks"  # 途中でやめたゲームの保存先 (--resume で続きから遊べる)
+TELEMETRY_PATH: str = "telemetry.db"  # テレメトリとハイスコアの保存先 (--telemetry で有効)
+FRAME_SPIKE_MS: int = round(TICK_MS * 2)  # これより長くかかったフレームをテレメトリに記録する (ミリ秒)
+CLEAR_TICKS: int = round(120 / TICK_MS)  # 行消去アニメーションの長さ (約120ミリ秒分の更新回数)
+GHOST_COLOR: int = 10  # ゴースト (落下地点) の色 (block_colorの番号)
+ZOOM_SIZES: Tuple[int, ...] = (BLOCK_SIZE, 28, 21, 14, 10, 7, 5, 3)  # 拡大率ごとの1マスの大きさ (ピクセル)
+# キーと操作の対応
+KEY_ACTIONS: Dict[int, int] = {
+    K_LEFT: ACTION_LEFT, K_RIGHT: ACTION_RIGHT, K_DOWN: ACTION_DOWN, K_UP: ACTION_HARD_DROP,
+    K_LSHIFT: ACTION_HOLD,
+    K_a: ACTION_ROTATE_CCW, K_SPACE: ACTION_ROTATE_CCW,  # 反時計回り
+    K_s: ACTION_ROTATE_CW,  # 時計回り
+}
+
+
+class TextCache:
     """
-    テトリスのブロックを表現するクラス。
-    形状、位置、落下速度などを管理する。
+    フォントと文字列の描画結果をキャッシュするクラス。
+    フォントは大きさごとに一度だけ読み込み、同じ文字列は一度だけrenderする。
+    数字は0から9の画像 (グリフアトラス) を並べて描くので、値が変わってもrenderし直さない。
     """
-    def __init__(self, block_type: int) -> None:
-        """
-        Blockクラスの初期化。
+    MAX_TEXTS: int = 256  # キャッシュする文字列画像の上限
 
-        Args:
-            block_type (int): ブロックの種類 (2から8までの整数)。
+    def __init__(self) -> None:
         """
-        self.shapes: List[List[List[int]]] = [[], [],  # empty block and wall
-                                                [[0, -1], [0, 0], [0, 1], [0, 2]],  # I block
-                                                [[-1, -1], [0, -1], [0, 0], [0, 1]],  # J block
-                                                [[0, -1], [0, 0], [0, 1], [-1, 1]],  # L block
-                                                [[0, -1], [0, 0], [-1, 0], [-1, 1]],  # S blosk
-                                                [[-1, -1], [-1, 0], [0, 0], [0, 1]],  # Z block
-                                                [[0, -1], [0, 0], [-1, 0], [0, 1]],  # T block
-                                                [[0, 0], [-1, 0], [0, 1], [-1, 1]]]  # square
-
-        self.block_type: int = block_type
-        self.shape: List[List[int]] = copy.deepcopy(self.shapes[block_type])
-        self.row: int = 1  # 初期位置 (行)
-        self.col: int = 5  # 初期位置 (列)
-        self.count: int = 0  # 落下処理のためのカウンター
+        TextCacheクラスの初期化。フォントは最初に使われたときに読み込む。
+        """
+        self.fonts: Dict[int, pygame.font.Font] = {}
+        self.texts: Dict[Tuple[str, int, Tuple[int, int, int]], pygame.Surface] = {}
+        self.digits: Dict[Tuple[int, Tuple[int, int, int]], List[pygame.Surface]] = {}
 
-    def move(self, board: List[List[int]], direction: int) -> None:
+    def font(self, size: int) -> pygame.font.Font:
         """
-        ブロックを指定された方向に移動させる。
+        指定された大きさのフォントを返す。
 
         Args:
-            board (List[List[int]]): ゲームボードの状態。
-            direction (int): 移動方向 (0: 下, 1: 左, 2: 右)。
+            size (int): フォントの大きさ。
+
+        Returns:
+            pygame.font.Font: フォント。
         """
-        if direction == 0 and self.moveable(board, [1, 0]):
-            self.row += 1
-        elif direction == 1 and self.moveable(board, [0, -1]):
-            self.col -= 1
-        elif direction == 2 and self.moveable(board, [0, 1]):
-            self.col += 1
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = pygame.font.Font(None, size)
+        return font
 
-    def moveable(self, board: List[List[int]], direction: List[int]) -> bool:
+    def render(self, text: str, size: int, color: Tuple[int, int, int]) -> pygame.Surface:
         """
-        指定された方向にブロックが移動可能かどうかを判定する。
+        文字列を描画した画像を返す。
 
         Args:
-            board (List[List[int]]): ゲームボードの状態。
-            direction (List[int]): 移動方向のオフセット ([delta_row, delta_col])。
+            text (str): 文字列。
+            size (int): フォントの大きさ。
+            color (Tuple[int, int, int]): 文字の色。
 
         Returns:
-            bool: 移動可能であればTrue、不可能であればFalse。
+            pygame.Surface: 文字列の画像。
+        """
+        key = (text, size, color)
+        surface = self.texts.get(key)
+        if surface is None:
+            if len(self.texts) >= self.MAX_TEXTS:
+                self.texts.clear()
+            surface = self.texts[key] = self.font(size).render(text, True, color)
+        return surface
+
+    def draw_number(self, screen: pygame.Surface, text: str, pos: Tuple[int, int],
+                    size: int, color: Tuple[int, int, int]) -> None:
+        """
+        数字だけの文字列を、グリフアトラスの画像を並べて描く。
+
+        Args:
+            screen (pygame.Surface): 描画先のPygameサーフェス。
+            text (str): 数字だけの文字列。
+            pos (Tuple[int, int]): 描画位置 (左上)。
+            size (int): フォントの大きさ。
+            color (Tuple[int, int, int]): 文字の色。
         """
-        drow, dcol = direction
+        glyphs = self.digits.get((size, color))
+        if glyphs is None:
+            font = self.font(size)
+            glyphs = self.digits[(size, color)] = [font.render(str(i), True, color) for i in range(10)]
+        x, y = pos
+        for char in text:
+            glyph = glyphs[ord(char) - 48]
+            screen.blit(glyph, (x, y))
+            x += glyph.get_width()
 
-        for dx in self.shape:
-            row: int = self.row + dx[0] + drow
-            col: int = self.col + dx[1] + dcol
-            if not (0 <= row < MAX_ROW + 3 and 0 <= col < MAX_COL + 2 and board[row][col] == 0):
-                return False
 
-        return True
+text_cache: TextCache = TextCache()
+
+def show_score(screen: pygame.Surface, record: Score) -> None:
+    """
+    スコア、レベル、消した行数を描画する。
+
+    Args:
+        screen (pygame.Surface): 描画先のPygameサーフェス。
+        record (Score): スコア。
+    """
+    white = (255, 255, 255)
+    screen.blit(text_cache.render("LEVEL:", 50, white), [500, 300])
+    text_cache.draw_number(screen, "{}".format(record.level), (700, 300), 50, white)
 
-    def rotate(self, board: List[List[int]], direction: int) -> None:
+    screen.blit(text_cache.render("CLEARED ROW:", 50, white), [500, 360])
+    text_cache.draw_number(screen, "{}".format(record.cleared_row), (900, 360), 50, white)
+
+    screen.blit(text_cache.render("SCORE", 50, white), [500, 420])
+    text_cache.draw_number(screen, "{0:012d}".format(record.score), (600, 480), 50, white)
+
+
+# 行削除のアニメーション
+# 入力　アニメーションの進み具合
+# 出力　消去中の行の表示
+def clear_animation_row(progress: float, n_cols: int = MAX_COL) -> List[int]:
+    """
+    行が消えるアニメーションで、消去中の行に表示する内容を求める。
+    消去アニメーションの色が左から右へ流れていく。
+
+    Args:
+        progress (float): アニメーションの進み具合 (0.0から1.0)。
+        n_cols (int): 盤面の列数。
+
+    Returns:
+        List[int]: 消去中の行の各マスの値 (壁を含む)。
+    """
+    n_col: int = max(4, n_cols * 2 // 5)  # 消去アニメーションの横方向の移動量
+    shift: int = int(progress * (n_col + n_cols))  # 左から流れてきた量
+    row: List[int] = [1] + [0] * n_cols + [1]
+    for col in range(max(1, shift - n_col + 1), min(shift, n_cols) + 1):
+        row[col] = 9  # 消去アニメーションの色
+    return row
+
+
+class Renderer:
+    """
+    差分描画を行うクラス。
+    毎フレーム前回から変化したマスだけを描き直して、その領域だけを画面に反映する。
+    盤面は BOARD_AREA に収まる範囲 (ビューポート) だけを描き、落下中のブロックが端に近づいたらスクロールする。
+    マスの画像は拡大率 (1マスの大きさ) ごとに一度だけ作っておき、描くときには拡大縮小しない。
+    """
+    BOARD_AREA: Rect = Rect(GRID_OFFSET_X, GRID_OFFSET_Y, BLOCK_SIZE * (MAX_COL + 2), BLOCK_SIZE * (MAX_ROW + 1))
+    HOLD_AREA: Rect = Rect(GRID_OFFSET_X + BLOCK_SIZE * 13, GRID_OFFSET_Y, BLOCK_SIZE * 5, BLOCK_SIZE * 5)
+    SCORE_AREA: Rect = Rect(480, 290, 520, 240)
+    HUD_AREA: Rect = Rect(480, 550, 500, 190)  # 計測結果のオーバーレイ (--profile のときだけ)
+    HUD_INTERVAL: int = 10  # オーバーレイを描き直すフレーム間隔
+    OPPONENT_CELL: int = 11  # 対戦相手の盤面の1マスの大きさ
+    OPPONENT_AREA: Rect = Rect(800, 30, OPPONENT_CELL * MAX_COL, OPPONENT_CELL * MAX_ROW)
+
+    def __init__(self, screen: pygame.Surface, block_color: List[Tuple[int, int, int]], block_images,
+                 profiler: Optional[Profiler] = None) -> None:
         """
-        ブロックを指定された方向に回転させる。
+        Rendererクラスの初期化。
 
         Args:
-            board (List[List[int]]): ゲームボードの状態。
-            direction (int): 回転方向 (0: 時計回り, 1: 反時計回り)。
-        """
-        #  old_shape = copy.deepcopy(self.shape) #a
-        # Iブロックの回転処理
-        if self.block_type == 2:
-            if direction == 0:
-                for dx in self.shape:
-                    dx[0], dx[1] = dx[1], 1 - dx[0]
-            elif direction == 1:
-                for dx in self.shape:
-                    dx[0], dx[1] = 1 - dx[1], dx[0]
-        # Oブロックは回転しない
-        elif self.block_type == 8:
-            pass
-        # その他のブロックの回転処理
-        elif direction == 0:
-            for dx in self.shape:
-                dx[0], dx[1] = dx[1], -dx[0]
-        elif direction == 1:
-            for dx in self.shape:
-                dx[0], dx[1] = -dx[1], dx[0]
-
-        self.rotate_correction(board)
-
-    def rotate_correction(self, board: List[List[int]]) -> None:
-        """
-        回転後のブロックの位置を補正し、壁や他のブロックとの衝突を避ける。
+            screen (pygame.Surface): 描画先のPygameサーフェス。
+            block_color (List[Tuple[int, int, int]]): ブロックの色リスト。
+            block_images: ブロックの画像リスト。
+            profiler (Optional[Profiler]): 描画の各段階の時間を記録する計測器。
+        """
+        self.profiler: Profiler = profiler if profiler is not None else Profiler()
+        self.screen: pygame.Surface = screen
+        self.block_color: List[Tuple[int, int, int]] = block_color
+        self.block_images = block_images
+        # 背景 (盤面のマスはビューポートに合わせて描くので、ここには描かない)
+        self.background: pygame.Surface = pygame.Surface(screen.get_size()).convert()
+        self.background.fill((0, 0, 0))
+        self.sprite_cache: Dict[int, List[pygame.Surface]] = {}  # 1マスの大きさ -> マスの値ごとの画像
+        self.sprites: List[pygame.Surface] = []  # 今の拡大率のマスの画像
+        self.board_size: Optional[Tuple[int, int]] = None  # 表示中の盤面の大きさ (行数, 列数)
+        self.zoom_index: int = 0  # ZOOM_SIZESの番号
+        self.top: int = 2  # ビューポートの一番上の行番号
+        self.left: int = 0  # ビューポートの一番左の列番号
+        self.view_rows: int = 0  # ビューポートに表示する行数
+        self.view_cols: int = 0  # ビューポートに表示する列数
+
+        self.drawn: List[List[int]] = []  # ビューポートに表示中の各マスの値 (空ならビューポートを作り直す)
+        self.hold_key: Optional[Tuple] = None  # 表示中のホールドブロック (種類と形状)
+        self.score_values: Optional[Tuple[int, int, int]] = None  # 表示中のスコア
+        self.dirty_rects: List[Rect] = []  # 次のpresentで画面に反映する領域
+        self.opponent_drawn: List[List[int]] = []  # 表示中の対戦相手の盤面 (空なら枠から描き直す)
+        self.frame_start: float = 0.0
+        self.frame_times: Deque[float] = deque(maxlen=60)  # 1フレームの描画時間 (ミリ秒)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """
+        画面全体を背景で描き直し、次のdrawで全てのマスを描き直させる。
+        """
+        self.screen.blit(self.background, (0, 0))
+        self.drawn = []
+        self.hold_key = None
+        self.score_values = None
+        self.opponent_drawn = []
+        self.dirty_rects = [self.screen.get_rect()]
+
+    def draw(self, board: Board, block: Optional[Block] = None,
+             hold_block: Optional[Block] = None, record: Optional["Score"] = None,
+             clearing_rows: Optional[List[int]] = None, clear_progress: float = 0.0) -> None:
+        """
+        前回から変化した部分だけを画面に描く。
 
         Args:
-            board (List[List[int]]): ゲームボードの状態。
+            board (Board): ゲームボードの状態。
+            block (Optional[Block]): 落下中のブロック。
+            hold_block (Optional[Block]): ホールド中のブロック。
+            record (Optional[Score]): スコア。
+            clearing_rows (Optional[List[int]]): 消去アニメーション中の行番号。
+            clear_progress (float): 消去アニメーションの進み具合 (0.0から1.0)。
         """
-        move_priority: List[List[int]] = [[0, 0], [0, -1], [0, 1], [-1, 0], [1, 0], [2, 0], [-1, 1], [1, 1]]
-        for direction in move_priority:
-            if self.moveable(board, direction):
-                self.row += direction[0]
-                self.col += direction[1]
-                return
-
-        direction = [0, 2]
-        while not self.moveable(board, direction):
-            direction[1] += 1
-        self.row += direction[0]
-        self.col += direction[1]
+        self.frame_start = time.perf_counter()
+        profiler: Profiler = self.profiler
+
+        with profiler.section("draw_board"):
+            self.draw_cells(board, block, clearing_rows, clear_progress)
+
+        with profiler.section("draw_hold"):
+            self.draw_hold(hold_block)
+
+        if record is not None:
+            with profiler.section("show_score"):
+                score_values: Tuple[int, int, int] = (record.level, record.cleared_row, record.score)
+                if score_values != self.score_values:
+                    self.score_values = score_values
+                    self.screen.blit(self.background, self.SCORE_AREA, self.SCORE_AREA)
+                    show_score(self.screen, record)
+                    self.dirty_rects.append(self.SCORE_AREA)
+
+        if profiler.enabled and profiler.frame_count % self.HUD_INTERVAL == 0:
+            with profiler.section("draw_hud"):
+                self.draw_hud()
+
+    def draw_cells(self, board: Board, block: Optional[Block] = None,
+                   clearing_rows: Optional[List[int]] = None, clear_progress: float = 0.0) -> None:
+        """
+        ボードと落下中のブロックのうち、前回から変化したマスだけを描く。
 
-    def drop(self, board: List[List[int]]) -> int:
+        Args:
+            board (Board): ゲームボードの状態。
+            block (Optional[Block]): 落下中のブロック。
+            clearing_rows (Optional[List[int]]): 消去アニメーション中の行番号。
+            clear_progress (float): 消去アニメーションの進み具合 (0.0から1.0)。
         """
-        ブロックを時間経過によって下方向に落下させる。
+        # 落下中のブロックとゴースト (落下地点) を重ねる行。ゴーストの位置は列の高さから求まる
+        overlay: Dict[int, List[Tuple[int, int]]] = {}
+        if block is not None:
+            ghost_row: int = block.row + block.drop_distance(board)
+            for row_offset, col_offset in block.shape:
+                overlay.setdefault(ghost_row + row_offset, []).append((block.col + col_offset, GHOST_COLOR))
+            for row_offset, col_offset in block.shape:
+                overlay.setdefault(block.row + row_offset, []).append((block.col + col_offset, block.block_type))
+
+        clearing_row: Optional[List[int]] = clear_animation_row(clear_progress, board.cols) if clearing_rows else None
+
+        if (board.rows, board.cols) != self.board_size:  # 盤面全体が横に収まる拡大率から始める
+            self.board_size = (board.rows, board.cols)
+            self.zoom_index = self.fit_zoom(board)
+            self.drawn = []
+        if not self.drawn:
+            self.set_view(board)
+        if block is not None and self.follow(board, block):
+            self.clear_view()
+
+        # ビューポートの中の行と列だけを調べる (盤面が大きくても、1フレームの処理量は変わらない)
+        left: int = self.left
+        right: int = left + self.view_cols
+        for index, shown in enumerate(self.drawn):
+            row: int = self.top + index
+            values: List[int] = board[row]
+            if clearing_row is not None and row in clearing_rows:
+                values = clearing_row
+            elif row in overlay:
+                values = values[:]
+                for col, value in overlay[row]:
+                    if 0 <= col < board.cols + 2:
+                        values[col] = value
+            visible: List[int] = values[left:right]
+            if visible == shown:
+                continue
+            for offset, value in enumerate(visible):
+                if value != shown[offset]:
+                    self.draw_cell(row, left + offset, value)
+                    shown[offset] = value
+
+    def fit_zoom(self, board: Board) -> int:
+        """
+        盤面全体が収まる (収まらなければ横幅だけが収まる) 一番大きい拡大率を求める。
 
         Args:
-            board (List[List[int]]): ゲームボードの状態。
+            board (Board): ゲームボードの状態。
 
         Returns:
-            int: 落下しなかった場合は0、新しいブロックを作成する必要がある場合は1。
-        """
-        if self.count < FALL_SPEED:
-            self.count += 1
-            return 0
-        elif self.moveable(board, [1, 0]):
-            self.count = 0
-            self.row += 1
-            return 0
-        else:
-            return 1 # 新しいブロックを作成
+            int: ZOOM_SIZESの番号。
+        """
+        area: Rect = self.BOARD_AREA
+        for fit_rows in (True, False):
+            for index, size in enumerate(ZOOM_SIZES):
+                if size * (board.cols + 2) <= area.width and (not fit_rows or size * (board.rows + 1) <= area.height):
+                    return index
+        return len(ZOOM_SIZES) - 1
+
+    def zoom(self, step: int) -> None:
+        """
+        拡大率を変える。次のdrawでビューポートを作り直す。
+
+        Args:
+            step (int): ZOOM_SIZESの番号の増減 (負の値で拡大、正の値で縮小)。
+        """
+        index: int = max(0, min(len(ZOOM_SIZES) - 1, self.zoom_index + step))
+        if index != self.zoom_index:
+            self.zoom_index = index
+            self.drawn = []
 
-    def draw(self, screen: pygame.Surface, block_images) -> None:
+    def set_view(self, board: Board) -> None:
         """
-        ブロックをゲーム画面に描画する。
+        盤面の大きさと拡大率から、ビューポートに表示する行数と列数を決め直す。
 
         Args:
-            screen (pygame.Surface): 描画先のPygameサーフェス。
-            block_color (List[Tuple[int, int, int]]): ブロックの色リスト。
+            board (Board): ゲームボードの状態。
+        """
+        size: int = ZOOM_SIZES[self.zoom_index]
+        self.sprites = self.cell_sprites(size)
+        # 画面外の2行は表示せず、床 (rows + 2行目) と左右の壁は表示する
+        self.view_rows = min(board.rows + 1, self.BOARD_AREA.height // size)
+        self.view_cols = min(board.cols + 2, self.BOARD_AREA.width // size)
+        self.top = max(2, min(self.top, board.rows + 3 - self.view_rows))
+        self.left = max(0, min(self.left, board.cols + 2 - self.view_cols))
+        self.clear_view()
+
+    def clear_view(self) -> None:
         """
-        for row_offset, col_offset in self.shape:#降ってくるブロック(こうかとん)表示する
-            row = self.row + row_offset
-            col = self.col + col_offset
-            if self.row + row > 1:  # 画面外の部分は描画しない
-                screen.blit(block_images[self.block_type],
-                        (BOARD_OFFSET_X + BLOCK_SIZE * col,
-                         BOARD_OFFSET_Y + BLOCK_SIZE * (row - 2)))
+        盤面の領域を背景で消し、次のdrawでビューポートの全てのマスを描き直させる。
+        """
+        area: Rect = self.BOARD_AREA
+        self.screen.blit(self.background, area, area)
+        self.drawn = [[-1] * self.view_cols for _ in range(self.view_rows)]
+        self.dirty_rects.append(area)
 
-    def place(self, board: List[List[int]]) -> int:
+    def follow(self, board: Board, block: Block) -> bool:
         """
-        ブロックをゲームボードに固定する。
+        落下中のブロックがビューポートの端に近づいたら、ブロックが見える位置までスクロールする。
+        1行ずつではなくまとめてスクロールするので、画面全体を描き直す回数は少ない。
 
         Args:
-            board (List[List[int]]): ゲームボードの状態。
+            board (Board): ゲームボードの状態。
+            block (Block): 落下中のブロック。
 
         Returns:
-            int: ブロックが画面外に固定された場合は1 (ゲームオーバー)、正常に固定された場合は0。
-        """
-        for dx in self.shape:
-            row: int = self.row + dx[0]
-            col: int = self.col + dx[1]
-            if not (2 <= row < MAX_ROW + 2 and 1 <= col < MAX_COL + 1):  # 固定されたブロックが画面外
-                return 1
-            board[row][col] = self.block_type
-        return 0
-    
-class Score:
-    def __init__(self):
-        self.cleared_row = 0
-        self.score = 0
-        self.level = 0
-        self.score_table = [0, 80, 100, 300, 1200]
-        self.level_up = [2, 5, 8, 12, 16, 20, 25, 30, 35, 40, # level 0 to 9
-                         46, 52, 58, 64, 70, 77, 84, 91, 98, 105, # level 10 to 19
-                         112, 120, 128, 136, 144, 152, 160, 168, 177, 186, # level 20 to 29
-                         195, 204, 213, 222, 231, 240, 255, 270, 285, 300, 1000] # 30 to 40
-        
-    def update(self, count):
-        self.score += self.score_table[count]*(self.level+1)
-        self.cleared_row += count
-        
-        if self.level < 40 and self.level_up[self.level] <= self.cleared_row: # level 40 is max
-            self.level += 1
-    
-    def show(self, screen):
-        font = pygame.font.Font(None, 50)
-        text1 = font.render("LEVEL:", True, (255, 255, 255))
-        level = font.render("{}".format(self.level), True, (255, 255, 255))
-        screen.blit(text1, [500, 300])
-        screen.blit(level, [700, 300])
-        
-        text2 = font.render("CLEARED ROW:", True, (255, 255, 255))
-        cleared_row = font.render("{}".format(self.cleared_row), True, (255, 255, 255))
-        screen.blit(text2, [500, 360])
-        screen.blit(cleared_row, [900, 360])
-        
-        text3 = font.render("SCORE", True, (255, 255, 255))
-        score = font.render("{0:012d}".format(self.score), True, (255, 255, 255))
-        screen.blit(text3, [500, 420])
-        screen.blit(score, [600, 480])
-        
-# ブロックとボードの初期化
-def initialize_game() -> Tuple[List[List[int]], Block]:
-    """
-    ゲームの初期化を行う。ゲームボードと最初のブロックを作成する。
+            bool: スクロールした場合はTrue。
+        """
+        top, left = self.top, self.left
+        if block.row - 1 < top or block.row + 2 >= top + self.view_rows:
+            top = max(2, min(block.row - self.view_rows // 4, board.rows + 3 - self.view_rows))
+        if block.col - 2 < left or block.col + 2 >= left + self.view_cols:
+            left = max(0, min(block.col - self.view_cols // 2, board.cols + 2 - self.view_cols))
+        if (top, left) == (self.top, self.left):
+            return False
+        self.top, self.left = top, left
+        return True
 
-    Returns:
-        Tuple[List[List[int]], Block]: 初期化されたゲームボードと最初のブロック。
-    """
-    board: List[List[int]] = [[0 for _ in range(MAX_COL + 2)] for _ in range(MAX_ROW + 3)]
-    # 壁の配置
-    for col in range(MAX_COL + 2):
-        board[-1][col] = 1
-    for row in range(MAX_ROW + 3):
-        board[row][0] = 1
-        board[row][-1] = 1
-
-    block_type: int = random.randint(2, 8)
-    block: Block = Block(block_type)
-
-    return board, block
-
-# 入力　ボード
-# 出力　消える行数、消える行の番号
-def find_deleting_row(board: List[List[int]]) -> Tuple[int, List[int]]:
-    """
-    消去する行を探索する。
+    def cell_sprites(self, size: int) -> List[pygame.Surface]:
+        """
+        1マスの大きさごとに、マスの値ごとの画像 (枠、空のマス、ブロック) を作る。作った画像は使い回す。
 
-    Args:
-        board (List[List[int]]): ゲームボードの状態。
+        Args:
+            size (int): 1マスの大きさ (ピクセル)。
 
-    Returns:
-        Tuple[int, List[int]]: 消去される行数と、それらの行番号のリスト。
-    """
-    count: int = 0
-    row_numbers: List[int] = []
-    for row in range(2, MAX_ROW + 2):
-        if all(board[row][col] != 0 for col in range(1, MAX_COL + 1)):
-            count += 1
-            row_numbers.append(row)
-    return count, row_numbers
-
-# 行削除
-# 入力　スクリーン、ボード、消す行番号
-# 出力　なし
-def delete_row(screen: pygame.Surface, board: List[List[int]], row_number: List[int],
-               block_color: List[Tuple[int, int, int]], block_images) -> None:
-    """
-    指定された行を削除し、上の行を詰めるアニメーションを行う。
+        Returns:
+            List[pygame.Surface]: マスの値ごとの画像。
+        """
+        sprites: Optional[List[pygame.Surface]] = self.sprite_cache.get(size)
+        if sprites is not None:
+            return sprites
+        sprites = []
+        inner: Rect = Rect(0, 0, size, size).inflate(-2, -2)
+        for value, color in enumerate(self.block_color):
+            sprite: pygame.Surface = pygame.Surface((size, size)).convert()
+            sprite.fill((0, 0, 0))
+            pygame.draw.rect(sprite, self.block_color[0], inner)
+            if 2 <= value <= 8:
+                image: pygame.Surface = self.block_images[value]
+                if image.get_size() != (size, size):
+                    image = pygame.transform.smoothscale(image, (size, size))
+                sprite.blit(image, (0, 0))
+            elif value != 0:  # 壁、消去アニメーション、ゴーストなど
+                pygame.draw.rect(sprite, color, inner)
+            sprites.append(sprite)
+        self.sprite_cache[size] = sprites
+        return sprites
+
+    def draw_hold(self, hold_block: Optional[Block] = None) -> None:
+        """
+        ホールド中のブロックが変わった場合だけ描き直す。
 
-    Args:
-        screen (pygame.Surface): 描画先のPygameサーフェス。
-        board (List[List[int]]): ゲームボードの状態。
-        row_number (List[int]): 削除する行番号のリスト。
-        block_color (List[Tuple[int, int, int]]): ブロックの色リスト。
-    """
-    n_col: int = 4  # 消去アニメーションの横方向の移動量
-    for row in row_number:
-        for col in range(1, MAX_COL + 1):
-            board[row][col] = 0
-    for _ in range(n_col + MAX_COL):
-        for row in row_number:
-            for col in reversed(range(1, MAX_COL + 1)):
-                board[row][col] = board[row][col - 1]
-            if _ < n_col:
-                board[row][1] = 9  # 消去アニメーションの色
-        pygame.time.wait(8)
-        draw_board(screen, board, block_color, block_images)
-        pygame.display.update()
-
-    for deleting_row in row_number:
-        for row in reversed(range(2, deleting_row + 1)):
+        Args:
+            hold_block (Optional[Block]): ホールド中のブロック。
+        """
+        hold_key: Optional[Tuple] = None
+        if hold_block is not None:
+            hold_key = (hold_block.block_type, hold_block.rotation)
+        if hold_key != self.hold_key:
+            self.hold_key = hold_key
+            self.screen.blit(self.background, self.HOLD_AREA, self.HOLD_AREA)
+            if hold_block is not None:
+                for dx in hold_block.shape:
+                    row = 2 + dx[0]
+                    col = 15 + dx[1]
+                    self.screen.blit(self.block_images[hold_block.block_type],
+                                     (GRID_OFFSET_X + col * BLOCK_SIZE,
+                                      GRID_OFFSET_Y + row * BLOCK_SIZE))
+            self.dirty_rects.append(self.HOLD_AREA)
+
+    def draw_opponent(self, board: Board) -> None:
+        """
+        対戦相手の盤面を小さく描く。前回から変化したマスだけを描き直す。
+
+        Args:
+            board (Board): 対戦相手のゲームボードの状態。
+        """
+        size: int = self.OPPONENT_CELL
+        area: Rect = self.OPPONENT_AREA
+        if not self.opponent_drawn:
+            pygame.draw.rect(self.screen, self.block_color[1], area.inflate(4, 4), 2)
+            self.opponent_drawn = [[-1] * (MAX_COL + 2) for _ in range(MAX_ROW + 3)]
+            self.dirty_rects.append(area.inflate(4, 4))
+        for row in range(2, MAX_ROW + 2):
+            values: List[int] = board[row]
+            shown: List[int] = self.opponent_drawn[row]
+            if values == shown:
+                continue
             for col in range(1, MAX_COL + 1):
-                board[row][col] = board[row - 1][col]
+                if values[col] != shown[col]:
+                    rect = Rect(area.x + size * (col - 1), area.y + size * (row - 2), size, size)
+                    pygame.draw.rect(self.screen, self.block_color[values[col]], rect)
+                    self.dirty_rects.append(rect)
+            self.opponent_drawn[row] = values[:]
 
-# ゲームボードの描画
-# 入力　スクリーン、ゲームボード、ブロックの色
-# 出力　なし
-def draw_board(screen: pygame.Surface, board: List[List[int]],
-               block_color: List[Tuple[int, int, int]],block_images) -> None:
-    """
-    ゲームボードを描画する。
+    def draw_hud(self) -> None:
+        """
+        直近のフレーム時間のグラフと p50/p95/p99 をオーバーレイとして描く。
+        """
+        area: Rect = self.HUD_AREA
+        self.screen.blit(self.background, area, area)
+        p50, p95, p99 = self.profiler.percentiles()
+        self.screen.blit(text_cache.render("frame ms  p50 {:5.2f}  p95 {:5.2f}  p99 {:5.2f}".format(p50, p95, p99),
+                                           24, (255, 255, 255)), (area.x, area.y))
+
+        # 1フレームを縦線1本で表し、1フレームの目安 (1000/60ミリ秒) の2倍を上端とする
+        graph: Rect = Rect(area.x, area.y + 30, area.width, area.height - 30)
+        scale: float = graph.height / (2 * TICK_MS)
+        pygame.draw.rect(self.screen, (40, 40, 40), graph)
+        budget_y: int = graph.bottom - round(TICK_MS * scale)
+        pygame.draw.line(self.screen, (120, 120, 0), (graph.x, budget_y), (graph.right - 1, budget_y))
+        frame_times = self.profiler.frame_times
+        x: int = graph.right - len(frame_times) * 2
+        for ms in frame_times:
+            height: int = min(graph.height, round(ms * scale))
+            color = (0, 200, 0) if ms <= TICK_MS else (220, 60, 60)
+            pygame.draw.line(self.screen, color, (x, graph.bottom - 1), (x, graph.bottom - height))
+            x += 2
+        self.dirty_rects.append(area)
+
+    def draw_cell(self, row: int, col: int, value: int) -> None:
+        """
+        ビューポートの中の1マスを、今の拡大率の画像で描き直す。
 
-    Args:
-        screen (pygame.Surface): 描画先のPygameサーフェス。
-        board (List[List[int]]): ゲームボードの状態。
-        block_color (List[Tuple[int, int, int]]): ブロックの色リスト。
-    """
-    for row in range(2, MAX_ROW + 3):
-        for col in range(MAX_COL + 2):
-            draw_x: int = GRID_OFFSET_X + BLOCK_SIZE * col
-            draw_y: int = GRID_OFFSET_Y + BLOCK_SIZE * (row - 2)
-            pygame.draw.rect(screen, (0, 0, 0), Rect(draw_x, draw_y, BLOCK_SIZE, BLOCK_SIZE))
-            if board[row][col] < 2:  # 壁または空
-                pygame.draw.rect(screen, block_color[board[row][col]],
-                                 Rect(draw_x + 1, draw_y + 1, BLOCK_SIZE - 2, BLOCK_SIZE - 2))
-            else:  # ブロック
-                block_type = board[row][col]
-                #こうかとん２ここから
-                if 2 <= block_type <= 8:
-                    screen.blit(block_images[block_type],
-                            (BOARD_OFFSET_X + BLOCK_SIZE * col,
-                             BOARD_OFFSET_Y + BLOCK_SIZE * (row - 2)))
-                #ブロックこうかとん変更プログラム➁ここまで
-                
-def gameover(screen, record):
+        Args:
+            row (int): 行番号。
+            col (int): 列番号。
+            value (int): マスの値。
+        """
+        size: int = ZOOM_SIZES[self.zoom_index]
+        rect: Rect = Rect(self.BOARD_AREA.x + size * (col - self.left), self.BOARD_AREA.y + size * (row - self.top),
+                          size, size)
+        self.screen.blit(self.sprites[value], rect)
+        self.dirty_rects.append(rect)
+
+    def present(self) -> None:
+        """
+        描き直した領域だけを画面に反映し、描画時間を記録する。
+        """
+        if self.dirty_rects:
+            with self.profiler.section("display.update"):
+                pygame.display.update(self.dirty_rects)
+            self.dirty_rects = []
+        self.frame_times.append((time.perf_counter() - self.frame_start) * 1000)
+        if len(self.frame_times) == self.frame_times.maxlen:  # 60フレームごとに平均をタイトルバーに表示
+            pygame.display.set_caption("KOKARIS  render {:.2f} ms/frame".format(
+                sum(self.frame_times) / len(self.frame_times)))
+            self.frame_times.clear()
+
+
+def gameover(screen, record, image):
     """
     gameover時に、リザルト画面を表示する
+    引数：screen, record (スコア), image (先読みしておいたこうかとんの画像)
 
     処理内容:
     - 黒背景に「GAMEOVER」と「RESULT」の文字を描画する。
@@ -333,41 +538,47 @@ def gameover(screen, record):
     - ユーザーが[ESC]キーを押すか、ウィンドウを閉じるまで待機する。
     """
     screen.fill((0, 0, 0))
-    image = pygame.image.load("ex5/.fig/bijokokaton.png") #こうかとん（女）の画像
-    image = pygame.transform.scale(image, (481, 565))  
-    screen.blit(image, (400, 100))  
+    screen.blit(image, (400, 100))  #こうかとん（女）の画像
     #gameoverの文字表示
-    font1 = pygame.font.Font(None, 80)
-    text1 = font1.render("GAMEOVER", True, (255, 0, 0))
-    screen.blit(text1, [200, 100])
+    screen.blit(text_cache.render("GAMEOVER", 80, (255, 0, 0)), [200, 100])
     #resultの文字表示
-    font2 = pygame.font.Font(None, 60)
-    text2 = font2.render("RESULT", True, (255, 255, 255))
-    screen.blit(text2, [200, 200])
+    screen.blit(text_cache.render("RESULT", 60, (255, 255, 255)), [200, 200])
     #revelの文字と数値を表示
-    font = pygame.font.Font(None, 50)
-    text3 = font.render("LEVEL:", True, (255, 255, 255))
-    level = font.render("{}".format(record.level), True, (255, 255, 255))
-    screen.blit(text3, [100, 300])
-    screen.blit(level, [400, 300])
+    screen.blit(text_cache.render("LEVEL:", 50, (255, 255, 255)), [100, 300])
+    text_cache.draw_number(screen, "{}".format(record.level), (400, 300), 50, (255, 255, 255))
     #scoreの文字と数値を表示
-    text4 = font.render("SCORE", True, (255, 255, 255))
-    score = font2.render("{0:012d}".format(record.score), True, (255, 255, 255))
-    screen.blit(text4, [100, 400])
-    screen.blit(score, [200, 450])
+    screen.blit(text_cache.render("SCORE", 50, (255, 255, 255)), [100, 400])
+    text_cache.draw_number(screen, "{0:012d}".format(record.score), (200, 450), 60, (255, 255, 255))
 
     pygame.display.update()
-    #リザルト画面からの退出
-    while(1):
-        pygame.time.wait(50)
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == KEYDOWN:
-                if event.key == K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
+    #リザルト画面からの退出 (ESCか閉じるボタンで終了するまで、イベントを待って眠る)
+    wait_key()
+
+
+def wait_key(keys: Tuple[int, ...] = (), on_quit: Optional[Callable[[], None]] = None) -> int:
+    """
+    keysのどれかが押されるまで、pygame.event.waitで眠って待つ (待っている間はCPUを使わない)。
+    閉じるボタンかESCが押された場合は、ゲームを終了する。
+
+    Args:
+        keys (Tuple[int, ...]): 待つキー。空の場合は終了するまで待ち続ける。
+        on_quit (Optional[Callable[[], None]]): 終了する前に呼ぶ後始末の関数。
+
+    Returns:
+        int: 押されたキー。
+    """
+    while True:
+        event = pygame.event.wait(IDLE_TIMEOUT_MS)
+        if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+            if on_quit is not None:
+                on_quit()
+            pygame.quit()
+            sys.exit()
+        if event.type == KEYDOWN and event.key in keys:
+            return event.key
+        if event.type in (WINDOWEXPOSED, WINDOWRESTORED):  # 隠れていた画面を表示し直す
+            pygame.display.update()
+
 
 def start(screen: pygame.Surface):
     """
@@ -376,34 +587,122 @@ def start(screen: pygame.Surface):
     スタート画面を描画する
     ENTERでスタート、ESCAPEでゲーム終了
     """
-    font1 = pygame.font.Font(None, 150)
-    font2 = pygame.font.Font(None, 50)
-    title = font1.render("KOKARIS", True, (255, 255, 255)) #画面に表示する文字
-    text = font2.render("Press ENTER to start", True, (255, 255, 255)) #画面に表示する文字
+    title = text_cache.render("KOKARIS", 150, (255, 255, 255)) #画面に表示する文字
+    text = text_cache.render("Press ENTER to start", 50, (255, 255, 255)) #画面に表示する文字
 
     screen.blit(title, [270, 260])
     screen.blit(text, [320, 560])
 
     pygame.display.update() #スタート画面に更新する
-    
+
+    wait_key((K_RETURN, K_KP_ENTER))  #enterがおされたとき、ゲーム画面に移行する (escでゲームを閉じる)
+
+
+def pause(screen: pygame.Surface, on_quit: Optional[Callable[[], None]] = None) -> None:
+    """
+    一時停止の画面を盤面の上に重ねて表示し、再開のキーが押されるまで待つ。
+    待っている間はイベントを待って眠るので、描画もゲームロジックも止まる。
+
+    Args:
+        screen (pygame.Surface): 描画先のPygameサーフェス。
+        on_quit (Optional[Callable[[], None]]): 一時停止中に終了する場合に呼ぶ後始末の関数。
+    """
+    area: Rect = Renderer.BOARD_AREA
+    shade = pygame.Surface(area.size)
+    shade.set_alpha(160)
+    screen.blit(shade, area)
+    title = text_cache.render("PAUSE", 80, (255, 255, 255))
+    text = text_cache.render("Press P to resume", 36, (255, 255, 255))
+    screen.blit(title, title.get_rect(center=(area.centerx, area.centery - 30)))
+    screen.blit(text, text.get_rect(center=(area.centerx, area.centery + 30)))
+    pygame.display.update(area)
+    wait_key((PAUSE_KEY, K_RETURN, K_KP_ENTER), on_quit)
+
+
+def wait_for_opponent(screen: pygame.Surface, connection: Connection, host: bool) -> VersusSession:
+    """
+    対戦相手との接続を待つ画面を表示する。通信は別スレッドで行うので、待っている間も画面は固まらない。
+    ホストはシードを決めて相手に送り、接続した側はそのシードを受け取ってから対戦を始める。
+
+    Args:
+        screen (pygame.Surface): 描画先のPygameサーフェス。
+        connection (Connection): 通信。
+        host (bool): ホスト (接続を待つ側) かどうか。
+
+    Returns:
+        VersusSession: 対戦の進行を管理するオブジェクト。
+    """
+    screen.fill((0, 0, 0))
+    screen.blit(text_cache.render("Waiting for opponent...", 50, (255, 255, 255)), [280, 360])
+    pygame.display.update()
+
+    seed: int = random.randrange(2 ** 32)
     while True:
-        pygame.time.wait(50)
-        keys = pygame.key.get_pressed()
-        if keys[K_ESCAPE]: #escが押されたときゲームを閉じる
-            pygame.quit()
-            sys.exit()
-        if keys[K_RETURN]: #enterがおされたとき、ゲーム画面に移行する
-            break
-        for event in pygame.event.get():
-            if event.type == QUIT:
+        # 通信は別スレッドなので、イベントを少しずつ待ちながら接続を確かめる
+        event = pygame.event.wait(100)
+        for event in [event] + pygame.event.get():
+            if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                connection.close()
                 pygame.quit()
                 sys.exit()
-
-
-def main() -> None:
+        if connection.closed:
+            print("connection failed: {}".format(connection.error), file=sys.stderr)
+            pygame.quit()
+            sys.exit(1)
+        if host and connection.connected.is_set():
+            connection.send(encode_hello(seed))
+            return VersusSession(seed, 0, clear_ticks=CLEAR_TICKS)
+        if not host:
+            messages: List[bytes] = connection.receive()
+            for index, message in enumerate(messages):
+                if message[0] == MSG_HELLO:
+                    session = VersusSession(decode_hello(message), 1, clear_ticks=CLEAR_TICKS)
+                    # ホストはすぐに操作を送り始めるので、一緒に届いた残りのメッセージも渡す
+                    # (MSG_INPUTSは前のメッセージからの差分なので、1つでも捨てると相手の操作がずれる)
+                    for rest in messages[index + 1:]:
+                        session.receive(rest)
+                    return session
+
+
+def main(demo: bool = False, record: Optional[str] = None, replay: Optional[str] = None,
+         profile: Optional[str] = None, das_ms: float = DAS_MS, arr_ms: float = ARR_MS,
+         soft_drop_ms: float = SOFT_DROP_MS, host: Optional[int] = None, connect: Optional[str] = None,
+         rows: int = MAX_ROW, cols: int = MAX_COL, mute: bool = False, resume: Optional[str] = None,
+         telemetry_path: Optional[str] = None) -> None:
     """
     メインゲームループ。
+
+    Args:
+        demo (bool): Trueの場合、AIが自動でプレイするデモモードにする。
+        record (Optional[str]): 指定した場合、操作をこのパスにリプレイとして保存する。
+        replay (Optional[str]): 指定した場合、キー入力の代わりにこのリプレイを再生する。
+        profile (Optional[str]): 指定した場合、各段階の処理時間をオーバーレイで表示し、
+            終了時にこのパスへChromeのトレース形式で保存する。
+        das_ms (float): 左右の押しっぱなしで、連続移動が始まるまでの時間 (ミリ秒)。
+        arr_ms (float): 左右の連続移動の間隔 (ミリ秒)。
+        soft_drop_ms (float): ソフトドロップの間隔 (ミリ秒)。
+        host (Optional[int]): 指定した場合、このポートで対戦相手の接続を待つ (対戦モード)。
+        connect (Optional[str]): 指定した場合、"アドレス:ポート" の相手に接続する (対戦モード)。
+        rows (int): 盤面の行数 (デモ、リプレイ、対戦モードでは標準の大きさだけ使える)。
+        cols (int): 盤面の列数。
+        mute (bool): Trueの場合、効果音を鳴らさない。
+        resume (Optional[str]): 指定した場合、このパスに保存したゲームを続きから遊ぶ
+            (なければ、または古い形式や壊れていて読み込めなければ新しく始める)。
+            途中でやめたときは、このパス (指定しなければSAVE_PATH) に保存する。
+        telemetry_path (Optional[str]): 指定した場合、ゲームのイベントとスコアをこのパスに記録する。
     """
+    # 対戦モードの通信 (別スレッドで接続を始めておく)
+    connection: Optional[Connection] = None
+    if host is not None or connect is not None:
+        connection = Connection()
+        if host is not None:
+            connection.start_host(host)
+        else:
+            address, _, port = connect.partition(":")
+            connection.start_client(address, int(port) if port else DEFAULT_PORT)
+        record = replay = None  # 相手のおじゃまブロックで結果が変わるので、リプレイは使えない
+
+    sound.pre_init()  # 効果音の遅延を短くするため、ミキサーのバッファを小さくしてから初期化する
     pygame.init()
     screen: pygame.Surface = pygame.display.set_mode((1000, 770))
     pygame.display.set_caption("KOKARIS")  # タイトルバー
@@ -411,139 +710,241 @@ def main() -> None:
     '''
     ブロックこうかとん追加プログラム➀
     '''
-    block_images = [None, None]  # インデックス0,1は使わない
-
-    for i in range(2, 9):#2~8の数字を取得
-        image = pygame.image.load(f"ex5/fig2/{i}.png").convert_alpha()#ファイルから数字に対応した画像を持ってくる。
-        image = pygame.transform.scale(image, (BLOCK_SIZE, BLOCK_SIZE))
-        block_images.append(image)
+    assets = Assets(BLOCK_SIZE)
+    block_images = assets.load_block_images()  # 縮小済みのアトラスから切り出した画像 (インデックス0,1は使わない)
     #こうかとん追加１ここまで
 
     block_color: List[Tuple[int, int, int]] = [(50, 50, 50), (150, 150, 150), (255, 0, 0), (0, 0, 255), (255, 165, 0),
                                                 (255, 0, 255), (0, 255, 0), (0, 255, 255), (255, 255, 0),
-                                                (200, 200, 200), (100, 100, 100)]
+                                                (200, 200, 200), (100, 100, 100), (90, 90, 90)]
+
+    # ゲームロジック (ボード、ブロック、ホールド、スコア)。リプレイで再現できるようにシードを決めておく
+    player: Optional[Player] = None  # リプレイの再生
+    game: Optional[Game] = None
+    if replay is not None:
+        player = Player(Replay.load(replay))
+        game = player.replay.new_game()
+    elif resume is not None and Path(resume).exists():  # 前回やめたところから再開する
+        try:
+            game = snapshot.load(resume)
+        except ValueError as error:  # 古い形式や壊れたファイルなら、新しく始める
+            print("cannot resume from {}: {} (starting a new game)".format(resume, error), file=sys.stderr)
+    if game is None:
+        game = Game(random.randrange(2 ** 32), clear_ticks=CLEAR_TICKS, rows=rows, cols=cols)
+    recorder: Optional[Recorder] = Recorder(game) if record is not None else None  # リプレイの記録
+    game_over: bool = False
+    # 途中でやめたときにゲームを保存する場所 (デモ、リプレイ、対戦では保存しない)
+    save_path: Optional[str] = None
+    if not demo and replay is None and connection is None:
+        save_path = resume if resume is not None else SAVE_PATH
 
-    board, block = initialize_game()
-    next_block_type: int = random.randint(2, 8)
+    telemetry = Telemetry(telemetry_path)  # ゲームのイベントを別スレッドで記録する (指定しなければ何もしない)
 
-    game_over: bool = False
-    record = Score()
-    
-    start_time: int = pygame.time.get_ticks()  # ゲーム開始時の時間を記録
+    def shutdown() -> None:
+        """
+        ゲームを終える前の後始末。リプレイを記録している場合はファイルに保存し、対戦中なら相手に終了を伝えて切断する。
+        ゲームの途中でやめた場合は、続きから再開できるように保存する (ゲームオーバーなら保存したゲームを消す)。
+        テレメトリは残りを書き込んで終える。
+        """
+        telemetry.close()
+        if recorder is not None:
+            recorder.finish().save(record)
+        if save_path is not None:
+            if game.game_over:
+                Path(save_path).unlink(missing_ok=True)
+            else:
+                snapshot.save(game, save_path)
+        if connection is not None:
+            connection.send(bytes([MSG_BYE]))
+            connection.close()
 
-    script_dir = Path(__file__).resolve().parent
-    sound_path = script_dir / "fig/sample.wav"  #相対パス
-    # pygame.mixer.music.load(str(sound_path))  #音声の再生
-    # pygame.mixer.music.play()
+    sounds = SoundEffects(enabled=not mute)  # 効果音はここで全て用意しておく
 
+    assets.preload_result_image()  # スタート画面の間にリザルト画面の画像を読み込んでおく
     start(screen)  #スタート画面
-    game_over = False
-    hold_block = None
-    can_hold = True
-    
+
+    session: Optional[VersusSession] = None  # 対戦の進行 (対戦モードのとき)
+    if connection is not None:
+        session = wait_for_opponent(screen, connection, host is not None)
+        game = session.local_game
+
+    # 処理時間の計測 (ゲームロジックの中の処理は、関数を計測用に置き換えて測る)
+    profiler = Profiler(enabled=profile is not None)
+    if profiler.enabled:
+        profiler.instrument(Block, "drop", "block.drop")
+        profiler.instrument(engine, "find_deleting_row", "find_deleting_row")
+        profiler.instrument(engine, "clear_rows", "clear_rows")
+        atexit.register(profiler.write_trace, profile)  # sys.exitで終了したときも保存する
+
+    renderer = Renderer(screen, block_color, block_images, profiler)  # スタート画面の文字を消して盤面を描く
+
+    clock = pygame.time.Clock()
+    accumulator: float = 0.0  # まだ処理していない経過時間 (ミリ秒)
+    controls = Controls(das_ms, arr_ms, soft_drop_ms)  # キー入力から、更新ごとの操作を求める
+    autoplayer: Optional[AutoPlayer] = AutoPlayer(depth=1) if demo else None  # デモモードのAI
+    focused: bool = True  # ウィンドウがアクティブかどうか
+    minimized: bool = False  # ウィンドウが最小化されているかどうか
+    cause: str = "game_over"  # 終わった原因 (ハイスコアと一緒に記録する)
+    mode: str = "versus" if session is not None else "demo" if demo else "replay" if player is not None else "single"
+    telemetry.publish("start", game.tick, mode=mode, seed=game.seed, rows=game.rows, cols=game.cols)
 
     while not game_over:
-        pygame.time.wait(10)
-
-        screen.fill((0, 0, 0))  # 画面を黒で塗りつぶす
-
-        draw_board(screen, board, block_color,block_images)
-        block.draw(screen, block_images)
-
-        # キー入力処理
-        pressed_key = pygame.key.get_pressed()
-        if pressed_key[K_DOWN]:
-            block.move(board, 0)
-        if pressed_key[K_LEFT]:
-            block.move(board, 1)
-        if pressed_key[K_RIGHT]:
-            block.move(board, 2)
-
-        # ブロックの落下処理
-        bottom_flag: int = block.drop(board)
-        if bottom_flag == 1:
-            if block.place(board) == 1:
-                game_over = True
-                gameover(screen, record)
+        # 経過時間を貯めて、一定間隔 (TICK_MS) ごとにゲームロジックを進める
+        # (非アクティブの間は描画の回数を減らす。ゲームロジックは1フレームで複数回進めて追いつく)
+        with profiler.section("clock.tick"):
+            elapsed: int = clock.tick(MAX_FPS if focused else BACKGROUND_FPS)
+        profiler.begin_frame()
+        if elapsed > FRAME_SPIKE_MS and focused:  # 非アクティブの間はわざと描画を減らしているので数えない
+            telemetry.publish("frame_spike", game.tick, ms=elapsed)
+        now: int = pygame.time.get_ticks()
+        pause_requested: bool = False
+
+        # キー入力処理 (ゲームロジックを進める前に、押された・離されたキーを時刻つきで記録する)
+        with profiler.section("input"):
+            for event in pygame.event.get():
+                # 閉じるボタン
+                if event.type == QUIT:
+                    shutdown()
+                    pygame.quit()
+                    sys.exit()
+
+                if event.type == KEYDOWN:
+                    # Escapeキーが押された場合
+                    if event.key == K_ESCAPE:
+                        shutdown()
+                        pygame.quit()
+                        sys.exit()
+                    if event.key in KEY_ACTIONS:
+                        controls.press(KEY_ACTIONS[event.key], now)
+                    if event.key in (K_EQUALS, K_PLUS, K_KP_PLUS):  # 拡大
+                        renderer.zoom(-1)
+                    if event.key in (K_MINUS, K_KP_MINUS):  # 縮小
+                        renderer.zoom(1)
+                if event.type == KEYUP and event.key in KEY_ACTIONS:
+                    controls.release(KEY_ACTIONS[event.key], now)
+                if event.type == MOUSEWHEEL:  # ホイールでも拡大・縮小できる
+                    renderer.zoom(-1 if event.y > 0 else 1)
+                if event.type == KEYDOWN and event.key == PAUSE_KEY:
+                    pause_requested = True
+                # ウィンドウが非アクティブになったり最小化されたりしたら、自動で一時停止する
+                if event.type in (WINDOWFOCUSLOST, WINDOWMINIMIZED):
+                    focused = False
+                    minimized = minimized or event.type == WINDOWMINIMIZED
+                    pause_requested = True
+                    controls.release_all(now)  # 離したキーのKEYUPは届かないので、全て離したことにする
+                if event.type in (WINDOWFOCUSGAINED, WINDOWRESTORED):
+                    focused = True
+                    minimized = False
+                if event.type in (WINDOWEXPOSED, WINDOWRESTORED):  # 隠れていた画面を全て描き直す
+                    renderer.invalidate()
+
+        # 一時停止 (対戦中は相手が待つことになるので止めず、描画だけを減らす)
+        if pause_requested and session is None:
+            controls.release_all(now)
+            pause(screen, shutdown)
+            focused, minimized = True, False  # 再開のキーを押せたのでアクティブ
+            renderer.invalidate()
+            clock.tick()  # 一時停止していた時間はゲームロジックを進めない
+            profiler.end_frame()
+            continue
+
+        accumulator = min(accumulator + elapsed, TICK_MS * MAX_TICKS_PER_FRAME)
+        ticks: int = int(accumulator // TICK_MS)
+        for index in range(ticks):
+            accumulator -= TICK_MS
+            tick_ms: float = now - (ticks - 1 - index) * TICK_MS  # この更新の時刻 (最後の更新が現在)
+
+            # 押しっぱなしの移動と、押された回転・ホールドなどの操作
+            if session is not None and not session.needs_input():
+                action: int = ACTION_NONE  # 相手を待っている間は、操作を先に進めない
+            else:
+                with profiler.section("input"):
+                    action = controls.action(tick_ms, game.block is not None)
+            if autoplayer is not None:  # デモモードではキー入力の代わりにAIの操作を使う
+                with profiler.section("ai"):
+                    action = autoplayer.action(game)
+            if player is not None:  # リプレイの再生中は記録された操作を使う
+                action = player.action(game.tick + 1)
+            if recorder is not None:
+                recorder.record(action)
+
+            if session is None:
+                with profiler.section("game.step"):
+                    _, events = game.step(action)
             else:
-                count, row_numbers = find_deleting_row(board)
-                if count > 0:
-                    delete_row(screen, board, row_numbers, block_color, block_images)
-                    record.update(count) 
-                screen.fill((0, 0, 0))
-                draw_board(screen, board, block_color,block_images)
-                block.draw(screen, block_images)
-                record.show(screen)
-                pygame.display.update()
-
-                block = Block(next_block_type)
-                next_block_type = random.randint(2, 8)
-                can_hold = True
-                if not block.moveable(board, [0, 0]):
+                # 対戦モード: 操作を相手に送り、両方の操作がそろったtickだけ進める (そろわなければ待つ)
+                with profiler.section("network"):
+                    for message in connection.receive():
+                        session.receive(message)
+                    if session.needs_input():
+                        session.add_local_input(action)
+                    for message in session.take_outbox():
+                        connection.send(message)
+                events = []
+                if session.can_step():
+                    with profiler.section("game.step"):
+                        events = session.step()[session.local]
+                if session.remote_game.game_over or session.finished or connection.closed:
+                    game_over = True  # 相手のゲームオーバーか切断で対戦終了
+                    cause = "opponent_game_over" if session.remote_game.game_over else "disconnected"
+            sounds.handle(events)
+            telemetry.handle(events, game.tick)
+            for name, value in events:
+                if name == EVENT_GAME_OVER:
                     game_over = True
-                    gameover(screen, record)
-                    
-        if hold_block is not None:
-            for dx in hold_block.shape:
-                row = 2 + dx[0]
-                col = 15 + dx[1]
-                screen.blit(block_images[hold_block.block_type],
-                        (GRID_OFFSET_X + col * BLOCK_SIZE,
-                         GRID_OFFSET_Y + row * BLOCK_SIZE))
-        
-        record.show(screen)
-        pygame.display.update()
-
-        # 時間経過による落下速度調整
-        elapsed_time: int = pygame.time.get_ticks() - start_time
-        global FALL_SPEED  # グローバル変数を変更するため
-        if elapsed_time > 30000 and FALL_SPEED > 5:  # 30秒経過で少し速く
-            FALL_SPEED -= 1
-        elif elapsed_time > 60000 and FALL_SPEED > 1:  # 60秒経過でさらに速く
-            FALL_SPEED -= 1
-        elif elapsed_time > 90000 and FALL_SPEED > 1:  # 90秒経過でさらに速く
-            FALL_SPEED -= 1
-
-        pygame.display.update()
-        for event in pygame.event.get():
-            # 閉じるボタン
-            if event.type == QUIT:
-                pygame.quit()
-                sys.exit()
+                    cause = value
+            if game_over or (player is not None and player.finished(game.tick)):
+                if autoplayer is None and player is None:  # AIとリプレイのスコアはハイスコアに入れない
+                    telemetry.record_score(game.record, game.tick, cause)
+                shutdown()
+                gameover(screen, game.record, assets.result_image())
+
+        # 変化した部分だけを描画して画面に反映する (行消去中はアニメーションも進める)
+        clear_progress: float = 0.0
+        if game.clearing_rows:
+            clear_progress = (game.clear_ticks - game.clear_timer + accumulator / TICK_MS) / game.clear_ticks
+        if not minimized:  # 最小化されている間は描画しない
+            renderer.draw(game.board, game.block, game.hold_block, game.record,
+                          game.clearing_rows, clear_progress)
+            if session is not None:
+                renderer.draw_opponent(session.remote_game.board)
+            renderer.present()
+        profiler.end_frame()
+
+    # Game Over時の処理 (gameoverの画面から戻ってきた場合も、ESCか閉じるボタンまで眠って待つ)
+    wait_key()
+
 
-            if event.type == KEYDOWN:
-                # Escapeキーが押された場合
-                if event.key == K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-                    
-                if event.key == K_LSHIFT:
-                    if can_hold:
-                        if hold_block is None:
-                            hold_block = block
-                            block = Block(next_block_type)
-                            next_block_type = random.randint(2, 8)
-                        else:
-                            hold_block, block = block, hold_block
-                        block.row, block.col = 1, 5
-                        can_hold = False
-                        
-                # ブロックの回転
-                if event.key == K_a or event.key == K_SPACE:  # 反時計回り
-                    block.rotate(board, 1)
-                if event.key == K_s:  # 時計回り
-                    block.rotate(board, 0)
-
-    # Game Over時の処理 (現状は何もしない)
-    while game_over:
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                pygame.quit
-                sys.exit()
-            if event.type == KEYDOWN:
-                if event.key == K_ESCAPE:
-                    pygame.quit()
-                    sys.exit()
-                    
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="KOKARIS")
+    parser.add_argument("--demo", action="store_true", help="AIが自動でプレイするデモモード")
+    parser.add_argument("--record", metavar="FILE", help="操作をリプレイファイルに保存する")
+    parser.add_argument("--replay", metavar="FILE", help="リプレイファイルを再生する (画面なしの検証は python replay.py FILE)")
+    parser.add_argument("--profile", metavar="FILE", nargs="?", const="trace.json",
+                        help="処理時間をオーバーレイで表示し、終了時にChromeのトレース形式で保存する (既定: trace.json)")
+    parser.add_argument("--das", type=float, default=DAS_MS, help="連続移動が始まるまでの時間 (ミリ秒)")
+    parser.add_argument("--arr", type=float, default=ARR_MS, help="連続移動の間隔 (ミリ秒)")
+    parser.add_argument("--soft-drop", type=float, default=SOFT_DROP_MS, help="ソフトドロップの間隔 (ミリ秒)")
+    parser.add_argument("--host", metavar="PORT", type=int, nargs="?", const=DEFAULT_PORT,
+                        help="対戦モード: 相手の接続を待つ (既定のポート: {})".format(DEFAULT_PORT))
+    parser.add_argument("--connect", metavar="HOST[:PORT]", help="対戦モード: 相手に接続する")
+    parser.add_argument("--rows", type=int, default=MAX_ROW, help="盤面の行数 (既定: {})".format(MAX_ROW))
+    parser.add_argument("--cols", type=int, default=MAX_COL, help="盤面の列数 (既定: {})".format(MAX_COL))
+    parser.add_argument("--mute", action="store_true", help="効果音を鳴らさない")
+    parser.add_argument("--resume", metavar="FILE", nargs="?", const=SAVE_PATH,
+                        help="途中でやめたゲームを続きから遊ぶ (既定: {})".format(SAVE_PATH))
+    parser.add_argument("--telemetry", metavar="FILE", nargs="?", const=TELEMETRY_PATH,
+                        help="ゲームのイベントとスコアを記録する (既定: {}。.jsonl なら1行1イベントのJSON)".format(TELEMETRY_PATH))
+    args = parser.parse_args()
+    if args.rows < 4 or args.cols < 4:
+        parser.error("--rows と --cols は4以上にしてください")
+    if (args.rows, args.cols) != (MAX_ROW, MAX_COL) and (args.demo or args.record or args.replay
+                                                         or args.host is not None or args.connect):
+        # AI、リプレイのファイル、対戦の通信は標準の大きさの盤面を前提にしている
+        parser.error("--demo, --record, --replay と対戦モードは、標準の大きさの盤面でだけ使えます")
+    if args.resume and (args.record or args.replay or args.host is not None or args.connect):
+        parser.error("--resume は --record, --replay や対戦モードと一緒に使えません (どれも最初から始める必要がある)")
+    main(demo=args.demo, record=args.record, replay=args.replay, profile=args.profile,
+         das_ms=args.das, arr_ms=args.arr, soft_drop_ms=args.soft_drop, host=args.host, connect=args.connect,
+         rows=args.rows, cols=args.cols, mute=args.mute, resume=args.resume,
+         telemetry_path=args.telemetry)
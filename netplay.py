@@ -0,0 +1,510 @@
+# TCPで2人対戦するためのモジュール。
+# 両方のプレイヤーが、自分と相手の2つのGameを同じシードで動かし、毎回の更新の操作をtickつきで送り合う (ロックステップ)。
+# 両方の操作がそろったtickだけゲームを進めるので、どちらの画面でも全く同じ結果になる。
+# 操作は何もしなかったtickを送らず、数tickごとに「このtickまで送った」という印だけを送るので、通信量は小さい。
+# 固定したときに変わった行だけを送り (差分)、相手の画面で動かしている自分のゲームとずれていないかを確かめる。
+#
+# 通信はasyncioで別スレッドで行い、メインループとはqueue.Queueでやりとりするので、描画が通信を待つことはない。
+import asyncio
+import queue
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from engine import (MAX_ROW, MAX_COL, ACTION_NONE, EVENT_SPAWN, EVENT_LOCK, EVENT_LINE_CLEAR, EVENT_TSPIN,
+                    EVENT_GARBAGE, Board, Game)
+from replay import write_varint, read_varint
+
+PROTOCOL_VERSION: int = 1
+DEFAULT_PORT: int = 50007
+INPUT_DELAY: int = 6  # 自分の操作を反映するまでの更新回数 (通信の遅れを隠すため、100ミリ秒)
+SEND_INTERVAL: int = 3  # 操作がなくても「このtickまで送った」を送る間隔 (更新回数)
+HISTORY_TICKS: int = 600  # 相手から届いた行の差分と比べるために、盤面を覚えておく更新回数
+
+# メッセージの種類
+MSG_HELLO: int = 0  # バージョン, シード (ホストから)
+MSG_INPUTS: int = 1  # 操作が分かっている最後のtickの前回からの増分, 操作の数, (前の操作からのtickの差, 操作) x 操作の数
+MSG_ROWS: int = 2  # tick, 行の数, (行番号, 行の内容) x 行の数
+MSG_BYE: int = 3
+
+# 消した行数ごとに相手に送るおじゃまブロックの行数 (T-spinは消した行数の2倍)
+GARBAGE_TABLE: List[int] = [0, 0, 1, 2, 4]
+
+
+def pack_row(row: List[int]) -> int:
+    """
+    ボードの1行 (壁を除く) を、1マス4ビットの整数にまとめる。
+
+    Args:
+        row (List[int]): ボードの1行 (壁を含む)。
+
+    Returns:
+        int: まとめた整数。
+    """
+    packed: int = 0
+    for col in range(MAX_COL, 0, -1):
+        packed = (packed << 4) | row[col]
+    return packed
+
+
+def unpack_row(packed: int) -> List[int]:
+    """
+    pack_rowでまとめた整数を、ボードの1行 (壁を含む) に戻す。
+
+    Args:
+        packed (int): まとめた整数。
+
+    Returns:
+        List[int]: ボードの1行。
+    """
+    row: List[int] = [1] + [0] * MAX_COL + [1]
+    for col in range(1, MAX_COL + 1):
+        row[col] = packed & 0xF
+        packed >>= 4
+    return row
+
+
+def pack_board(board: Board) -> List[int]:
+    """
+    ボードの画面内の全ての行をpack_rowでまとめる。
+
+    Args:
+        board (Board): ゲームボードの状態。
+
+    Returns:
+        List[int]: 行ごとのまとめた整数 (インデックス0が2行目)。
+    """
+    return [pack_row(board[row]) for row in range(2, MAX_ROW + 2)]
+
+
+def garbage_lines(events: List[Tuple[str, object]]) -> int:
+    """
+    1回の更新のイベントから、相手に送るおじゃまブロックの行数を求める。
+
+    Args:
+        events (List[Tuple[str, object]]): Game.stepが返したイベント。
+
+    Returns:
+        int: おじゃまブロックの行数。
+    """
+    count: int = 0
+    tspin: int = 0
+    for name, value in events:
+        if name == EVENT_LINE_CLEAR:
+            count = len(value)
+        elif name == EVENT_TSPIN:
+            tspin = value[0]
+    if tspin == 2:
+        return 2 * count
+    return GARBAGE_TABLE[min(count, 4)]
+
+
+def encode_hello(seed: int) -> bytes:
+    """
+    HELLOメッセージを作る。
+
+    Args:
+        seed (int): 対戦に使うシード。
+
+    Returns:
+        bytes: メッセージ。
+    """
+    buffer = bytearray([MSG_HELLO])
+    write_varint(buffer, PROTOCOL_VERSION)
+    write_varint(buffer, seed)
+    return bytes(buffer)
+
+
+def decode_hello(message: bytes) -> int:
+    """
+    HELLOメッセージからシードを取り出す。
+
+    Args:
+        message (bytes): メッセージ。
+
+    Returns:
+        int: シード。
+    """
+    version, pos = read_varint(message, 1)
+    if version != PROTOCOL_VERSION:
+        raise ValueError("protocol version mismatch: {} != {}".format(version, PROTOCOL_VERSION))
+    seed, _ = read_varint(message, pos)
+    return seed
+
+
+class VersusSession:
+    """
+    2人対戦の1人分の進行を管理するクラス。ネットワークには依存せず、送るメッセージと届いたメッセージをバイト列で扱う。
+    """
+    def __init__(self, seed: int, local: int, clear_ticks: int = 0, input_delay: int = INPUT_DELAY) -> None:
+        """
+        VersusSessionクラスの初期化。
+
+        Args:
+            seed (int): 対戦に使うシード (両方のプレイヤーで同じ値)。
+            local (int): 自分のプレイヤー番号 (ホストが0、接続した側が1)。
+            clear_ticks (int): Gameに渡す行消去中の更新回数。
+            input_delay (int): 自分の操作を反映するまでの更新回数。
+        """
+        self.local: int = local
+        self.input_delay: int = input_delay
+        self.remote: int = 1 - local
+        self.games: List[Game] = [Game(seed * 2 + i, clear_ticks=clear_ticks) for i in range(2)]
+        self.garbage_rngs: List[random.Random] = [random.Random(seed * 2 + 1 - i) for i in range(2)]  # 穴の列
+        self.inputs: List[Dict[int, int]] = [{}, {}]  # プレイヤーごとの、tick -> 操作 (操作のないtickは持たない)
+        self.frontier: List[int] = [input_delay, input_delay]  # プレイヤーごとの、操作が分かっている最後のtick
+        self.tick: int = 0  # 両方のゲームを進めた回数
+        self.outbox: List[bytes] = []  # 相手に送るメッセージ
+        self.unsent: List[Tuple[int, int]] = []  # まだ送っていない自分の (tick, 操作)
+        self.sent_frontier: int = input_delay  # 最後に送ったMSG_INPUTSの、操作が分かっている最後のtick
+        self.sent_rows: List[int] = pack_board(self.games[local].board)  # 最後に相手に送った自分の盤面
+        self.mirror: List[int] = pack_board(self.games[self.remote].board)  # 相手から届いた相手の盤面
+        self.history: Dict[int, List[int]] = {}  # tick -> そのtickの後の相手のゲームの盤面 (差分の確認用、直近HISTORY_TICKS分)
+        self.pending_rows: Dict[int, List[Tuple[int, int]]] = {}  # まだそのtickまで進んでいない相手の差分
+        self.desyncs: int = 0  # 相手の画面とずれた回数
+        self.finished: bool = False  # 相手が切断したか
+
+    @property
+    def local_game(self) -> Game:
+        return self.games[self.local]
+
+    @property
+    def remote_game(self) -> Game:
+        return self.games[self.remote]
+
+    def needs_input(self) -> bool:
+        """
+        自分の操作をもう1つ受け付けられるかどうかを返す (相手を待っている間に、先に進みすぎないようにする)。
+
+        Returns:
+            bool: 受け付けられる場合はTrue。
+        """
+        return self.frontier[self.local] < self.tick + self.input_delay
+
+    def add_local_input(self, action: int) -> None:
+        """
+        自分の次の操作を追加する。INPUT_DELAY回後の更新で反映される。
+
+        Args:
+            action (int): 操作 (ACTION_* の組み合わせ)。
+        """
+        self.frontier[self.local] += 1
+        tick: int = self.frontier[self.local]
+        if action != ACTION_NONE:
+            self.inputs[self.local][tick] = action
+            self.unsent.append((tick, action))
+        if tick - self.sent_frontier >= SEND_INTERVAL:  # 操作は数tick分まとめて送る
+            self.flush_inputs()
+
+    def flush_inputs(self) -> None:
+        """
+        まだ送っていない自分の操作をMSG_INPUTSにまとめて送る。
+        """
+        buffer = bytearray([MSG_INPUTS])
+        frontier: int = self.frontier[self.local]
+        write_varint(buffer, frontier - self.sent_frontier)
+        write_varint(buffer, len(self.unsent))
+        last_tick: int = self.sent_frontier
+        for tick, action in self.unsent:
+            write_varint(buffer, tick - last_tick)
+            write_varint(buffer, action)
+            last_tick = tick
+        self.outbox.append(bytes(buffer))
+        self.unsent = []
+        self.sent_frontier = frontier
+
+    def receive(self, message: bytes) -> None:
+        """
+        相手から届いたメッセージを処理する。
+
+        Args:
+            message (bytes): メッセージ。
+        """
+        kind: int = message[0]
+        if kind == MSG_INPUTS:
+            advance, pos = read_varint(message, 1)
+            count, pos = read_varint(message, pos)
+            tick: int = self.frontier[self.remote]
+            for _ in range(count):
+                delta, pos = read_varint(message, pos)
+                action, pos = read_varint(message, pos)
+                tick += delta
+                self.inputs[self.remote][tick] = action
+            self.frontier[self.remote] += advance
+        elif kind == MSG_ROWS:
+            tick, pos = read_varint(message, 1)
+            count, pos = read_varint(message, pos)
+            rows: List[Tuple[int, int]] = []
+            for _ in range(count):
+                row, pos = read_varint(message, pos)
+                packed, pos = read_varint(message, pos)
+                rows.append((row, packed))
+            if tick <= self.tick:
+                self.check_rows(tick, rows)
+            else:
+                self.pending_rows[tick] = rows
+        elif kind == MSG_BYE:
+            self.finished = True
+
+    def can_step(self) -> bool:
+        """
+        次のtickの両方の操作がそろっているかどうかを返す。
+
+        Returns:
+            bool: 進められる場合はTrue。
+        """
+        return self.frontier[0] > self.tick and self.frontier[1] > self.tick
+
+    def step(self) -> List[List[Tuple[str, object]]]:
+        """
+        両方のゲームを1回進める。消した行に応じて、おじゃまブロックを相手のゲームに送る。
+        can_step()がTrueのときだけ呼び出す。
+
+        Returns:
+            List[List[Tuple[str, object]]]: プレイヤーごとの、この更新で起きたイベント。
+        """
+        self.tick += 1
+        tick: int = self.tick
+        all_events: List[List[Tuple[str, object]]] = []
+        for index, game in enumerate(self.games):
+            _, events = game.step(self.inputs[index].pop(tick, ACTION_NONE))
+            lines: int = game.cancel_garbage(garbage_lines(events))
+            if lines > 0:
+                hole_col: int = self.garbage_rngs[1 - index].randint(1, MAX_COL)
+                self.games[1 - index].receive_garbage(lines, hole_col)
+            all_events.append(events)
+
+        if self.board_changed(all_events[self.local]):
+            self.send_rows()
+        if self.board_changed(all_events[self.remote]):
+            self.history[tick] = pack_board(self.remote_game.board)
+        # 盤面が変わったtickだけを覚えているので、古いものはまとめて消す (辞書はtickの小さい順に並んでいる)
+        while self.history and next(iter(self.history)) <= tick - HISTORY_TICKS:
+            del self.history[next(iter(self.history))]
+        if tick in self.pending_rows:
+            self.check_rows(tick, self.pending_rows.pop(tick))
+        return all_events
+
+    @staticmethod
+    def board_changed(events: List[Tuple[str, object]]) -> bool:
+        """
+        この更新でボードの内容が変わった可能性があるかどうかを返す (固定、行の消去の完了、おじゃまブロック)。
+
+        Args:
+            events (List[Tuple[str, object]]): Game.stepが返したイベント。
+
+        Returns:
+            bool: 変わった可能性がある場合はTrue。
+        """
+        return any(name in (EVENT_LOCK, EVENT_GARBAGE, EVENT_SPAWN) for name, _ in events)
+
+    def send_rows(self) -> None:
+        """
+        自分の盤面のうち、前回送ったときから変わった行だけを送る。
+        """
+        rows: List[int] = pack_board(self.local_game.board)
+        changed: List[Tuple[int, int]] = [(index, packed) for index, (packed, sent)
+                                          in enumerate(zip(rows, self.sent_rows)) if packed != sent]
+        if not changed:
+            return
+        buffer = bytearray([MSG_ROWS])
+        write_varint(buffer, self.tick)
+        write_varint(buffer, len(changed))
+        for index, packed in changed:
+            write_varint(buffer, index)
+            write_varint(buffer, packed)
+        self.outbox.append(bytes(buffer))
+        self.sent_rows = rows
+
+    def check_rows(self, tick: int, rows: List[Tuple[int, int]]) -> None:
+        """
+        相手から届いた行の差分を反映した相手の盤面と、こちらで動かしている相手のゲームの盤面を比べる。
+
+        Args:
+            tick (int): 差分を送ったときのtick。
+            rows (List[Tuple[int, int]]): (行番号, 行の内容) のリスト。
+        """
+        for index, packed in rows:
+            self.mirror[index] = packed
+        simulated: Optional[List[int]] = self.history.get(tick)
+        if simulated is not None and simulated != self.mirror:
+            self.desyncs += 1
+
+    def take_outbox(self) -> List[bytes]:
+        """
+        送るメッセージを取り出す。
+
+        Returns:
+            List[bytes]: メッセージのリスト。
+        """
+        messages, self.outbox = self.outbox, []
+        return messages
+
+
+class Connection:
+    """
+    asyncioのTCP通信を別スレッドで動かし、メッセージをキューでやりとりするクラス。
+    メッセージは長さ (可変長整数) を先頭につけて送る。メインループからはsendとreceiveだけを使い、どちらも待たない。
+    """
+    def __init__(self) -> None:
+        """
+        Connectionクラスの初期化。start_hostかstart_clientで通信を始める。
+        """
+        self.incoming: "queue.Queue[bytes]" = queue.Queue()  # 届いたメッセージ
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.outgoing: Optional[asyncio.Queue] = None  # 送るメッセージ (通信スレッドのイベントループで使う)
+        self.thread: Optional[threading.Thread] = None
+        self.connected: threading.Event = threading.Event()
+        self.closed: bool = False  # 切断されたか
+        self.error: Optional[str] = None
+        self.bytes_sent: int = 0
+        self.bytes_received: int = 0
+
+    def start_host(self, port: int = DEFAULT_PORT, host: str = "0.0.0.0") -> None:
+        """
+        相手からの接続を待つ。
+
+        Args:
+            port (int): 待ち受けるポート番号。
+            host (str): 待ち受けるアドレス。
+        """
+        self.start(self.serve(host, port))
+
+    def start_client(self, host: str, port: int = DEFAULT_PORT) -> None:
+        """
+        相手に接続する。
+
+        Args:
+            host (str): 相手のアドレス。
+            port (int): 相手のポート番号。
+        """
+        self.start(self.connect(host, port))
+
+    def start(self, coroutine) -> None:
+        """
+        通信スレッドを起動し、その中でcoroutineを動かす。
+
+        Args:
+            coroutine: 通信スレッドで動かすコルーチン。
+        """
+        def run() -> None:
+            loop = asyncio.new_event_loop()
+            # sendはself.loopを見て送り始めるので、送信キューを作ってからself.loopを設定する
+            self.outgoing = asyncio.Queue()
+            self.loop = loop
+            try:
+                loop.run_until_complete(coroutine)
+            except Exception as error:  # 通信の失敗はメインループに伝えて、ゲームは止めない
+                self.error = str(error)
+            finally:
+                self.closed = True
+                loop.close()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    async def serve(self, host: str, port: int) -> None:
+        """
+        1人分の接続を待ち、接続したら通信を行う。
+        """
+        accepted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            if accepted.done():  # 3人目以降は断る
+                writer.close()
+                return
+            accepted.set_result((reader, writer))
+
+        server = await asyncio.start_server(on_connect, host, port)
+        async with server:
+            reader, writer = await accepted
+        await self.communicate(reader, writer)
+
+    async def connect(self, host: str, port: int) -> None:
+        """
+        相手に接続して、通信を行う。
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        await self.communicate(reader, writer)
+
+    async def communicate(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        送信と受信を、どちらかが終わるまで同時に行う。
+        """
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            import socket
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # 小さなメッセージをすぐに送る
+        self.connected.set()
+        send_task = asyncio.ensure_future(self.send_loop(writer))
+        receive_task = asyncio.ensure_future(self.receive_loop(reader))
+        done, pending = await asyncio.wait({send_task, receive_task}, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        writer.close()
+        for task in done:
+            task.result()  # 例外があればstartに伝える
+
+    async def send_loop(self, writer: asyncio.StreamWriter) -> None:
+        while True:
+            message: Optional[bytes] = await self.outgoing.get()
+            if message is None:
+                return
+            frame = bytearray()
+            write_varint(frame, len(message))
+            frame += message
+            writer.write(bytes(frame))
+            self.bytes_sent += len(frame)
+            await writer.drain()
+
+    async def receive_loop(self, reader: asyncio.StreamReader) -> None:
+        while True:
+            length: int = 0
+            shift: int = 0
+            header_size: int = 0  # 長さの可変長整数のバイト数 (128バイト以上のメッセージでは2バイト以上)
+            try:
+                while True:
+                    header: int = (await reader.readexactly(1))[0]
+                    header_size += 1
+                    length |= (header & 0x7F) << shift
+                    shift += 7
+                    if header < 0x80:
+                        break
+                message: bytes = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:  # 切断された
+                return
+            self.bytes_received += header_size + length
+            self.incoming.put(message)
+
+    def send(self, message: bytes) -> None:
+        """
+        メッセージを送る (送信は通信スレッドで行うので、すぐに戻る)。
+
+        Args:
+            message (bytes): メッセージ。
+        """
+        if self.loop is not None and not self.closed:
+            self.loop.call_soon_threadsafe(self.outgoing.put_nowait, message)
+
+    def receive(self) -> List[bytes]:
+        """
+        届いているメッセージを全て取り出す (届いていなければ空のリストを返し、待たない)。
+
+        Returns:
+            List[bytes]: メッセージのリスト。
+        """
+        messages: List[bytes] = []
+        while True:
+            try:
+                messages.append(self.incoming.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self) -> None:
+        """
+        送信を終えて切断する。
+        """
+        if self.loop is not None and not self.closed:
+            self.loop.call_soon_threadsafe(self.outgoing.put_nowait, None)
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
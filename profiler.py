@@ -0,0 +1,189 @@
+# メインループの処理時間を計測するモジュール (python kokaris.py --profile で有効)。
+# 区間ごとの時間をChromeのトレース形式 (chrome://tracing や Perfetto で開けるJSON) で保存し、
+# 直近のフレーム時間から p50/p95/p99 を求める。pygameには依存しない。
+import json
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Tuple, Union
+
+MAX_TRACE_EVENTS: int = 500000  # 保存する区間の最大数 (超えたら古いものから捨てる)
+FRAME_WINDOW: int = 240  # パーセンタイルとグラフに使うフレーム数
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    値のリストのパーセンタイル (最近傍順位法) を返す。
+
+    Args:
+        values (List[float]): 昇順に並べた値のリスト。
+        p (float): パーセンタイル (0から100)。
+
+    Returns:
+        float: パーセンタイルの値。リストが空の場合は0.0。
+    """
+    if not values:
+        return 0.0
+    index: int = max(0, min(len(values) - 1, round(p / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class _Section:
+    """
+    Profiler.sectionが返す、with文で区間の時間を計測するオブジェクト。
+    """
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.profiler: "Profiler" = profiler
+        self.name: str = name
+        self.start: float = 0.0
+
+    def __enter__(self) -> "_Section":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profiler.add(self.name, self.start, time.perf_counter())
+
+
+class _NullSection:
+    """
+    計測が無効なときにsectionが返す、何もしないオブジェクト。
+    """
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSection":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NULL_SECTION: _NullSection = _NullSection()
+
+
+class Profiler:
+    """
+    メインループの区間ごとの処理時間を記録するクラス。
+    無効な場合、sectionは何もしないオブジェクトを返すので、計測のコードを残したままでも遅くならない。
+    """
+    def __init__(self, enabled: bool = False) -> None:
+        """
+        Profilerクラスの初期化。
+
+        Args:
+            enabled (bool): Trueの場合に計測する。
+        """
+        self.enabled: bool = enabled
+        self.origin: float = time.perf_counter()  # トレースの時刻の基準
+        self.events: Deque[Tuple[str, float, float]] = deque(maxlen=MAX_TRACE_EVENTS)  # (名前, 開始, 終了)
+        self.frame_times: Deque[float] = deque(maxlen=FRAME_WINDOW)  # 1フレームの処理時間 (ミリ秒)
+        self.frame_start: float = 0.0
+        self.frame_count: int = 0
+
+    def section(self, name: str) -> Union[_Section, _NullSection]:
+        """
+        with文で使う、区間の計測オブジェクトを返す。
+
+        Args:
+            name (str): 区間の名前 (トレースに表示される)。
+
+        Returns:
+            Union[_Section, _NullSection]: 計測オブジェクト。
+        """
+        if not self.enabled:
+            return _NULL_SECTION
+        return _Section(self, name)
+
+    def add(self, name: str, start: float, end: float) -> None:
+        """
+        計測した区間を記録する。
+
+        Args:
+            name (str): 区間の名前。
+            start (float): 開始時刻 (time.perf_counter)。
+            end (float): 終了時刻 (time.perf_counter)。
+        """
+        self.events.append((name, start, end))
+
+    def instrument(self, owner: object, attr: str, name: str) -> None:
+        """
+        owner (モジュールやクラス) の関数を、呼ばれるたびに計測する関数に置き換える。
+        engineのようにpygameから独立したモジュールの中の処理を、コードを変えずに計測するために使う。
+
+        Args:
+            owner (object): 関数を持つモジュールまたはクラス。
+            attr (str): 関数の名前。
+            name (str): 区間の名前。
+        """
+        if not self.enabled:
+            return
+        func: Callable = getattr(owner, attr)
+        events = self.events
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start: float = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                events.append((name, start, clock()))
+
+        timed.__wrapped__ = func
+        setattr(owner, attr, timed)
+
+    def begin_frame(self) -> None:
+        """
+        フレームの処理の開始を記録する。
+        """
+        if self.enabled:
+            self.frame_start = time.perf_counter()
+
+    def end_frame(self) -> None:
+        """
+        フレームの処理の終了を記録する。
+        """
+        if not self.enabled:
+            return
+        end: float = time.perf_counter()
+        self.events.append(("frame", self.frame_start, end))
+        self.frame_times.append((end - self.frame_start) * 1000)
+        self.frame_count += 1
+
+    def percentiles(self) -> Tuple[float, float, float]:
+        """
+        直近のフレーム時間の p50/p95/p99 を返す。
+
+        Returns:
+            Tuple[float, float, float]: p50, p95, p99 (ミリ秒)。
+        """
+        values: List[float] = sorted(self.frame_times)
+        return percentile(values, 50), percentile(values, 95), percentile(values, 99)
+
+    def trace(self) -> Dict:
+        """
+        記録した区間をChromeのトレース形式に変換する。
+
+        Returns:
+            Dict: traceEventsを持つ辞書。
+        """
+        origin: float = self.origin
+        trace_events: List[Dict] = [
+            {"name": name, "ph": "X", "pid": 1, "tid": 1,
+             "ts": round((start - origin) * 1e6, 1), "dur": round((end - start) * 1e6, 1)}
+            for name, start, end in self.events
+        ]
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: Union[str, Path]) -> None:
+        """
+        記録した区間をChromeのトレース形式のJSONファイルに保存する。
+
+        Args:
+            path (Union[str, Path]): 保存先のパス。
+        """
+        if not self.enabled:
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f)
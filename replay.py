@@ -0,0 +1,301 @@
+# リプレイの記録と再生を行うモジュール。
+# Gameはシードと毎回の操作だけで結果が決まるので、(tick, 操作) の組だけを保存すれば同じゲームを再現できる。
+#
+# ファイル形式 (整数は全て可変長整数 (varint, 7ビットずつ下位から、続きがあれば最上位ビットを立てる)):
+#   MAGIC, シード, clear_ticks, 最後のtick, スコア, 消した行数, 操作の数,
+#   (前の操作からのtickの差, 操作) x 操作の数
+# 何も操作しなかったtickは記録しないので、放置している時間はファイルの大きさに影響しない。
+import sys
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+from engine import ACTION_NONE, TICK_MS, Game
+
+MAGIC: bytes = b"KKR2"  # 落下の速さが変わったとき (KKR1: 1マスにgravity_ticks + 1回かかっていた) に番号を上げる
+
+
+def write_varint(buffer: bytearray, value: int) -> None:
+    """
+    0以上の整数を可変長整数としてbufferの末尾に追加する。
+
+    Args:
+        buffer (bytearray): 書き込み先。
+        value (int): 0以上の整数。
+    """
+    if value < 0:
+        raise ValueError("varint must be non-negative: {}".format(value))
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    dataのposの位置から可変長整数を1つ読む。
+
+    Args:
+        data (bytes): 読み込むデータ。
+        pos (int): 読み始める位置。
+
+    Returns:
+        Tuple[int, int]: 読んだ値と、次に読む位置。
+    """
+    value: int = 0
+    shift: int = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("truncated replay")
+        byte: int = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class Replay:
+    """
+    1ゲーム分のリプレイ。シードと、操作したtickと操作の組のリストを持つ。
+    """
+    def __init__(self, seed: int, clear_ticks: int = 0) -> None:
+        """
+        Replayクラスの初期化。
+
+        Args:
+            seed (int): ゲームの乱数のシード。
+            clear_ticks (int): Gameに渡した行消去中の更新回数。
+        """
+        self.seed: int = seed
+        self.clear_ticks: int = clear_ticks
+        self.actions: List[Tuple[int, int]] = []  # (tick, 操作) のリスト (tickの昇順)
+        self.end_tick: int = 0  # 記録を終えたときのtick
+        self.score: int = 0  # 記録を終えたときのスコア (検証用)
+        self.cleared_row: int = 0  # 記録を終えたときの消した行数 (検証用)
+
+    def to_bytes(self) -> bytes:
+        """
+        リプレイをバイナリ形式に変換する。
+
+        Returns:
+            bytes: ファイルに書き込むデータ。
+        """
+        buffer = bytearray(MAGIC)
+        for value in (self.seed, self.clear_ticks, self.end_tick, self.score, self.cleared_row, len(self.actions)):
+            write_varint(buffer, value)
+        last_tick: int = 0
+        for tick, action in self.actions:
+            write_varint(buffer, tick - last_tick)
+            write_varint(buffer, action)
+            last_tick = tick
+        return bytes(buffer)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Replay":
+        """
+        バイナリ形式のデータからリプレイを作る。
+
+        Args:
+            data (bytes): to_bytesで作ったデータ。
+
+        Returns:
+            Replay: 読み込んだリプレイ。
+        """
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a replay file")
+        pos: int = len(MAGIC)
+        header: List[int] = []
+        for _ in range(6):
+            value, pos = read_varint(data, pos)
+            header.append(value)
+        seed, clear_ticks, end_tick, score, cleared_row, count = header
+        replay = cls(seed, clear_ticks)
+        replay.end_tick, replay.score, replay.cleared_row = end_tick, score, cleared_row
+        tick: int = 0
+        for _ in range(count):
+            delta, pos = read_varint(data, pos)
+            action, pos = read_varint(data, pos)
+            tick += delta
+            replay.actions.append((tick, action))
+        return replay
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        リプレイをファイルに保存する。
+
+        Args:
+            path (Union[str, Path]): 保存先のパス。
+        """
+        Path(path).write_bytes(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "Replay":
+        """
+        ファイルからリプレイを読み込む。
+
+        Args:
+            path (Union[str, Path]): リプレイファイルのパス。
+
+        Returns:
+            Replay: 読み込んだリプレイ。
+        """
+        return cls.from_bytes(Path(path).read_bytes())
+
+    def new_game(self) -> Game:
+        """
+        リプレイと同じシードと設定で、新しいゲームを作る。
+
+        Returns:
+            Game: 記録を始めたときと同じ状態のゲーム。
+        """
+        return Game(self.seed, clear_ticks=self.clear_ticks)
+
+
+class Recorder:
+    """
+    Game.stepに渡した操作を記録するクラス。
+    """
+    def __init__(self, game: Game) -> None:
+        """
+        Recorderクラスの初期化。gameはシードを指定して作っておく必要がある。
+
+        Args:
+            game (Game): 記録するゲーム (まだstepを呼んでいないもの)。
+        """
+        if game.seed is None:
+            raise ValueError("a replay needs a game created with an explicit seed")
+        self.game: Game = game
+        self.replay: Replay = Replay(game.seed, game.clear_ticks)
+
+    def record(self, action: int) -> None:
+        """
+        次のgame.stepに渡す操作を記録する。game.stepの直前に呼び出す。
+
+        Args:
+            action (int): 操作 (ACTION_* の組み合わせ)。
+        """
+        if action != ACTION_NONE:
+            self.replay.actions.append((self.game.tick + 1, action))
+
+    def finish(self) -> Replay:
+        """
+        記録を終え、その時点のtickとスコアをリプレイに書き込む。
+
+        Returns:
+            Replay: 記録したリプレイ。
+        """
+        self.replay.end_tick = self.game.tick
+        self.replay.score = self.game.record.score
+        self.replay.cleared_row = self.game.record.cleared_row
+        return self.replay
+
+
+class Player:
+    """
+    リプレイの操作を、tickごとに取り出すクラス。画面での再生と画面なしの再生の両方で使う。
+    """
+    def __init__(self, replay: Replay) -> None:
+        """
+        Playerクラスの初期化。
+
+        Args:
+            replay (Replay): 再生するリプレイ。
+        """
+        self.replay: Replay = replay
+        self.index: int = 0  # 次に使う操作の位置
+
+    def action(self, tick: int) -> int:
+        """
+        指定のtickに行う操作を返す。tickは1ずつ増やして呼び出す。
+
+        Args:
+            tick (int): これから進めるtick (game.tick + 1)。
+
+        Returns:
+            int: 操作 (記録がなければACTION_NONE)。
+        """
+        actions: List[Tuple[int, int]] = self.replay.actions
+        if self.index < len(actions) and actions[self.index][0] == tick:
+            self.index += 1
+            return actions[self.index - 1][1]
+        return ACTION_NONE
+
+    def finished(self, tick: int) -> bool:
+        """
+        リプレイを最後まで再生したかどうかを返す。
+
+        Args:
+            tick (int): 現在のtick (game.tick)。
+
+        Returns:
+            bool: 記録を終えたtickまで進んでいればTrue。
+        """
+        return tick >= self.replay.end_tick
+
+
+def iter_actions(replay: Replay) -> Iterator[int]:
+    """
+    リプレイの操作を、1tickごとに (操作のないtickはACTION_NONEとして) 返す。
+
+    Args:
+        replay (Replay): 再生するリプレイ。
+
+    Yields:
+        int: 各tickの操作。
+    """
+    player = Player(replay)
+    for tick in range(1, replay.end_tick + 1):
+        yield player.action(tick)
+
+
+def play(replay: Replay) -> Game:
+    """
+    画面を使わずに、リプレイを最後まで再生する。
+
+    Args:
+        replay (Replay): 再生するリプレイ。
+
+    Returns:
+        Game: 再生し終えたゲーム。
+    """
+    game: Game = replay.new_game()
+    step = game.step
+    for action in iter_actions(replay):
+        step(action)
+        if game.game_over:
+            break
+    return game
+
+
+def verify(replay: Replay) -> Optional[str]:
+    """
+    リプレイを再生して、記録されたスコアと一致するかを確かめる (大会のスコアの検証用)。
+
+    Args:
+        replay (Replay): 検証するリプレイ。
+
+    Returns:
+        Optional[str]: 一致しなかった場合はその内容。一致した場合はNone。
+    """
+    game: Game = play(replay)
+    expected = (replay.end_tick, replay.score, replay.cleared_row)
+    actual = (game.tick, game.record.score, game.record.cleared_row)
+    if expected != actual:
+        return "expected (tick, score, rows) = {}, got {}".format(expected, actual)
+    return None
+
+
+if __name__ == "__main__":
+    # python replay.py <リプレイファイル>... で、画面なしで再生してスコアを検証する
+    failed: bool = False
+    for name in sys.argv[1:]:
+        replay = Replay.load(name)
+        start = time.perf_counter()
+        error = verify(replay)
+        elapsed = time.perf_counter() - start
+        print("{}: {} ticks ({:.1f} min), score {}, {:.3f} s: {}".format(
+            name, replay.end_tick, replay.end_tick * TICK_MS / 60000, replay.score, elapsed,
+            "OK" if error is None else "MISMATCH " + error))
+        failed |= error is not None
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,292 @@
+# ゲームの途中の状態を保存し、そこから再開するためのモジュール。
+# 盤面のマスは1マス4ビットに詰め、乱数生成器はシードと引いた回数だけを保存する (再開時に同じ回数だけ引き直す)。
+#
+# ファイル形式 (整数は replay.py と同じ可変長整数。負になりうる値はジグザグ符号化):
+#   MAGIC, 行数, 列数, シード, 乱数を引いた回数, clear_ticks, tick,
+#   スコア, レベル, 消した行数, フラグ (1: ホールドできる, 2: ゲームオーバー),
+#   落下中のブロック (種類 (0はなし), 回転状態, 行, 列, 落下カウンター, 最後が回転か, 壁蹴りの番号),
+#   ホールド (落下中のブロックと同じ形式。ホールドから戻したブロックは落下カウンターなどをそのまま使うので全て保存する),
+#   次のブロック, まとめて引いたブロックの数, 種類 x 数,
+#   消去中の行の数, 行番号 x 数, 行消去の残りの更新回数, 覚えておいた操作,
+#   おじゃまブロックの数, (行数, 穴の列) x 数,
+#   盤面 (画面内の行を上から、1バイトに2マスずつ。画面外の2行は常に空なので保存しない)
+import sys
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from engine import Block, Board, Game, Score
+from replay import write_varint, read_varint
+
+MAGIC: bytes = b"KKS2"
+BLOCK_TYPES: range = range(2, 9)  # ブロックの種類として正しい値 (0と1は盤面の空と壁)
+
+
+def zigzag(value: int) -> int:
+    """
+    符号つき整数を、可変長整数で書ける0以上の整数に変換する (0, -1, 1, -2, ... -> 0, 1, 2, 3, ...)。
+    """
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value: int) -> int:
+    """
+    zigzagで変換した整数を元に戻す。
+    """
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+def pack_cells(board: Board) -> bytes:
+    """
+    画面内のマスを1マス4ビットに詰める。
+
+    Args:
+        board (Board): ゲームボードの状態。
+
+    Returns:
+        bytes: 詰めたマス ((行数 x 列数 + 1) // 2 バイト)。
+    """
+    values: List[int] = []
+    for row in range(2, board.rows + 2):
+        values.extend(board[row][1:board.cols + 1])
+    if len(values) % 2:
+        values.append(0)
+    return bytes(values[i] << 4 | values[i + 1] for i in range(0, len(values), 2))
+
+
+def unpack_cells(board: Board, data: bytes, pos: int) -> int:
+    """
+    pack_cellsで詰めたマスを、空のボードに書き込む。
+
+    Args:
+        board (Board): 書き込み先の空のボード。
+        data (bytes): 読み込むデータ。
+        pos (int): 詰めたマスの位置。
+
+    Returns:
+        int: 次に読む位置。
+    """
+    size: int = (board.rows * board.cols + 1) // 2
+    if pos + size > len(data):
+        raise ValueError("truncated snapshot")
+    values: List[int] = []
+    for byte in data[pos:pos + size]:
+        values.append(byte >> 4)
+        values.append(byte & 0x0F)
+    for row in range(board.rows):
+        board.cells[row + 2][1:board.cols + 1] = values[row * board.cols:(row + 1) * board.cols]
+    board.sync()
+    return pos + size
+
+
+def check_block_type(block_type: int) -> int:
+    """
+    読み込んだブロックの種類が正しいかを確かめる。
+
+    Args:
+        block_type (int): ブロックの種類。
+
+    Returns:
+        int: 正しい場合はそのままの値。
+
+    Raises:
+        ValueError: 種類が正しくない場合。
+    """
+    if block_type not in BLOCK_TYPES:
+        raise ValueError("invalid block type in snapshot: {}".format(block_type))
+    return block_type
+
+
+def write_block(buffer: bytearray, block: Optional[Block]) -> None:
+    """
+    ブロックの状態をbufferの末尾に追加する。
+
+    Args:
+        buffer (bytearray): 書き込み先。
+        block (Optional[Block]): ブロック。Noneの場合は種類0だけを書く。
+    """
+    if block is None:
+        write_varint(buffer, 0)
+        return
+    for value in (block.block_type, block.rotation, zigzag(block.row), zigzag(block.col),
+                  block.count, int(block.last_rotated), block.last_kick):
+        write_varint(buffer, value)
+
+
+def read_block(data: bytes, pos: int) -> Tuple[Optional[Block], int]:
+    """
+    write_blockで書いたブロックを読み込む。
+
+    Args:
+        data (bytes): 読み込むデータ。
+        pos (int): ブロックの位置。
+
+    Returns:
+        Tuple[Optional[Block], int]: ブロック (種類0ならNone) と、次に読む位置。
+
+    Raises:
+        ValueError: 種類か回転状態が正しくない場合。
+    """
+    block_type, pos = read_varint(data, pos)
+    if not block_type:
+        return None, pos
+    fields: List[int] = []
+    for _ in range(6):
+        value, pos = read_varint(data, pos)
+        fields.append(value)
+    rotation, row, col, count, last_rotated, last_kick = fields
+    if rotation > 3:
+        raise ValueError("invalid rotation in snapshot: {}".format(rotation))
+    block = Block(check_block_type(block_type))
+    block.set_rotation(rotation)
+    block.row, block.col = unzigzag(row), unzigzag(col)
+    block.count, block.last_rotated, block.last_kick = count, bool(last_rotated), last_kick
+    return block, pos
+
+
+def to_bytes(game: Game) -> bytes:
+    """
+    ゲームの状態をバイナリ形式に変換する。
+
+    Args:
+        game (Game): 保存するゲーム。
+
+    Returns:
+        bytes: スナップショット。
+    """
+    buffer = bytearray(MAGIC)
+    record: Score = game.record
+    for value in (game.rows, game.cols, game.seed, game.draws, game.clear_ticks, game.tick,
+                  record.score, record.level, record.cleared_row,
+                  (1 if game.can_hold else 0) | (2 if game.game_over else 0)):
+        write_varint(buffer, value)
+    write_block(buffer, game.block)
+    write_block(buffer, game.hold_block)
+    write_varint(buffer, game.next_block_type)
+    for values in (game.upcoming, game.clearing_rows):
+        write_varint(buffer, len(values))
+        for value in values:
+            write_varint(buffer, value)
+    write_varint(buffer, game.clear_timer)
+    write_varint(buffer, game.buffered_action)
+    write_varint(buffer, len(game.pending_garbage))
+    for lines, hole_col in game.pending_garbage:
+        write_varint(buffer, lines)
+        write_varint(buffer, hole_col)
+    buffer += pack_cells(game.board)
+    return bytes(buffer)
+
+
+def from_bytes(data: bytes) -> Game:
+    """
+    バイナリ形式のスナップショットから、ゲームを作り直す。
+
+    Args:
+        data (bytes): スナップショット。
+
+    Returns:
+        Game: 保存したときと同じ状態のゲーム。
+
+    Raises:
+        ValueError: 形式が正しくない場合。
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a KOKARIS snapshot")
+    pos: int = len(MAGIC)
+    values: List[int] = []
+    for _ in range(10):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    rows, cols, seed, draws, clear_ticks, tick, score, level, cleared_row, flags = values
+
+    # 乱数生成器は、シードから同じ回数だけ引き直して同じ状態にする
+    game = Game(seed, clear_ticks=clear_ticks, rows=rows, cols=cols)
+    randint = game.rng.randint
+    for _ in range(draws - game.draws):
+        randint(2, 8)
+    game.draws = draws
+    game.tick = tick
+    game.record.score, game.record.level, game.record.cleared_row = score, level, cleared_row
+    game.can_hold = bool(flags & 1)
+    game.game_over = bool(flags & 2)
+
+    game.block, pos = read_block(data, pos)
+    game.hold_block, pos = read_block(data, pos)
+    game.next_block_type, pos = read_varint(data, pos)
+    check_block_type(game.next_block_type)
+    lists: List[List[int]] = []
+    for _ in range(2):
+        count, pos = read_varint(data, pos)
+        items: List[int] = []
+        for _ in range(count):
+            value, pos = read_varint(data, pos)
+            items.append(value)
+        lists.append(items)
+    game.upcoming, game.clearing_rows = lists
+    for block_type in game.upcoming:
+        check_block_type(block_type)
+    game.clear_timer, pos = read_varint(data, pos)
+    game.buffered_action, pos = read_varint(data, pos)
+    count, pos = read_varint(data, pos)
+    game.pending_garbage = []
+    for _ in range(count):
+        lines, pos = read_varint(data, pos)
+        hole_col, pos = read_varint(data, pos)
+        game.pending_garbage.append((lines, hole_col))
+
+    game.board = Board(rows, cols)
+    pos = unpack_cells(game.board, data, pos)
+    if pos != len(data):
+        raise ValueError("trailing data in snapshot")
+    return game
+
+
+def save(game: Game, path: Union[str, Path]) -> None:
+    """
+    ゲームの状態をファイルに保存する。書き込み途中で終了しても前のファイルが壊れないように、一時ファイルから置き換える。
+
+    Args:
+        game (Game): 保存するゲーム。
+        path (Union[str, Path]): 保存先のパス。
+    """
+    path = Path(path)
+    temp: Path = path.with_name(path.name + ".tmp")
+    temp.write_bytes(to_bytes(game))
+    temp.replace(path)
+
+
+def load(path: Union[str, Path]) -> Game:
+    """
+    ファイルに保存したゲームの状態を読み込む。
+
+    Args:
+        path (Union[str, Path]): 読み込むパス。
+
+    Returns:
+        Game: 保存したときと同じ状態のゲーム。
+    """
+    return from_bytes(Path(path).read_bytes())
+
+
+def main(args: List[str]) -> int:
+    """
+    スナップショットの内容を表示する (python snapshot.py FILE ...)。
+
+    Args:
+        args (List[str]): スナップショットのパスのリスト。
+
+    Returns:
+        int: 終了コード。
+    """
+    if not args:
+        print("usage: python snapshot.py FILE ...", file=sys.stderr)
+        return 2
+    for path in args:
+        game: Game = load(path)
+        print("{}: {} bytes, {}x{} board, tick {}, score {}, level {}, cleared {}".format(
+            path, Path(path).stat().st_size, game.cols, game.rows, game.tick,
+            game.record.score, game.record.level, game.record.cleared_row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
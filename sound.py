@@ -0,0 +1,130 @@
+# 効果音を鳴らすモジュール。
+# 起動時に全ての効果音をデコード済みのSoundとして用意しておき、Game.stepが返すイベントに合わせて、
+# 効果音ごとに予約したチャンネルで鳴らす。mixer.musicのようにファイルを読みながら再生しないので、
+# 鳴り始めるまでの遅延はミキサーのバッファの長さ (約12ミリ秒、1フレーム以内) だけになる。
+# 再生はSDLの音声スレッドで行われるので、playはすぐに戻り、ゲームループを止めない。
+import array
+import math
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pygame
+
+from assets import asset_path
+from engine import EVENT_MOVE, EVENT_ROTATE, EVENT_HOLD, EVENT_LOCK, EVENT_LINE_CLEAR, EVENT_GAME_OVER
+
+FREQUENCY: int = 44100  # サンプリング周波数 (Hz)
+BUFFER_SIZE: int = 512  # ミキサーのバッファのサンプル数 (小さいほど遅延が短い。512 / 44100 = 約12ミリ秒)
+GAME_OVER_SOUND_PATH: Path = asset_path(".fig", "bijokokaton.wav")  # ゲームオーバーの音 (こうかとん)
+# 効果音の名前と、鳴らすチャンネルの番号 (同じ効果音を続けて鳴らした場合は、前の音を止めて鳴らし直す)
+CHANNELS: Dict[str, int] = {"move": 0, "rotate": 1, "lock": 2, "line_clear": 3, "tetris": 3, "game_over": 4}
+# 合成する効果音: 名前 -> (開始周波数 (Hz), 終了周波数 (Hz), 長さ (ミリ秒), 音量)
+TONES: Dict[str, Tuple[float, float, int, float]] = {
+    "move": (660, 660, 25, 0.25),
+    "rotate": (880, 1175, 40, 0.25),
+    "lock": (220, 110, 60, 0.4),
+    "line_clear": (523, 1047, 180, 0.35),
+    "tetris": (392, 1568, 400, 0.45),
+}
+
+
+def pre_init() -> None:
+    """
+    ミキサーのバッファを小さくする。pygame.initより前に呼び出す。
+    """
+    pygame.mixer.pre_init(FREQUENCY, -16, 2, BUFFER_SIZE)
+
+
+def synthesize(start_hz: float, end_hz: float, duration_ms: int, volume: float) -> Optional[pygame.mixer.Sound]:
+    """
+    周波数を変えながら減衰する短い音を作る (ミキサーの形式に合わせた16ビットのPCM)。
+
+    Args:
+        start_hz (float): 開始時の周波数 (Hz)。
+        end_hz (float): 終了時の周波数 (Hz)。
+        duration_ms (int): 長さ (ミリ秒)。
+        volume (float): 音量 (0.0から1.0)。
+
+    Returns:
+        Optional[pygame.mixer.Sound]: 作った音。ミキサーが16ビットでない場合はNone。
+    """
+    frequency, size, channels = pygame.mixer.get_init()
+    if abs(size) != 16:
+        return None
+    n: int = frequency * duration_ms // 1000
+    samples = array.array("h")
+    phase: float = 0.0
+    for i in range(n):
+        t: float = i / n
+        phase += 2 * math.pi * (start_hz + (end_hz - start_hz) * t) / frequency
+        value: int = int(32767 * volume * (1 - t) ** 2 * math.sin(phase))
+        samples.extend([value] * channels)
+    return pygame.mixer.Sound(buffer=samples.tobytes())
+
+
+class SoundEffects:
+    """
+    効果音をまとめて管理するクラス。
+    音声デバイスがない場合などミキサーを使えないときは、何も鳴らさずに動く。
+    """
+    def __init__(self, enabled: bool = True) -> None:
+        """
+        SoundEffectsクラスの初期化。全ての効果音をここで用意する (ゲーム中には読み込まない)。
+
+        Args:
+            enabled (bool): Falseの場合は何も鳴らさない。
+        """
+        self.sounds: Dict[str, pygame.mixer.Sound] = {}
+        self.channels: List[pygame.mixer.Channel] = []
+        if not enabled:
+            return
+        try:
+            if pygame.mixer.get_init() is None:
+                pygame.mixer.init()
+        except pygame.error:  # 音声デバイスがない
+            return
+
+        n_channels: int = max(CHANNELS.values()) + 1
+        pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), n_channels))
+        pygame.mixer.set_reserved(n_channels)  # 他の音 (Sound.play) に使われないようにする
+        self.channels = [pygame.mixer.Channel(index) for index in range(n_channels)]
+        for name, tone in TONES.items():
+            sound: Optional[pygame.mixer.Sound] = synthesize(*tone)
+            if sound is not None:
+                self.sounds[name] = sound
+        try:
+            self.sounds["game_over"] = pygame.mixer.Sound(str(GAME_OVER_SOUND_PATH))
+        except (pygame.error, FileNotFoundError):
+            pass
+
+    def play(self, name: str) -> None:
+        """
+        効果音を、その効果音のチャンネルで鳴らす。
+
+        Args:
+            name (str): 効果音の名前。
+        """
+        sound: Optional[pygame.mixer.Sound] = self.sounds.get(name)
+        if sound is not None:
+            self.channels[CHANNELS[name]].play(sound)
+
+    def handle(self, events: List[Tuple[str, object]]) -> None:
+        """
+        Game.stepが返したイベントに対応する効果音を鳴らす。
+
+        Args:
+            events (List[Tuple[str, object]]): イベントのリスト。
+        """
+        if not self.sounds:
+            return
+        for name, value in events:
+            if name == EVENT_MOVE:
+                self.play("move")
+            elif name in (EVENT_ROTATE, EVENT_HOLD):
+                self.play("rotate")
+            elif name == EVENT_LOCK:
+                self.play("lock")
+            elif name == EVENT_LINE_CLEAR:
+                self.play("tetris" if len(value) >= 4 else "line_clear")
+            elif name == EVENT_GAME_OVER:
+                self.play("game_over")
@@ -0,0 +1,252 @@
+# ゲームの記録 (テレメトリ) を保存するモジュール (python kokaris.py --telemetry で有効)。
+# ゲームループはイベントをキューに入れるだけで、ファイルへの書き込みは別スレッドがまとめて行う。
+# キューがいっぱいのときはイベントを捨てる (数だけ数えておく) ので、書き込みが遅れてもゲームループは待たない。
+# 保存先は拡張子で決める: .jsonl / .ndjson なら1行1イベントのJSON、それ以外はSQLite。
+# ゲームオーバー時のスコア (ハイスコア) も同じファイルに保存する。
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from engine import (LOGIC_HZ, EVENT_HOLD, EVENT_LOCK, EVENT_LINE_CLEAR, EVENT_LEVEL_UP, EVENT_TSPIN, EVENT_GARBAGE,
+                    EVENT_GAME_OVER, Score)
+
+MAX_QUEUE: int = 10000  # キューに溜められるイベントの最大数 (超えた分は捨てる)
+BATCH_SIZE: int = 500  # まとめて書き込むイベントの最大数
+FLUSH_INTERVAL: float = 1.0  # イベントが少なくても書き込む間隔 (秒)
+JSON_SUFFIXES: Tuple[str, ...] = (".jsonl", ".ndjson")
+
+Record = Tuple[float, int, str, Dict]  # (時刻, tick, 種類, 内容)
+
+
+class _SqliteWriter:
+    """
+    イベントとスコアをSQLiteのファイルに書き込む。書き込みスレッドの中で作って使う。
+    """
+    def __init__(self, path: Path) -> None:
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS events"
+                                " (session TEXT, time REAL, tick INTEGER, kind TEXT, data TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS scores (session TEXT, time REAL, score INTEGER,"
+                                " level INTEGER, cleared_row INTEGER, tick INTEGER, cause TEXT)")
+        self.connection.commit()
+
+    def write(self, session: str, records: List[Record]) -> None:
+        self.connection.executemany(
+            "INSERT INTO events VALUES (?, ?, ?, ?, ?)",
+            [(session, t, tick, kind, json.dumps(data)) for t, tick, kind, data in records])
+        self.connection.executemany(
+            "INSERT INTO scores VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(session, t, data["score"], data["level"], data["cleared_row"], tick, data["cause"])
+             for t, tick, kind, data in records if kind == "score"])
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class _JsonWriter:
+    """
+    イベントとスコアを、1行1イベントのJSONとしてファイルの末尾に追加する (内容は "data" の中に入れる)。
+    """
+    def __init__(self, path: Path) -> None:
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, session: str, records: List[Record]) -> None:
+        lines: List[str] = []
+        for t, tick, kind, data in records:
+            item: Dict = {"session": session, "time": t, "tick": tick, "kind": kind, "data": data}
+            lines.append(json.dumps(item) + "\n")
+        self.file.write("".join(lines))
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class Telemetry:
+    """
+    ゲームのイベントを別スレッドでファイルに保存するクラス。
+    無効な場合は何もしないので、呼び出すコードを残したままでも遅くならない。
+    """
+    def __init__(self, path: Optional[Union[str, Path]] = None) -> None:
+        """
+        Telemetryクラスの初期化。有効な場合は書き込みスレッドを起動する。
+
+        Args:
+            path (Optional[Union[str, Path]]): 保存先のパス。Noneの場合は無効。
+        """
+        self.enabled: bool = path is not None
+        self.path: Optional[Path] = Path(path) if path is not None else None
+        self.session: str = uuid.uuid4().hex  # このゲームの記録を見分けるID
+        self.queue: "queue.Queue[Optional[Record]]" = queue.Queue(maxsize=MAX_QUEUE)
+        self.dropped: int = 0  # キューがいっぱいで捨てたイベントの数
+        self.error: Optional[BaseException] = None  # 書き込みスレッドで起きたエラー
+        self.thread: Optional[threading.Thread] = None
+        if self.enabled:
+            self.thread = threading.Thread(target=self.run, name="telemetry", daemon=True)
+            self.thread.start()
+
+    def publish(self, kind: str, tick: int = 0, **data) -> None:
+        """
+        イベントをキューに入れる。待たずにすぐ戻る (キューがいっぱいなら捨てる)。
+
+        Args:
+            kind (str): イベントの種類。
+            tick (int): ゲームのtick。
+            **data: イベントの内容 (JSONにできる値)。
+        """
+        if not self.enabled:
+            return
+        try:
+            self.queue.put_nowait((time.time(), tick, kind, data))
+        except queue.Full:
+            self.dropped += 1
+
+    def handle(self, events: List[Tuple[str, object]], tick: int) -> None:
+        """
+        Game.stepが返したイベントのうち、分析に使うものを記録する (移動や回転のように多いものは記録しない)。
+
+        Args:
+            events (List[Tuple[str, object]]): イベントのリスト。
+            tick (int): ゲームのtick。
+        """
+        if not self.enabled:
+            return
+        for name, value in events:
+            if name == EVENT_LOCK:
+                self.publish("lock", tick, block_type=value)
+            elif name == EVENT_LINE_CLEAR:
+                self.publish("line_clear", tick, count=len(value))
+            elif name == EVENT_LEVEL_UP:
+                self.publish("level_up", tick, level=value)
+            elif name == EVENT_HOLD:
+                self.publish("hold", tick, block_type=value)
+            elif name == EVENT_TSPIN:
+                self.publish("tspin", tick, tspin=value[0], count=value[1])
+            elif name == EVENT_GARBAGE:
+                self.publish("garbage", tick, lines=value)
+            elif name == EVENT_GAME_OVER:
+                self.publish("game_over", tick, cause=value)
+
+    def record_score(self, record: Score, tick: int, cause: str) -> None:
+        """
+        ゲームオーバー時のスコアを記録する (ハイスコアの表に入る)。
+
+        Args:
+            record (Score): スコア。
+            tick (int): ゲームオーバーになったtick。
+            cause (str): ゲームオーバーの原因。
+        """
+        self.publish("score", tick, score=record.score, level=record.level,
+                     cleared_row=record.cleared_row, cause=cause)
+
+    def run(self) -> None:
+        """
+        書き込みスレッドの処理。キューからイベントを取り出し、BATCH_SIZE個かFLUSH_INTERVAL秒ごとにまとめて書き込む。
+        """
+        try:
+            writer = _JsonWriter(self.path) if self.path.suffix in JSON_SUFFIXES else _SqliteWriter(self.path)
+        except (OSError, sqlite3.Error) as error:  # 書き込めない場所でも、ゲームは止めない
+            self.error = error
+            self.enabled = False
+            return
+        batch: List[Record] = []
+        deadline: float = time.monotonic() + FLUSH_INTERVAL
+        running: bool = True
+        while running:
+            try:
+                item: Optional[Record] = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if item is None:  # closeが入れた終了の印
+                    running = False
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            if batch and (not running or len(batch) >= BATCH_SIZE or time.monotonic() >= deadline):
+                try:
+                    writer.write(self.session, batch)
+                except (OSError, sqlite3.Error) as error:
+                    self.error = error
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + FLUSH_INTERVAL
+        writer.close()
+
+    def close(self, timeout: float = 2.0) -> None:
+        """
+        残っているイベントを書き込んで、書き込みスレッドを終える。
+
+        Args:
+            timeout (float): 書き込みを待つ最長時間 (秒)。
+        """
+        if self.thread is None:
+            return
+        if self.dropped:
+            self.publish("dropped", count=self.dropped)
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+        self.thread = None
+        self.enabled = False
+
+
+def high_scores(path: Union[str, Path], limit: int = 10) -> List[Dict]:
+    """
+    保存したスコアを、高い順に返す。
+
+    Args:
+        path (Union[str, Path]): 保存先のパス。
+        limit (int): 返す数。
+
+    Returns:
+        List[Dict]: スコアの辞書 (score, level, cleared_row, tick, cause, time) のリスト。
+    """
+    path = Path(path)
+    if path.suffix in JSON_SUFFIXES:
+        scores: List[Dict] = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                item: Dict = json.loads(line)
+                if item["kind"] == "score":
+                    scores.append(dict(item["data"], tick=item["tick"], time=item["time"]))
+        scores.sort(key=lambda item: item["score"], reverse=True)
+        return scores[:limit]
+    connection = sqlite3.connect(str(path))
+    try:
+        rows = connection.execute("SELECT score, level, cleared_row, tick, cause, time FROM scores"
+                                  " ORDER BY score DESC LIMIT ?", (limit,)).fetchall()
+    finally:
+        connection.close()
+    return [dict(zip(("score", "level", "cleared_row", "tick", "cause", "time"), row)) for row in rows]
+
+
+def main(args: List[str]) -> int:
+    """
+    保存したテレメトリのハイスコアを表示する (python telemetry.py FILE)。
+
+    Args:
+        args (List[str]): 保存先のパス。
+
+    Returns:
+        int: 終了コード。
+    """
+    if len(args) != 1:
+        print("usage: python telemetry.py FILE", file=sys.stderr)
+        return 2
+    for rank, item in enumerate(high_scores(args[0]), 1):
+        print("{:2d}. {:>12d}  level {:2d}  rows {:4d}  {:8.1f} s  {}  {}".format(
+            rank, item["score"], item["level"], item["cleared_row"], item["tick"] / LOGIC_HZ, item["cause"],
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(item["time"]))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
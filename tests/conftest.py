@@ -0,0 +1,5 @@
+# テストからリポジトリ直下のモジュール (engine.py など) をimportできるようにする
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
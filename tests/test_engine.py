@@ -0,0 +1,23 @@
+from typing import List
+
+import pytest
+
+from engine import GRAVITY_MS, ACTION_NONE, Game, gravity_ticks
+
+
+@pytest.mark.parametrize("level", range(len(GRAVITY_MS)))
+def test_ticks_per_row_matches_gravity(level: int) -> None:
+    """
+    何も操作しないとき、ブロックがgravity_ticks(level)回の更新ごとに1マス落ちることを確かめる。
+    """
+    game = Game(1)
+    game.record.level = level
+    changes: List[int] = []  # 行が変わったtick
+    row: int = game.block.row
+    while len(changes) < 4:
+        game.step(ACTION_NONE)
+        if game.block.row != row:
+            row = game.block.row
+            changes.append(game.tick)
+    assert changes[0] == gravity_ticks(level)  # 出現したtickから数える
+    assert [b - a for a, b in zip(changes, changes[1:])] == [gravity_ticks(level)] * 3
@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+from engine import ACTION_NONE, ACTION_DOWN, ACTION_HOLD, ACTION_LEFT, ACTION_RIGHT, ACTION_ROTATE_CW, Block, Game
+import snapshot
+
+BLOCK_FIELDS = ("block_type", "rotation", "row", "col", "count", "last_rotated", "last_kick")
+
+
+def block_state(block: Block):
+    return None if block is None else tuple(getattr(block, name) for name in BLOCK_FIELDS)
+
+
+def test_round_trip_keeps_held_block_state() -> None:
+    """
+    ホールドしたブロックの落下カウンターなども保存し、再開したゲームが元のゲームと同じように進むことを確かめる。
+    """
+    game = Game(3)
+    for _ in range(10):  # 落下カウンターが進んでからホールドする
+        game.step(ACTION_NONE)
+    game.step(ACTION_HOLD)
+    assert game.hold_block is not None and game.hold_block.count > 0
+
+    resumed: Game = snapshot.from_bytes(snapshot.to_bytes(game))
+    assert block_state(resumed.hold_block) == block_state(game.hold_block)
+    assert block_state(resumed.block) == block_state(game.block)
+
+    rng = random.Random(0)
+    for _ in range(2000):
+        action: int = rng.choice([ACTION_NONE] * 4 + [ACTION_DOWN, ACTION_LEFT, ACTION_RIGHT,
+                                                      ACTION_ROTATE_CW, ACTION_HOLD])
+        game.step(action)
+        resumed.step(action)
+        assert block_state(resumed.block) == block_state(game.block)
+        assert block_state(resumed.hold_block) == block_state(game.hold_block)
+        assert resumed.board.cells == game.board.cells
+        if game.game_over:
+            break
+    assert resumed.record.score == game.record.score
+
+
+def test_corrupt_snapshot_raises_value_error() -> None:
+    """
+    ブロックの種類や回転状態が壊れたスナップショットや、途中で切れたスナップショットはValueErrorになることを確かめる。
+    """
+    def corrupt(change) -> bytes:
+        game = Game(5)
+        game.step(ACTION_HOLD)
+        change(game)
+        return snapshot.to_bytes(game)
+
+    broken = [
+        corrupt(lambda game: setattr(game.block, "block_type", 9)),
+        corrupt(lambda game: setattr(game.hold_block, "block_type", 1)),
+        corrupt(lambda game: setattr(game.block, "rotation", 4)),
+        corrupt(lambda game: setattr(game, "next_block_type", 0)),
+        corrupt(lambda game: game.upcoming.append(12)),
+        snapshot.to_bytes(Game(5))[:-3],
+        b"KKS1" + snapshot.to_bytes(Game(5))[4:],
+    ]
+    for data in broken:
+        with pytest.raises(ValueError):
+            snapshot.from_bytes(data)